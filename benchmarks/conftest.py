@@ -0,0 +1,51 @@
+"""
+Fixtures for npm2rez benchmarks
+"""
+
+import itertools
+import os
+
+import pytest
+
+from benchmarks.fake_tools import install_fake_toolchain
+from benchmarks.synthetic import generate_tree, get_spec
+
+# Scenarios to benchmark, override with NPM2REZ_BENCH_SCENARIOS=small,medium,large
+BENCH_SCENARIOS = os.environ.get("NPM2REZ_BENCH_SCENARIOS", "small,medium").split(",")
+
+
+@pytest.fixture(scope="session")
+def synthetic_projects(tmp_path_factory):
+    """Generate each synthetic project once per session"""
+    projects = {}
+
+    def get(scenario):
+        if scenario not in projects:
+            project_dir = tmp_path_factory.mktemp(f"template-{scenario}")
+            stats = generate_tree(str(project_dir), get_spec(scenario))
+            projects[scenario] = (str(project_dir), stats)
+        return projects[scenario]
+    return get
+
+
+@pytest.fixture(params=BENCH_SCENARIOS)
+def fake_toolchain(request, synthetic_projects, tmp_path, monkeypatch):
+    """Put a fake npm and git serving a synthetic project first on PATH"""
+    template_dir, stats = synthetic_projects(request.param)
+    bin_dir = install_fake_toolchain(str(tmp_path / "fake-bin"), template_dir)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ.get("PATH", ""))
+    # Keep the npm2rez download index out of the user's cache
+    monkeypatch.setenv("NPM2REZ_CACHE_DIR", str(tmp_path / "cache"))
+    return {"scenario": request.param, "template_dir": template_dir, "stats": stats}
+
+
+@pytest.fixture
+def fresh_dirs(tmp_path):
+    """Return a function creating a new, empty install directory per round"""
+    counter = itertools.count()
+
+    def make():
+        path = tmp_path / "runs" / f"round-{next(counter)}" / "app" / "1.0.0"
+        path.mkdir(parents=True)
+        return str(path)
+    return make
@@ -0,0 +1,110 @@
+"""
+Fake npm and git executables for npm2rez benchmarks
+
+The executables put on PATH by install_fake_toolchain() run this module.
+``npm install`` hardlinks a pre-generated synthetic project into the
+working directory, so installs take next to no time and benchmarks measure
+npm2rez itself. ``git clone`` creates a small project depending on the
+synthetic tree.
+"""
+
+import json
+import os
+import shutil
+import sys
+
+
+def _clone_tree(src, dst):
+    """Recreate a directory tree with hardlinks, keeping symlinks"""
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            dst_path = os.path.join(dst, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dst_path)
+            elif entry.is_dir():
+                _clone_tree(entry.path, dst_path)
+            else:
+                try:
+                    os.link(entry.path, dst_path)
+                except OSError:
+                    shutil.copy2(entry.path, dst_path)
+
+
+def _root_dependencies(template_dir):
+    """Get the top level dependencies of the synthetic project"""
+    with open(os.path.join(template_dir, "package-lock.json"), encoding="utf-8") as f:
+        lockfile = json.load(f)
+    return lockfile["packages"][""]["dependencies"]
+
+
+def npm(template_dir, argv):
+    """Emulate the npm commands npm2rez runs"""
+    command = argv[0] if argv else ""
+    if command == "--version":
+        print("10.0.0-fake")
+    elif command in ("install", "ci", "i"):
+        _clone_tree(os.path.join(template_dir, "node_modules"), "node_modules")
+        shutil.copyfile(os.path.join(template_dir, "package-lock.json"), "package-lock.json")
+    elif command == "run" and argv[1:2] == ["build"]:
+        os.makedirs("dist", exist_ok=True)
+        with open(os.path.join("dist", "index.js"), "w", encoding="utf-8") as f:
+            f.write("module.exports = require('app');\n")
+    return 0
+
+
+def git(template_dir, argv):
+    """Emulate ``git clone`` of a project depending on the synthetic tree"""
+    if not argv or argv[0] != "clone":
+        return 0
+    dest = argv[-1]
+    os.makedirs(os.path.join(dest, ".git"), exist_ok=True)
+    os.makedirs(os.path.join(dest, "src"), exist_ok=True)
+    package_json = {
+        "name": "app-from-git",
+        "version": "1.0.0",
+        "main": "dist/index.js",
+        "dependencies": _root_dependencies(template_dir),
+        "devDependencies": {},
+    }
+    with open(os.path.join(dest, "package.json"), "w", encoding="utf-8") as f:
+        json.dump(package_json, f, indent=2)
+    with open(os.path.join(dest, "src", "index.js"), "w", encoding="utf-8") as f:
+        f.write("module.exports = require('app');\n")
+    return 0
+
+
+def install_fake_toolchain(bin_dir, template_dir):
+    """Write fake ``npm`` and ``git`` executables into a directory
+
+    Args:
+        bin_dir: Directory to put first on PATH
+        template_dir: Project generated by synthetic.generate_tree
+
+    Returns:
+        str: bin_dir
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.abspath(__file__)
+    for tool in ("npm", "git"):
+        if os.name == "nt":
+            with open(os.path.join(bin_dir, f"{tool}.cmd"), "w", encoding="utf-8") as f:
+                f.write(f'@echo off\n"{sys.executable}" "{script}" {tool} "{template_dir}" %*\n')
+        else:
+            path = os.path.join(bin_dir, tool)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" {tool} '
+                        f'"{template_dir}" "$@"\n')
+            os.chmod(path, 0o755)
+    return bin_dir
+
+
+def main(argv=None):
+    """Run a fake tool: ``fake_tools.py <npm|git> <template_dir> [args...]``"""
+    argv = sys.argv[1:] if argv is None else argv
+    tool, template_dir, rest = argv[0], argv[1], argv[2:]
+    return {"npm": npm, "git": git}[tool](template_dir, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
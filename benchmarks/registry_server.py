@@ -0,0 +1,282 @@
+"""
+Local npm registry stand-in for npm2rez benchmarks
+
+Serves packuments and tarballs from a fixture directory of ``.tgz`` files
+over the npm registry protocol, so both npm (``--registry``) and the
+native installer can run against it without internet access. Latency and
+bandwidth limits can be injected to model a remote registry or mirror.
+
+Fixture directories are plain directories of package tarballs, as written
+by ``npm pack`` or by generate_fixture().
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from benchmarks.synthetic import _file_size, get_spec
+
+# Bytes written per chunk when the bandwidth is limited
+CHUNK_SIZE = 16 * 1024
+
+
+def parse_bandwidth(text):
+    """Parse a bandwidth such as ``512K`` or ``10M`` into bytes per second"""
+    if text in (None, "", "0"):
+        return None
+    match = re.match(r"^(\d+(?:\.\d+)?)([KMG]?)$", str(text).strip().upper())
+    if not match:
+        raise ValueError(f"Invalid bandwidth: {text}")
+    factor = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2)]
+    return int(float(match.group(1)) * factor)
+
+
+def _read_manifest(path):
+    """Read package/package.json from a package tarball"""
+    with tarfile.open(path, "r:*") as tar:
+        for member in tar:
+            if member.name.split("/", 1)[-1] == "package.json" and member.name.count("/") == 1:
+                return json.load(tar.extractfile(member))
+    raise ValueError(f"No package.json in {path}")
+
+
+def load_fixture(fixture_dir):
+    """Index the tarballs of a fixture directory
+
+    Args:
+        fixture_dir: Directory containing ``.tgz`` package tarballs
+
+    Returns:
+        dict: Mapping of package name to {version: (tarball path, manifest)}
+    """
+    packages = {}
+    for root, _, files in os.walk(fixture_dir):
+        for name in sorted(files):
+            if name.endswith(".tgz"):
+                path = os.path.join(root, name)
+                manifest = _read_manifest(path)
+                packages.setdefault(manifest["name"], {})[manifest["version"]] = (path, manifest)
+    return packages
+
+
+def _tarball_name(name, version):
+    """Get the registry file name of a tarball (scope stripped)"""
+    return f"{name.split('/')[-1]}-{version}.tgz"
+
+
+def build_packuments(packages, base_url):
+    """Build the packuments and tarball routes of a fixture
+
+    Args:
+        packages: Result of load_fixture
+        base_url: Server URL without trailing slash
+
+    Returns:
+        tuple: (packuments by name, tarball paths by URL path)
+    """
+    packuments = {}
+    tarballs = {}
+    for name, versions in packages.items():
+        packument = {"name": name, "dist-tags": {}, "versions": {}}
+        for version, (path, manifest) in versions.items():
+            with open(path, "rb") as f:
+                data = f.read()
+            url_path = f"/{name}/-/{_tarball_name(name, version)}"
+            tarballs[url_path] = path
+            version_manifest = dict(manifest)
+            version_manifest["dist"] = {
+                "tarball": base_url + url_path,
+                "shasum": hashlib.sha1(data).hexdigest(),
+                "integrity": "sha512-" + base64.b64encode(hashlib.sha512(data).digest()).decode(),
+            }
+            packument["versions"][version] = version_manifest
+        latest = sorted(versions, key=lambda v: [int(p) for p in v.split("-")[0].split(".")])[-1]
+        packument["dist-tags"]["latest"] = latest
+        packuments[name] = packument
+    return packuments, tarballs
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """Serve packuments and tarballs, honoring the server's latency and bandwidth"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        path = unquote(self.path.split("?", 1)[0])
+        with server.stats_lock:
+            server.stats["requests"] += 1
+
+        if path in server.tarballs:
+            with open(server.tarballs[path], "rb") as f:
+                data = f.read()
+            content_type = "application/octet-stream"
+        elif path.lstrip("/") in server.packuments:
+            data = json.dumps(server.packuments[path.lstrip("/")]).encode("utf-8")
+            content_type = "application/json"
+        else:
+            data = b'{"error": "Not found"}'
+            self.send_response(404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self._write_throttled(data)
+        with server.stats_lock:
+            server.stats["bytes"] += len(data)
+
+    def _write_throttled(self, data):
+        """Write the response body at most at the server's bandwidth"""
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(data)
+            return
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(fixture_dir, host="127.0.0.1", port=0, latency=0.0, bandwidth=None):
+    """Create a registry server for a fixture directory
+
+    Args:
+        fixture_dir: Directory of package tarballs
+        host: Interface to listen on
+        port: Port, 0 for a free one
+        latency: Delay in seconds added to every request
+        bandwidth: Bytes per second per response, None for unlimited
+
+    Returns:
+        ThreadingHTTPServer: Server with ``url`` and ``stats`` attributes
+    """
+    server = ThreadingHTTPServer((host, port), RegistryHandler)
+    server.daemon_threads = True
+    server.url = f"http://{host}:{server.server_address[1]}"
+    server.latency = latency
+    server.bandwidth = bandwidth
+    server.stats = {"requests": 0, "bytes": 0}
+    server.stats_lock = threading.Lock()
+    server.packuments, server.tarballs = build_packuments(load_fixture(fixture_dir), server.url)
+    return server
+
+
+@contextmanager
+def running_registry(fixture_dir, **kwargs):
+    """Run a registry server in a background thread
+
+    Yields:
+        ThreadingHTTPServer: The running server
+    """
+    server = make_server(fixture_dir, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _add_bytes(tar, path, data, mode=0o644):
+    """Add an in-memory file to a tarball"""
+    info = tarfile.TarInfo(path)
+    info.size = len(data)
+    info.mode = mode
+    tar.addfile(info, io.BytesIO(data))
+
+
+def generate_fixture(fixture_dir, spec=None, dependencies=3):
+    """Write a fixture registry of synthetic package tarballs
+
+    Package ``pkg-N`` depends on up to ``dependencies`` packages with a
+    higher number through caret ranges, so converting the first packages
+    pulls in a realistic dependency tree.
+
+    Args:
+        fixture_dir: Directory to write tarballs to
+        spec: Tree spec from synthetic.get_spec
+        dependencies: Maximum dependencies per package
+
+    Returns:
+        list: Package names, in dependency order (roots first)
+    """
+    spec = spec or get_spec()
+    rng = random.Random(spec["seed"])
+    os.makedirs(fixture_dir, exist_ok=True)
+    names = [f"pkg-{index:05d}" for index in range(spec["packages"])]
+
+    for index, name in enumerate(names):
+        later = names[index + 1:]
+        deps = sorted(rng.sample(later, min(len(later), rng.randint(0, dependencies))))
+        manifest = {
+            "name": name,
+            "version": "1.0.0",
+            "main": "index.js",
+            "dependencies": dict.fromkeys(deps, "^1.0.0"),
+            "bin": {name: "bin/cli.js"},
+        }
+        path = os.path.join(fixture_dir, _tarball_name(name, "1.0.0"))
+        with tarfile.open(path, "w:gz") as tar:
+            _add_bytes(tar, "package/package.json", json.dumps(manifest, indent=2).encode())
+            _add_bytes(tar, "package/bin/cli.js", b"#!/usr/bin/env node\n", 0o755)
+            for file_index in range(spec["files"]):
+                size = _file_size(rng, spec)
+                data = rng.getrandbits(size * 8).to_bytes(size, "little")
+                _add_bytes(tar, f"package/lib/file{file_index}.js", data)
+            _add_bytes(tar, "package/index.js", b"module.exports = {};\n")
+    return names
+
+
+def main(argv=None):
+    """Serve a fixture directory: ``python -m benchmarks.registry_server FIXTURE_DIR``"""
+    parser = argparse.ArgumentParser(description="Local npm registry stand-in")
+    parser.add_argument("fixture_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4873)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds added to every request")
+    parser.add_argument("--bandwidth", default=None,
+                        help="Bytes per second per response, such as 512K or 10M")
+    parser.add_argument("--generate", type=int, default=None, metavar="N",
+                        help="Write N synthetic packages to the fixture directory first")
+    options = parser.parse_args(argv)
+
+    if options.generate:
+        generate_fixture(options.fixture_dir, get_spec(packages=options.generate))
+    server = make_server(options.fixture_dir, options.host, options.port, options.latency,
+                         parse_bandwidth(options.bandwidth))
+    print(f"Serving {len(server.packuments)} packages at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Synthetic node_modules trees for npm2rez benchmarks
+
+Trees are generated from a seed, so every run of a scenario produces the
+same packages, files and sizes. File sizes follow a log-normal distribution,
+which is close to what real node_modules trees look like: mostly small
+files with a long tail of large bundles.
+"""
+
+import argparse
+import json
+import os
+import random
+
+# Named tree sizes used by the benchmarks
+SCENARIOS = {
+    "small": {"packages": 40, "files": 15, "depth": 2},
+    "medium": {"packages": 300, "files": 30, "depth": 3},
+    "large": {"packages": 1500, "files": 40, "depth": 4},
+}
+
+DEFAULT_SPEC = {
+    "name": "app",
+    "version": "1.0.0",
+    # Number of packages, not counting the root package
+    "packages": 40,
+    # Files per package
+    "files": 15,
+    # Directory nesting inside a package
+    "depth": 2,
+    # Log-normal file size parameters, median of about 1.6 kB
+    "size_mu": 7.4,
+    "size_sigma": 1.3,
+    "max_file_size": 4 * 1024 * 1024,
+    # Share of packages that are scoped (@scope/name)
+    "scoped_ratio": 0.2,
+    # Share of packages that are installed nested below another package
+    "nested_ratio": 0.1,
+    # Share of packages that declare executables
+    "bin_ratio": 0.05,
+    "seed": 0,
+}
+
+
+def get_spec(scenario=None, **overrides):
+    """Build a tree spec from a scenario name and overrides
+
+    Args:
+        scenario: Name from SCENARIOS, None for the defaults
+        **overrides: Spec fields to override
+
+    Returns:
+        dict: Complete tree spec
+    """
+    spec = dict(DEFAULT_SPEC)
+    if scenario:
+        spec.update(SCENARIOS[scenario])
+    spec.update({key: value for key, value in overrides.items() if value is not None})
+    return spec
+
+
+def _package_names(rng, count, scoped_ratio):
+    """Generate unique package names"""
+    names = []
+    for index in range(count):
+        name = f"pkg-{index:05d}"
+        if rng.random() < scoped_ratio:
+            name = f"@scope-{index % 7}/{name}"
+        names.append(name)
+    return names
+
+
+def _write_file(path, size, rng):
+    """Write a file of the given size with reproducible content"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    block_size = min(size, 4096)
+    block = rng.getrandbits(block_size * 8).to_bytes(block_size, "little")
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = block[:remaining]
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def _file_size(rng, spec):
+    """Draw a file size from the log-normal distribution of the spec"""
+    size = int(rng.lognormvariate(spec["size_mu"], spec["size_sigma"]))
+    return max(1, min(size, spec["max_file_size"]))
+
+
+def generate_tree(project_dir, spec=None):
+    """Generate an installed npm project with a synthetic node_modules tree
+
+    The project gets a package.json depending on the root package, a
+    package-lock.json (v3) describing the tree and a node_modules
+    directory including ``.bin`` links, like ``npm install`` leaves it.
+
+    Args:
+        project_dir: Directory to create the project in
+        spec: Tree spec from get_spec
+
+    Returns:
+        dict: Statistics with packages, files and bytes
+    """
+    spec = spec or get_spec()
+    rng = random.Random(spec["seed"])
+    node_modules = os.path.join(project_dir, "node_modules")
+    os.makedirs(node_modules, exist_ok=True)
+
+    names = _package_names(rng, spec["packages"], spec["scoped_ratio"])
+    root = spec["name"]
+    locations = {root: f"node_modules/{root}"}
+    for index, name in enumerate(names):
+        parent = rng.choice(names[:index]) if index else None
+        if parent and locations[parent].count("node_modules") == 1 and \
+                rng.random() < spec["nested_ratio"]:
+            locations[name] = f"{locations[parent]}/node_modules/{name}"
+        else:
+            locations[name] = f"node_modules/{name}"
+
+    # Each package depends on a few of the packages after it, the root on the rest
+    dependencies = {name: [] for name in locations}
+    for index, name in enumerate(names):
+        for _ in range(rng.randint(0, 3)):
+            if index + 1 < len(names):
+                dependency = rng.choice(names[index + 1:])
+                if dependency not in dependencies[name]:
+                    dependencies[name].append(dependency)
+    dependencies[root] = list(names)
+
+    stats = {"packages": len(locations), "files": 0, "bytes": 0}
+    lock_packages = {"": {"name": "temp", "version": "1.0.0",
+                          "dependencies": {root: spec["version"]}}}
+    bin_dir = os.path.join(node_modules, ".bin")
+    os.makedirs(bin_dir, exist_ok=True)
+
+    for name, location in locations.items():
+        package_dir = os.path.join(project_dir, *location.split("/"))
+        version = spec["version"] if name == root else "1.0.0"
+        package_json = {
+            "name": name,
+            "version": version,
+            "main": "index.js",
+            "dependencies": dict.fromkeys(dependencies[name], "1.0.0"),
+        }
+        has_bin = name == root or rng.random() < spec["bin_ratio"]
+        if has_bin:
+            bin_name = name.split("/")[-1]
+            package_json["bin"] = {bin_name: f"bin/{bin_name}"}
+
+        for index in range(spec["files"]):
+            if index == 0:
+                parts = ["index.js"]
+            else:
+                depth = rng.randint(0, spec["depth"])
+                parts = [f"dir{rng.randint(0, 3)}" for _ in range(depth)] + [f"file{index}.js"]
+            size = _file_size(rng, spec)
+            _write_file(os.path.join(package_dir, *parts), size, rng)
+            stats["bytes"] += size
+        # package.json
+        stats["files"] += spec["files"] + 1
+
+        if has_bin:
+            bin_path = os.path.join(package_dir, "bin", bin_name)
+            _write_file(bin_path, 64, rng)
+            os.chmod(bin_path, 0o755)
+            # npm only links executables of top level packages
+            if location == f"node_modules/{name}":
+                link = os.path.join(bin_dir, bin_name)
+                target = os.path.relpath(bin_path, bin_dir)
+                try:
+                    os.symlink(target, link)
+                except (OSError, NotImplementedError):
+                    _write_file(link, 64, rng)
+
+        with open(os.path.join(package_dir, "package.json"), "w", encoding="utf-8") as f:
+            json.dump(package_json, f, indent=2)
+
+        lock_packages[location] = {
+            "version": version,
+            "resolved": f"https://registry.npmjs.org/{name}/-/{name.split('/')[-1]}-{version}.tgz",
+            "dependencies": package_json["dependencies"],
+        }
+        if has_bin:
+            lock_packages[location]["bin"] = package_json["bin"]
+
+    lockfile = {"name": "temp", "lockfileVersion": 3, "requires": True,
+                "packages": lock_packages}
+    with open(os.path.join(project_dir, "package-lock.json"), "w", encoding="utf-8") as f:
+        json.dump(lockfile, f, indent=2)
+    return stats
+
+
+def main(argv=None):
+    """Generate a synthetic project from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("project_dir")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS))
+    for field in ("packages", "files", "depth", "seed"):
+        parser.add_argument(f"--{field}", type=int)
+    for field in ("scoped_ratio", "nested_ratio", "bin_ratio", "size_mu", "size_sigma"):
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, type=float)
+    options = vars(parser.parse_args(argv))
+    project_dir = options.pop("project_dir")
+    scenario = options.pop("scenario")
+    stats = generate_tree(project_dir, get_spec(scenario, **options))
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
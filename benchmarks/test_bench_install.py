@@ -0,0 +1,72 @@
+"""
+End-to-end benchmarks of the npm2rez install paths
+
+Run with ``uvx nox -s benchmark`` or
+``pytest benchmarks --benchmark-only``. npm and git are replaced by fake
+executables that materialize a synthetic tree instantly, so the timings
+only cover npm2rez itself: staging, copying and shim generation.
+"""
+
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+from npm2rez.core import create_bin_files, get_npm_executable, install_from_github, install_from_npm
+
+ROUNDS = int(os.environ.get("NPM2REZ_BENCH_ROUNDS", "5"))
+
+
+def _args(**fields):
+    """Build install arguments for the synthetic root package"""
+    args = SimpleNamespace(name="app", version="1.0.0", source="npm", repo=None,
+                           node_version="16", _is_test=False)
+    for key, value in fields.items():
+        setattr(args, key, value)
+    return args
+
+
+def test_bench_install_from_npm(benchmark, fake_toolchain, fresh_dirs):
+    """Benchmark install_from_npm: npm install, move into place, shims"""
+    npm = get_npm_executable()
+    assert npm and os.path.dirname(npm) in os.environ["PATH"].split(os.pathsep)[0]
+    benchmark.extra_info.update(fake_toolchain["stats"])
+
+    def setup():
+        return (npm, _args(), fresh_dirs()), {}
+
+    with mock.patch("builtins.print"):
+        result = benchmark.pedantic(install_from_npm, setup=setup, rounds=ROUNDS)
+    assert result is True
+
+
+def test_bench_install_from_github(benchmark, fake_toolchain, fresh_dirs):
+    """Benchmark install_from_github: clone, install, build, runtime closure copy"""
+    npm = get_npm_executable()
+    benchmark.extra_info.update(fake_toolchain["stats"])
+
+    def setup():
+        return (npm, _args(source="github", repo="example/app"), fresh_dirs()), {}
+
+    with mock.patch("builtins.print"):
+        result = benchmark.pedantic(install_from_github, setup=setup, rounds=ROUNDS)
+    assert result is True
+
+
+def test_bench_create_bin_files(benchmark, tmp_path):
+    """Benchmark create_bin_files for a package with many executables"""
+    bin_files = [f"tool-{index}" for index in range(500)]
+    counter = iter(range(1000000))
+
+    def setup():
+        return (_args(), str(tmp_path / f"bin-{next(counter)}"), "app", bin_files), {}
+
+    benchmark.pedantic(create_bin_files, setup=setup, rounds=ROUNDS)
+
+
+def test_bench_create_bin_files_unchanged(benchmark, tmp_path):
+    """Benchmark create_bin_files rerun over identical shims"""
+    bin_files = [f"tool-{index}" for index in range(500)]
+    bin_dir = str(tmp_path / "bin")
+    create_bin_files(_args(), bin_dir, "app", bin_files)
+
+    benchmark(create_bin_files, _args(), bin_dir, "app", bin_files)
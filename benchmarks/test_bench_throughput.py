@@ -0,0 +1,43 @@
+"""
+End-to-end throughput benchmarks against the local registry stand-in
+
+Real ``npm2rez create`` processes convert synthetic packages served by
+benchmarks.registry_server, once per installer and concurrency level.
+Raise NPM2REZ_BENCH_CONVERT for steadier numbers.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from benchmarks.registry_server import generate_fixture
+from benchmarks.synthetic import get_spec
+from benchmarks.throughput import run_throughput
+
+CONVERT = int(os.environ.get("NPM2REZ_BENCH_CONVERT", "4"))
+
+
+@pytest.fixture(scope="module")
+def fixture_registry(tmp_path_factory):
+    """Write a synthetic fixture registry once per module"""
+    fixture_dir = str(tmp_path_factory.mktemp("registry"))
+    names = generate_fixture(fixture_dir, get_spec(packages=20, files=5))
+    return fixture_dir, names[:CONVERT]
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("installer", ["native", "npm"])
+def test_bench_create_throughput(benchmark, fixture_registry, tmp_path, installer, concurrency):
+    """Benchmark cold ``npm2rez create`` runs against the local registry"""
+    if installer == "npm" and not shutil.which("npm"):
+        pytest.skip("npm is not installed")
+    fixture_dir, names = fixture_registry
+
+    results = benchmark.pedantic(
+        run_throughput, args=(fixture_dir, names, [concurrency], str(tmp_path)),
+        kwargs={"installer": installer}, rounds=1,
+    )
+    (result,) = results
+    benchmark.extra_info.update(result)
+    assert result["failed"] == 0
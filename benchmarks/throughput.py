@@ -0,0 +1,201 @@
+"""
+End-to-end throughput harness for npm2rez
+
+Runs real ``npm2rez create`` or ``extract`` processes against the local
+registry stand-in (benchmarks.registry_server) at several concurrency
+levels and reports packages per minute. Every level starts with empty
+output, npm2rez and npm caches, so it measures cold conversions, and the
+registry can be slowed down to model a remote registry or mirror.
+
+Example::
+
+    python -m benchmarks.throughput --packages 40 --convert 16 \\
+        --concurrency 1,4,8 --installer npm --latency 0.02 --bandwidth 5M
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.registry_server import generate_fixture, parse_bandwidth, running_registry
+from benchmarks.synthetic import get_spec
+
+
+def _run_one(command, name, version, registry_url, level_dir, installer):
+    """Run one npm2rez process and return its duration and success"""
+    report_path = os.path.join(level_dir, "reports", f"{name.replace('/', '_')}.json")
+    output = os.path.join(level_dir, "output")
+    if command == "extract":
+        output = os.path.join(output, name)
+    cmd = [
+        sys.executable, "-m", "npm2rez", command,
+        "--name", name, "--version", version,
+        "--output", output,
+        "--installer", installer,
+        "--registry", registry_url,
+        "--cache-dir", os.path.join(level_dir, "cache"),
+        "--report", report_path,
+    ]
+    env = dict(os.environ)
+    env.update({
+        # Keep npm's cache cold and its network chatter off
+        "npm_config_cache": os.path.join(level_dir, "npm-cache"),
+        "npm_config_audit": "false",
+        "npm_config_fund": "false",
+        "npm_config_update_notifier": "false",
+    })
+
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=False)
+    duration = time.perf_counter() - start
+    try:
+        with open(report_path, encoding="utf-8") as f:
+            success = bool(json.load(f).get("success"))
+    except (OSError, ValueError):
+        success = False
+    return duration, success
+
+
+def run_level(server, names, concurrency, work_dir, command="create", installer="npm",
+              version="1.0.0"):
+    """Convert packages with a number of concurrent npm2rez processes
+
+    Args:
+        server: Running registry server from running_registry
+        names: Package names to convert
+        concurrency: Number of concurrent processes
+        work_dir: Directory for outputs and caches of this level
+        command: ``create`` or ``extract``
+        installer: ``npm`` or ``native``
+        version: Version of every package to convert
+
+    Returns:
+        dict: Throughput, latency and registry traffic of the level
+    """
+    os.makedirs(os.path.join(work_dir, "reports"), exist_ok=True)
+    requests_before = server.stats["requests"]
+    bytes_before = server.stats["bytes"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda name: _run_one(command, name, version, server.url, work_dir, installer),
+            names,
+        ))
+    wall = time.perf_counter() - start
+
+    durations = [duration for duration, _ in results]
+    succeeded = sum(1 for _, success in results if success)
+    return {
+        "command": command,
+        "installer": installer,
+        "concurrency": concurrency,
+        "packages": len(names),
+        "succeeded": succeeded,
+        "failed": len(names) - succeeded,
+        "wall": round(wall, 3),
+        "packages_per_minute": round(succeeded / wall * 60, 1) if wall else 0.0,
+        "latency_median": round(statistics.median(durations), 3) if durations else 0.0,
+        "latency_max": round(max(durations), 3) if durations else 0.0,
+        "requests": server.stats["requests"] - requests_before,
+        "bytes": server.stats["bytes"] - bytes_before,
+    }
+
+
+def run_throughput(fixture_dir, names, concurrency_levels, work_dir, command="create",
+                   installer="npm", latency=0.0, bandwidth=None):
+    """Measure throughput at each concurrency level against a local registry
+
+    Args:
+        fixture_dir: Directory of package tarballs to serve
+        names: Package names to convert at every level
+        concurrency_levels: Iterable of process counts
+        work_dir: Scratch directory, one subdirectory per level
+        command: ``create`` or ``extract``
+        installer: ``npm`` or ``native``
+        latency: Delay in seconds added to every registry request
+        bandwidth: Bytes per second per registry response, None for unlimited
+
+    Returns:
+        list: Result of run_level for every concurrency level
+    """
+    results = []
+    with running_registry(fixture_dir, latency=latency, bandwidth=bandwidth) as server:
+        for concurrency in concurrency_levels:
+            level_dir = os.path.join(work_dir, f"c{concurrency}")
+            shutil.rmtree(level_dir, ignore_errors=True)
+            result = run_level(server, names, concurrency, level_dir, command, installer)
+            result.update(latency=latency, bandwidth=bandwidth)
+            results.append(result)
+            print(f"concurrency {concurrency:>3}: {result['packages_per_minute']:>8.1f} "
+                  f"packages/min, {result['succeeded']}/{result['packages']} succeeded, "
+                  f"median {result['latency_median']:.2f}s, "
+                  f"{result['requests']} requests, {result['bytes']} bytes")
+    return results
+
+
+def main(argv=None):
+    """Run the throughput harness from the command line"""
+    parser = argparse.ArgumentParser(description="npm2rez end-to-end throughput harness")
+    parser.add_argument("--fixture-dir", default=None,
+                        help="Directory of package tarballs (default: generate synthetic ones)")
+    parser.add_argument("--packages", type=int, default=40,
+                        help="Synthetic packages to generate into the fixture")
+    parser.add_argument("--files", type=int, default=None,
+                        help="Files per synthetic package")
+    parser.add_argument("--convert", default="8",
+                        help="Number of packages to convert, or comma separated names")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="Comma separated concurrency levels")
+    parser.add_argument("--command", default="create", choices=["create", "extract"])
+    parser.add_argument("--installer", default="npm", choices=["npm", "native"])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds added to every registry request")
+    parser.add_argument("--bandwidth", default=None,
+                        help="Bytes per second per registry response, such as 512K or 10M")
+    parser.add_argument("--work-dir", default=None,
+                        help="Scratch directory (default: a temporary directory)")
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="Write the results to this JSON file")
+    options = parser.parse_args(argv)
+
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix="npm2rez-throughput-")
+    fixture_dir = options.fixture_dir
+    generated = []
+    if not fixture_dir:
+        fixture_dir = os.path.join(work_dir, "fixture")
+        spec = get_spec(packages=options.packages, files=options.files)
+        generated = generate_fixture(fixture_dir, spec)
+
+    if options.convert.isdigit():
+        if not generated:
+            parser.error("--convert must list package names with --fixture-dir")
+        names = generated[:int(options.convert)]
+    else:
+        names = [name.strip() for name in options.convert.split(",") if name.strip()]
+
+    results = run_throughput(
+        fixture_dir, names,
+        [int(level) for level in options.concurrency.split(",")],
+        work_dir, options.command, options.installer,
+        options.latency, parse_bandwidth(options.bandwidth),
+    )
+    if options.json_path:
+        with open(options.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if not options.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0 if all(result["failed"] == 0 for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -37,3 +37,18 @@ def pytest_real_packages(session: nox.Session) -> None:
             "RUN_REAL_PACKAGE_TESTS": "1"
         }
     )
+
+
+def benchmark(session: nox.Session) -> None:
+    """Run benchmarks against synthetic node_modules trees with a fake npm."""
+    session.install(".")
+    session.install("pytest", "pytest-benchmark")
+    session.run(
+        "pytest",
+        os.path.join(THIS_ROOT, "benchmarks"),
+        f"--rootdir={THIS_ROOT}",
+        "--benchmark-only",
+        "--benchmark-autosave",
+        *session.posargs,
+        env={"PYTHONPATH": THIS_ROOT.as_posix()}
+    )
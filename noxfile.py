@@ -18,3 +18,4 @@ nox.session(lint.lint, name="lint")
 nox.session(lint.lint_fix, name="lint-fix")
 nox.session(codetest.pytest, name="pytest")
 nox.session(codetest.pytest_real_packages, name="pytest-real-packages")
+nox.session(codetest.benchmark, name="benchmark")
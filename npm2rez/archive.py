@@ -0,0 +1,112 @@
+"""
+Archive payloads for npm2rez - ship node_modules as a single file
+
+Network filesystems are slow at creating and syncing many small files. In
+archive mode the ``node_modules`` and ``bin`` directories of a rez package
+are packed into one tarball with a deterministic member order and
+normalized metadata, and the package.py unpacks it into a local cache the
+first time the package is used.
+"""
+
+import gzip
+import lzma
+import os
+import shutil
+import tarfile
+from contextlib import nullcontext
+
+from npm2rez.stamp import hash_file
+
+# Payload modes and the archive file each one writes
+PAYLOAD_ARCHIVES = {
+    "tar": "payload.tar",
+    "tar.gz": "payload.tar.gz",
+    "tar.xz": "payload.tar.xz",
+}
+
+# Directories of a package version that make up the payload
+PAYLOAD_DIRS = ("bin", "node_modules")
+
+
+def get_payload_mode(args):
+    """Get the payload mode of a build, ``dir`` or one of PAYLOAD_ARCHIVES"""
+    return getattr(args, "payload", None) or "dir"
+
+
+def _compressor(raw, mode):
+    """Wrap an archive file in its compressor, without timestamps in headers"""
+    if mode == "tar.gz":
+        return gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+    if mode == "tar.xz":
+        return lzma.LZMAFile(raw, "wb")
+    return nullcontext(raw)
+
+
+def _normalize(info, mtime):
+    """Strip machine specific metadata from a tar member"""
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    info.mtime = mtime
+    if info.isdir() or info.mode & 0o111:
+        info.mode = 0o755
+    else:
+        info.mode = 0o644
+    return info
+
+
+def _iter_payload(package_dir):
+    """Yield payload paths relative to the package directory, in sorted order"""
+    def walk(path):
+        yield path
+        full_path = os.path.join(package_dir, path)
+        if os.path.isdir(full_path) and not os.path.islink(full_path):
+            for name in sorted(os.listdir(full_path)):
+                yield from walk(os.path.join(path, name))
+
+    for top in PAYLOAD_DIRS:
+        if os.path.lexists(os.path.join(package_dir, top)):
+            yield from walk(top)
+
+
+def write_archive(package_dir, mode):
+    """Pack the payload of a package version into one archive
+
+    The same payload always produces the same archive bytes. The packed
+    directories are removed afterwards.
+
+    Args:
+        package_dir: Package version directory
+        mode: Payload mode, one of PAYLOAD_ARCHIVES
+
+    Returns:
+        tuple: (archive file name, sha256 hex digest of the archive)
+    """
+    archive_name = PAYLOAD_ARCHIVES[mode]
+    archive_path = os.path.join(package_dir, archive_name)
+    temp_path = archive_path + ".tmp"
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+
+    with open(temp_path, "wb") as raw, _compressor(raw, mode) as stream:
+        with tarfile.open(fileobj=stream, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for path in _iter_payload(package_dir):
+                full_path = os.path.join(package_dir, path)
+                info = _normalize(tar.gettarinfo(full_path, path.replace(os.sep, "/")), mtime)
+                if info.isreg():
+                    with open(full_path, "rb") as f:
+                        tar.addfile(info, f)
+                else:
+                    tar.addfile(info)
+
+    remove_archives(package_dir)
+    os.replace(temp_path, archive_path)
+    for top in PAYLOAD_DIRS:
+        shutil.rmtree(os.path.join(package_dir, top), ignore_errors=True)
+    return archive_name, hash_file(archive_path)
+
+
+def remove_archives(package_dir):
+    """Remove payload archives left by a previous build"""
+    for archive_name in PAYLOAD_ARCHIVES.values():
+        archive_path = os.path.join(package_dir, archive_name)
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
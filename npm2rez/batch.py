@@ -0,0 +1,392 @@
+"""
+Batch conversion for npm2rez - build many rez packages from a manifest
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+from npm2rez.core import (
+    create_package,
+    create_package_py,
+    finish_payload,
+    get_npm_executable,
+    get_package_dir,
+    install_many_from_npm,
+    publish_package,
+)
+from npm2rez.locking import make_build_dir, package_lock, remove_build_dir
+from npm2rez.metadata import resolve_version
+from npm2rez.pipeline import build_pipelined
+from npm2rez.stamp import get_fingerprint, is_up_to_date, write_stamp
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+ENTRY_FIELDS = ("name", "version", "source", "repo", "node_version")
+
+
+def parse_entry_spec(spec):
+    """Parse a plain manifest line
+
+    Args:
+        spec: Entry in the form ``name@version[,source,repo,node_version]``
+
+    Returns:
+        dict: Manifest entry
+    """
+    fields = [field.strip() for field in spec.split(",")]
+    package = fields[0]
+
+    # Scoped packages start with "@", so split on the last one
+    name, sep, version = package.rpartition("@")
+    if not sep or not name or not version:
+        raise ValueError(f"Invalid manifest entry (expected name@version): {spec}")
+
+    entry = {"name": name, "version": version}
+    for key, value in zip(ENTRY_FIELDS[2:], fields[1:]):
+        if value:
+            entry[key] = value
+    return entry
+
+
+def _normalize_entry(entry):
+    """Normalize a manifest entry loaded from JSON or TOML"""
+    if isinstance(entry, str):
+        return parse_entry_spec(entry)
+
+    if not isinstance(entry, dict):
+        raise ValueError(f"Invalid manifest entry: {entry!r}")
+
+    if "name" not in entry or "version" not in entry:
+        raise ValueError(f"Manifest entry requires name and version: {entry!r}")
+
+    normalized = {key: entry[key] for key in ENTRY_FIELDS if entry.get(key)}
+    normalized["version"] = str(normalized["version"])
+    node_version = normalized.get("node_version")
+    if isinstance(node_version, list):
+        # Several Node.js versions are built as variants
+        normalized["node_version"] = ",".join(str(version) for version in node_version)
+    elif node_version is not None:
+        normalized["node_version"] = str(node_version)
+    return normalized
+
+
+def _entries_from_document(data):
+    """Extract entries from a parsed JSON or TOML document"""
+    if isinstance(data, dict):
+        data = data.get("packages", data.get("package", []))
+    return [_normalize_entry(entry) for entry in data]
+
+
+def load_manifest(path):
+    """Load batch manifest
+
+    Supported formats are chosen by file extension:
+        .json: list of entries, or an object with a ``packages`` list
+        .toml: ``[[package]]`` tables, or a top level ``packages`` list
+        anything else: one ``name@version[,source,repo,node_version]`` per line
+
+    Args:
+        path: Path to manifest file
+
+    Returns:
+        list: Manifest entries as dicts
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            return _entries_from_document(json.load(f))
+
+    if ext == ".toml":
+        if tomllib is None:
+            raise RuntimeError("Reading TOML manifests requires tomli on Python < 3.11")
+        with open(path, "rb") as f:
+            return _entries_from_document(tomllib.load(f))
+
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                entries.append(parse_entry_spec(line))
+    return entries
+
+
+def _entry_args(entry, output, node_version, npm, options):
+    """Build the create_package arguments of a manifest entry"""
+    args = SimpleNamespace(
+        name=entry["name"],
+        version=entry["version"],
+        source=entry.get("source", "npm"),
+        repo=entry.get("repo"),
+        output=output,
+        node_version=entry.get("node_version", node_version),
+        npm=npm,
+        _is_test=False
+    )
+    for key, value in (options or {}).items():
+        setattr(args, key, value)
+    return args
+
+
+def _new_result(args):
+    """Create an empty result for a manifest entry"""
+    return {
+        "name": args.name,
+        "version": args.version,
+        "success": False,
+        "package_dir": None,
+        "error": None,
+    }
+
+
+def resolve_entries(entries, output, node_version="16", npm=None, options=None, jobs=None):
+    """Resolve the version ranges and dist-tags of manifest entries
+
+    Packuments are fetched concurrently through the metadata cache, entries
+    with exact versions are returned as they are.
+
+    Args:
+        entries: Manifest entries
+        output: Output directory for rez packages
+        node_version: Default Node.js version when an entry has none
+        npm: Path to an already probed npm executable
+        options: Extra attributes shared by every entry, such as ``registry``
+        jobs: Number of concurrent packument requests
+
+    Returns:
+        tuple: (entries with exact versions, results of the entries that
+            could not be resolved)
+    """
+    def resolve(entry):
+        args = _entry_args(entry, output, node_version, npm, options)
+        try:
+            return dict(entry, version=resolve_version(args)), None
+        except Exception as e:
+            result = _new_result(args)
+            result["error"] = str(e)
+            result["duration"] = 0.0
+            return None, result
+
+    with ThreadPoolExecutor(max_workers=jobs or 16) as executor:
+        outcomes = list(executor.map(resolve, entries))
+    resolved = [entry for entry, _ in outcomes if entry is not None]
+    failed = [result for _, result in outcomes if result is not None]
+    return resolved, failed
+
+
+def build_entry(entry, output, node_version="16", npm=None, options=None):
+    """Build a single manifest entry
+
+    This runs inside a worker process, so it never raises and always
+    returns a picklable result.
+
+    Args:
+        entry: Manifest entry
+        output: Output directory for rez packages
+        node_version: Default Node.js version when the entry has none
+        npm: Path to an already probed npm executable
+        options: Extra attributes shared by every entry, such as ``cache_dir``
+
+    Returns:
+        dict: Result with name, version, success, package_dir, error and duration
+    """
+    args = _entry_args(entry, output, node_version, npm, options)
+    result = _new_result(args)
+    start = time.time()
+    try:
+        if args.source == "github" and not args.repo:
+            raise ValueError("When using github source, repo is required")
+        result["package_dir"] = create_package(args)
+        result["success"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    result["duration"] = time.time() - start
+    return result
+
+
+def build_combined(entries, output, node_version="16", npm=None, options=None):
+    """Build npm manifest entries with one combined npm install
+
+    Args:
+        entries: Manifest entries, all with the npm source
+        output: Output directory for rez packages
+        node_version: Default Node.js version when an entry has none
+        npm: Path to an already probed npm executable
+        options: Extra attributes shared by every entry, such as ``cache_dir``
+
+    Returns:
+        list: Results in the same order as entries
+    """
+    start = time.time()
+    args_list = [_entry_args(entry, output, node_version, npm, options) for entry in entries]
+    results = [_new_result(args) for args in args_list]
+    package_dirs = [get_package_dir(args) for args in args_list]
+
+    def fail(index, error):
+        results[index]["success"] = False
+        results[index]["package_dir"] = None
+        results[index]["error"] = error
+
+    with ExitStack() as stack:
+        # Lock in a stable order so concurrent batches cannot deadlock
+        lock_errors = {}
+        for package_dir in sorted(set(package_dirs)):
+            try:
+                stack.enter_context(package_lock(package_dir))
+            except Exception as e:
+                lock_errors[package_dir] = str(e)
+
+        pending = []
+        build_dirs = {}
+        for index, (args, package_dir) in enumerate(zip(args_list, package_dirs)):
+            results[index]["package_dir"] = package_dir
+            if package_dir in lock_errors:
+                fail(index, lock_errors[package_dir])
+                continue
+            # One bad entry fails on its own, the others are still built
+            try:
+                if not getattr(args, "force", False) and \
+                        is_up_to_date(package_dir, get_fingerprint(args)):
+                    print(f"{package_dir} is up to date")
+                    results[index]["success"] = True
+                    continue
+                # Packages are built in a private directory and published once complete
+                build_dir = make_build_dir(package_dir, getattr(args, "staging_dir", None))
+                stack.callback(remove_build_dir, build_dir)
+                build_dirs[index] = build_dir
+                create_package_py(args, build_dir)
+                os.makedirs(os.path.join(build_dir, "node_modules"), exist_ok=True)
+                pending.append(index)
+            except Exception as e:
+                fail(index, str(e))
+
+        installed = [False] * len(pending)
+        install_error = None if npm else "npm command not found"
+        if npm and pending:
+            try:
+                installed = install_many_from_npm(
+                    npm, [args_list[i] for i in pending], [build_dirs[i] for i in pending]
+                )
+            except Exception as e:
+                install_error = str(e)
+
+        for index, success in zip(pending, installed):
+            args = args_list[index]
+            if not success:
+                fail(index, install_error or f"Failed to install {args.name}@{args.version}")
+                continue
+            try:
+                finish_payload(args, build_dirs[index])
+                write_stamp(build_dirs[index], args)
+                publish_package(build_dirs[index], package_dirs[index])
+                results[index]["success"] = True
+            except Exception as e:
+                fail(index, str(e))
+
+    duration = time.time() - start
+    for result in results:
+        result["duration"] = duration
+    return results
+
+
+def run_batch(entries, output, jobs=None, node_version="16", options=None,
+              combined=False, on_result=None, executor="process"):
+    """Build every manifest entry, in parallel across worker processes
+
+    Failed entries do not stop the batch.
+
+    Args:
+        entries: Manifest entries
+        output: Output directory for rez packages
+        jobs: Number of worker processes (defaults to the CPU count)
+        node_version: Default Node.js version for entries without one
+        options: Extra attributes shared by every entry, such as ``cache_dir``
+        combined: Install all npm entries with a single npm install, except
+            those built with the native installer or a lockfile
+        on_result: Optional callback invoked with each result as it completes
+        executor: ``process`` to build every entry in its own worker process,
+            ``pipeline`` to overlap the fetch, copy, shims and finish stages of
+            entries in one process
+
+    Returns:
+        dict: Summary with total, succeeded, failed, duration and results
+    """
+    jobs = jobs or os.cpu_count() or 1
+    start = time.time()
+
+    # Probe npm once for the whole batch instead of once per package
+    npm = get_npm_executable()
+
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    # Entries that fail to resolve keep their spec, resolved ones their manifest index
+    order = {(entry["name"], entry["version"]): i for i, entry in enumerate(entries)}
+
+    # Resolve version ranges and dist-tags once, before anything is built
+    entries, failed = resolve_entries(
+        [dict(entry, index=i) for i, entry in enumerate(entries)],
+        output, node_version, npm, options
+    )
+    order.update({(entry["name"], entry["version"]): entry["index"] for entry in entries})
+    for result in failed:
+        collect(result)
+
+    pending = entries
+    if combined:
+        # Variant builds install each Node.js version on their own, and the
+        # native installer and lockfiles do not go through npm install
+        def is_combinable(entry):
+            args = _entry_args(entry, output, node_version, npm, options)
+            return args.source == "npm" and "," not in str(args.node_version) and \
+                getattr(args, "installer", "npm") != "native" and \
+                not getattr(args, "lockfile", None)
+
+        npm_entries = [entry for entry in entries if is_combinable(entry)]
+        pending = [entry for entry in entries if not is_combinable(entry)]
+        if npm_entries:
+            for result in build_combined(npm_entries, output, node_version, npm, options):
+                collect(result)
+
+    if executor == "pipeline":
+        args_list = [_entry_args(entry, output, node_version, npm, options) for entry in pending]
+        build_pipelined(args_list, jobs, on_result=collect)
+    elif jobs == 1 or len(pending) <= 1:
+        for entry in pending:
+            collect(build_entry(entry, output, node_version, npm, options))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(build_entry, entry, output, node_version, npm, options)
+                for entry in pending
+            ]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    # Report results in manifest order
+    results.sort(key=lambda r: order.get((r["name"], r["version"]), len(order)))
+
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duration": time.time() - start,
+        "results": results,
+    }
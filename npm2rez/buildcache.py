@@ -0,0 +1,172 @@
+"""
+Build artifact cache for npm2rez - run npm run build once per commit
+
+GitHub builds run ``npm install`` and ``npm run build`` in a checkout of the
+version tag. The built checkout is kept in ``<cache_dir>/builds/<key>``,
+keyed by the resolved commit, the hash of its lockfiles and the Node.js and
+npm versions that built it. A later build with the same key restores the
+checkout by hardlinking it from the cache and skips both npm steps.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from npm2rez.cache import get_cache_dir
+from npm2rez.fastcopy import link_file, transfer_many
+from npm2rez.locking import make_staging_dir
+from npm2rez.report import phase
+from npm2rez.stamp import hash_file
+
+# Bump when the layout of cache entries changes
+CACHE_FORMAT = 1
+
+LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml")
+
+
+def use_build_cache(args):
+    """Check whether GitHub builds go through the build artifact cache"""
+    return bool(getattr(args, "build_cache", False))
+
+
+def get_build_cache_dir(args):
+    """Get the build artifact cache directory
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+
+    Returns:
+        str: Path to ``<cache_dir>/builds``
+    """
+    return os.path.join(get_cache_dir(args), "builds")
+
+
+@functools.lru_cache(maxsize=None)
+def get_tool_versions(npm):
+    """Get the versions of node and npm that run a build
+
+    Args:
+        npm: Path to npm executable
+
+    Returns:
+        tuple: (node version, npm version), None for a tool that cannot run
+    """
+    versions = []
+    for command in (["node", "--version"], [npm, "--version"]):
+        try:
+            output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+            versions.append(output.decode("utf-8").strip())
+        except (OSError, subprocess.SubprocessError):
+            versions.append(None)
+    return tuple(versions)
+
+
+def get_commit(project_dir):
+    """Get the commit SHA checked out in a project directory"""
+    output = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=project_dir)
+    return output.decode("utf-8").strip()
+
+
+def get_build_key(npm, args, project_dir, env=None):
+    """Compute the cache key of a GitHub build
+
+    Args:
+        npm: Path to npm executable
+        args: Command line arguments of the build
+        project_dir: Checkout of the repository
+        env: Environment of the npm commands, variant builds target another
+            Node.js version through ``npm_config_target``
+
+    Returns:
+        str: sha256 hex digest of the build inputs
+    """
+    node, npm_version = get_tool_versions(npm)
+    lockfiles = {
+        name: hash_file(os.path.join(project_dir, name))
+        for name in LOCKFILES if os.path.isfile(os.path.join(project_dir, name))
+    }
+    inputs = {
+        "format": CACHE_FORMAT,
+        "commit": get_commit(project_dir),
+        "lockfiles": lockfiles,
+        "node": node,
+        "npm": npm_version,
+        "target": (env or {}).get("npm_config_target"),
+    }
+    data = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _link_tree(src, dst):
+    """Hardlink every top level item of src except .git into dst"""
+    pairs = [
+        (os.path.join(src, item), os.path.join(dst, item))
+        for item in os.listdir(src) if item != ".git"
+    ]
+    return transfer_many(pairs, copy_function=link_file)
+
+
+def restore_build(args, key, project_dir):
+    """Replace a checkout with its cached build, if there is one
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        key: Cache key from get_build_key
+        project_dir: Checkout of the repository
+
+    Returns:
+        bool: True if the build was restored from the cache
+    """
+    entry_dir = os.path.join(get_build_cache_dir(args), key)
+    if not os.path.isdir(entry_dir):
+        return False
+
+    with phase("build_cache_restore") as record:
+        for item in os.listdir(project_dir):
+            if item == ".git":
+                continue
+            path = os.path.join(project_dir, item)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        stats = _link_tree(entry_dir, project_dir)
+        record.update(stats._asdict())
+    print(f"Restored build {key[:12]} from {entry_dir}")
+    return True
+
+
+def save_build(args, key, project_dir):
+    """Add a built checkout to the cache
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        key: Cache key from get_build_key
+        project_dir: Built checkout of the repository
+
+    Returns:
+        bool: True if a cache entry was written
+    """
+    cache_dir = get_build_cache_dir(args)
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(entry_dir):
+        return False
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = make_staging_dir(cache_dir, key[:12])
+    try:
+        with phase("build_cache_save") as record:
+            stats = _link_tree(project_dir, temp_dir)
+            record.update(stats._asdict())
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # A concurrent build of the same commit saved it first
+            return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print(f"Cached build {key[:12]} in {entry_dir}")
+    return True
@@ -0,0 +1,198 @@
+"""
+Persistent download cache for npm2rez
+
+All npm invocations share one npm cache directory (npm's own content-addressed
+``_cacache`` store), so tarballs are downloaded once per integrity hash. Next to
+it npm2rez keeps a small index keyed by package name and version that records the
+lockfile of the last successful install. Replaying that lockfile skips version
+resolution, and when every tarball it references is already in the cache the
+install runs fully offline.
+"""
+
+import base64
+import binascii
+import json
+import os
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "npm2rez")
+
+
+def get_cache_dir(args=None):
+    """Get the npm2rez cache directory
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+
+    Returns:
+        str: Absolute path to the cache directory
+    """
+    cache_dir = (
+        getattr(args, "cache_dir", None)
+        or os.environ.get("NPM2REZ_CACHE_DIR")
+        or DEFAULT_CACHE_DIR
+    )
+    return os.path.abspath(os.path.expanduser(cache_dir))
+
+
+def get_npm_cache_dir(args=None):
+    """Get the directory passed to npm as ``--cache``"""
+    return os.path.join(get_cache_dir(args), "npm")
+
+
+def npm_cache_args(args=None, offline=False):
+    """Get the cache related arguments for an npm invocation
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir`` and ``offline``
+        offline: Force ``--offline`` even if ``args.offline`` is not set
+
+    Returns:
+        list: Arguments to append to the npm command line
+    """
+    flags = ["--cache", get_npm_cache_dir(args)]
+    if offline or getattr(args, "offline", False):
+        flags.append("--offline")
+    else:
+        flags.append("--prefer-offline")
+    return flags
+
+
+def _index_path(args, name, version):
+    """Get the index file for a package version"""
+    # Scoped names contain a slash, escape it like the registry does
+    safe_name = name.replace("/", "%2f")
+    return os.path.join(get_cache_dir(args), "index", safe_name, f"{version}.json")
+
+
+def integrity_to_content_path(args, integrity):
+    """Map an SRI integrity string to its path in npm's content store
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        integrity: Integrity string such as ``sha512-<base64>``
+
+    Returns:
+        str or None: Path of the cached tarball, None if the string is invalid
+    """
+    # Integrity fields may list several hashes, the first one is enough
+    algorithm, _, digest = integrity.split()[0].partition("-")
+    try:
+        digest = base64.b64decode(digest)
+    except (binascii.Error, ValueError):
+        return None
+    if not algorithm or not digest:
+        return None
+    return get_content_path(args, algorithm, digest)
+
+
+def get_content_path(args, algorithm, digest):
+    """Get the path of a tarball in npm's content store
+
+    The native and lockfile installers share the store with npm, so a
+    tarball is downloaded once whichever installer fetches it first.
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        algorithm: Hash algorithm such as ``sha512``
+        digest: Digest bytes of the tarball
+
+    Returns:
+        str: Path of the cached tarball
+    """
+    hex_digest = binascii.hexlify(digest).decode("ascii")
+    return os.path.join(
+        get_npm_cache_dir(args), "_cacache", "content-v2", algorithm,
+        hex_digest[:2], hex_digest[2:4], hex_digest[4:]
+    )
+
+
+def lockfile_is_cached(args, lockfile):
+    """Check whether every tarball referenced by a lockfile is cached
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        lockfile: Parsed package-lock.json content (v2/v3)
+
+    Returns:
+        bool: True if an offline install of the lockfile can succeed
+    """
+    packages = lockfile.get("packages", {})
+    for path, meta in packages.items():
+        if not path or meta.get("link"):
+            continue
+        integrity = meta.get("integrity")
+        if not integrity:
+            return False
+        content_path = integrity_to_content_path(args, integrity)
+        if not content_path or not os.path.exists(content_path):
+            return False
+    return bool(packages)
+
+
+def load_cached_lockfile(args, name, version):
+    """Load the lockfile recorded for a package version
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        name: Package name
+        version: Package version
+
+    Returns:
+        dict or None: Recorded lockfile, None if the package was never installed
+    """
+    index_path = _index_path(args, name, version)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            return json.load(f).get("lockfile")
+    except (OSError, ValueError):
+        return None
+
+
+def record_install(args, project_dir):
+    """Record the lockfile of a finished install in the cache index
+
+    Args:
+        args: Command line arguments with ``name`` and ``version``
+        project_dir: npm project directory that contains package-lock.json
+
+    Returns:
+        bool: True if an index entry was written
+    """
+    lockfile_path = os.path.join(project_dir, "package-lock.json")
+    if not os.path.exists(lockfile_path):
+        return False
+
+    try:
+        with open(lockfile_path, encoding="utf-8") as f:
+            lockfile = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    target = lockfile.get("packages", {}).get(f"node_modules/{args.name}", {})
+    entry = {
+        "name": args.name,
+        "version": args.version,
+        "resolved": target.get("resolved"),
+        "integrity": target.get("integrity"),
+        "lockfile": lockfile,
+    }
+
+    # Write atomically, concurrent conversions may record the same entry
+    index_path = _index_path(args, args.name, args.version)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # A unique temporary name, threads of one process record entries too
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        # mkstemp creates the file private, index entries are shared
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
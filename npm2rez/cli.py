@@ -4,12 +4,20 @@
 Command line interface for npm2rez
 """
 
+import json
+import os
+import signal
+import socket
 import sys
 from types import SimpleNamespace
 
 import click
 
+from npm2rez import repoindex
+from npm2rez.batch import load_manifest, run_batch
 from npm2rez.core import create_package, extract_node_package
+from npm2rez.report import recorded
+from npm2rez.server import get_default_socket, make_server
 
 
 @click.group()
@@ -19,7 +27,11 @@ def cli():
 
 @cli.command()
 @click.option("--name", required=True, help="Name of the npm package")
-@click.option("--version", required=True, help="Version of the npm package")
+@click.option(
+    "--version",
+    required=True,
+    help="Version of the npm package, or a range or dist-tag such as ^4.9 or latest",
+)
 @click.option(
     "--source",
     default="npm",
@@ -38,14 +50,120 @@ def cli():
 @click.option(
     "--node-version",
     default="16",
-    help="Node.js version to use",
+    help="Node.js version to use, or comma separated versions to build as rez variants",
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    help="Persistent download cache directory (default: ~/.cache/npm2rez)",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Fail instead of downloading packages that are not cached",
+)
+@click.option(
+    "--installer",
+    default="npm",
+    type=click.Choice(["npm", "native"]),
+    help="Install with the npm executable or natively from the registry",
+)
+@click.option(
+    "--registry",
+    default=None,
+    help="npm registry URL (default: npm configuration or registry.npmjs.org)",
+)
+@click.option(
+    "--metadata-ttl",
+    type=int,
+    default=None,
+    help="Seconds cached package metadata is used before revalidating it (default: 300)",
+)
+@click.option(
+    "--resolve-deps",
+    is_flag=True,
+    help="Create a separate rez package for every npm dependency",
+)
+@click.option(
+    "--deps-depth",
+    type=int,
+    default=None,
+    help="Maximum dependency depth to split into packages (default: unlimited)",
+)
+@click.option(
+    "--lockfile",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="package-lock.json or npm-shrinkwrap.json to materialize exactly, without npm",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Rebuild packages even if their inputs did not change",
+)
+@click.option(
+    "--store",
+    default=None,
+    help="Content-addressed store to hardlink node_modules files from (default: copy files)",
+)
+@click.option(
+    "--git-mirror/--no-git-mirror",
+    default=True,
+    help="Check out GitHub sources from a local bare mirror in the cache directory",
+)
+@click.option(
+    "--build-cache/--no-build-cache",
+    default=True,
+    help="Reuse the npm run build output of GitHub sources built before from the same commit",
+)
+@click.option(
+    "--staging-dir",
+    default=None,
+    help="Directory to build packages in before moving them into place, such as a tmpfs",
+)
+@click.option(
+    "--prune",
+    is_flag=True,
+    help="Remove tests, docs, examples, source maps and similar files from node_modules",
+)
+@click.option(
+    "--prune-ts",
+    is_flag=True,
+    help="Also prune TypeScript sources (declaration files are kept)",
+)
+@click.option(
+    "--prune-rules",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="File with extra prune glob rules, one per line (implies --prune)",
+)
+@click.option(
+    "--payload",
+    default="dir",
+    type=click.Choice(["dir", "tar", "tar.gz", "tar.xz"]),
+    help="Ship node_modules as directories or as one archive unpacked on first use",
+)
+@click.option(
+    "--report",
+    "report_path",
+    default=None,
+    help="Write a JSON report with the duration, files and bytes of every phase",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    default=None,
+    help="Dump cProfile stats of the run to this file",
 )
-def create(name, version, source, repo, output, node_version):
+def create(name, version, source, repo, output, node_version, cache_dir, offline,
+           installer, registry, metadata_ttl, resolve_deps, deps_depth, lockfile, force,
+           store, git_mirror, build_cache, staging_dir, prune, prune_ts, prune_rules, payload,
+           report_path, profile_path):
     """Create a rez package from an npm package"""
     # Validate GitHub source arguments
     if source == "github" and not repo:
         click.echo("Error: When using github source, --repo is required")
-        return 1
+        sys.exit(1)
 
     # Create args object to pass to create_package
     args = SimpleNamespace(
@@ -55,21 +173,49 @@ def create(name, version, source, repo, output, node_version):
         repo=repo,
         output=output,
         node_version=node_version,
+        cache_dir=cache_dir,
+        offline=offline,
+        installer=installer,
+        registry=registry,
+        metadata_ttl=metadata_ttl,
+        resolve_deps=resolve_deps,
+        deps_depth=deps_depth,
+        lockfile=lockfile,
+        force=force,
+        store=store,
+        git_mirror=git_mirror,
+        build_cache=build_cache,
+        staging_dir=staging_dir,
+        prune=prune,
+        prune_ts=prune_ts,
+        prune_rules=prune_rules,
+        payload=payload,
         _is_test=False
     )
 
-    try:
-        package_dir = create_package(args)
-        click.echo(f"Created package at: {package_dir}")
-        return 0
-    except Exception as e:
-        click.echo(f"Error creating package: {str(e)}")
-        return 1
+    with recorded(report_path, profile_path, command="create",
+                  package=f"{name}@{version}") as run_report:
+        try:
+            package_dir = create_package(args)
+            click.echo(f"Created package at: {package_dir}")
+            run_report["success"] = True
+        except Exception as e:
+            click.echo(f"Error creating package: {str(e)}")
+            run_report["success"] = False
+
+    if not run_report["success"]:
+        # Scripts building packages need to see the failure
+        sys.exit(1)
+    return 0
 
 
 @cli.command()
 @click.option("--name", required=True, help="Name of the npm package")
-@click.option("--version", required=True, help="Version of the npm package")
+@click.option(
+    "--version",
+    required=True,
+    help="Version of the npm package, or a range or dist-tag such as ^4.9 or latest",
+)
 @click.option(
     "--source",
     default="npm",
@@ -85,12 +231,52 @@ def create(name, version, source, repo, output, node_version):
     default="./node_modules",
     help="Output directory for the node modules",
 )
-def extract(name, version, source, repo, output):
+@click.option(
+    "--cache-dir",
+    default=None,
+    help="Persistent download cache directory (default: ~/.cache/npm2rez)",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Fail instead of downloading packages that are not cached",
+)
+@click.option(
+    "--installer",
+    default="npm",
+    type=click.Choice(["npm", "native"]),
+    help="Install with the npm executable or natively from the registry",
+)
+@click.option(
+    "--registry",
+    default=None,
+    help="npm registry URL (default: npm configuration or registry.npmjs.org)",
+)
+@click.option(
+    "--lockfile",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="package-lock.json or npm-shrinkwrap.json to materialize exactly, without npm",
+)
+@click.option(
+    "--report",
+    "report_path",
+    default=None,
+    help="Write a JSON report with the duration, files and bytes of every phase",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    default=None,
+    help="Dump cProfile stats of the run to this file",
+)
+def extract(name, version, source, repo, output, cache_dir, offline, installer, registry,
+            lockfile, report_path, profile_path):
     """Extract a Node.js package without creating a rez package"""
     # Validate GitHub source arguments
     if source == "github" and not repo:
         click.echo("Error: When using github source, --repo is required")
-        return 1
+        sys.exit(1)
 
     # Create args object to pass to extract_node_package
     args = SimpleNamespace(
@@ -98,20 +284,357 @@ def extract(name, version, source, repo, output):
         version=version,
         source=source,
         repo=repo,
+        cache_dir=cache_dir,
+        offline=offline,
+        installer=installer,
+        registry=registry,
+        lockfile=lockfile,
         _is_test=False
     )
 
+    with recorded(report_path, profile_path, command="extract",
+                  package=f"{name}@{version}") as run_report:
+        try:
+            result = extract_node_package(args, output)
+            run_report["success"] = bool(result)
+            if result:
+                click.echo(f"Successfully extracted package to: {output}")
+            else:
+                click.echo(f"Failed to extract package to: {output}")
+        except Exception as e:
+            click.echo(f"Error extracting package: {str(e)}")
+            run_report["success"] = False
+
+    if not run_report["success"]:
+        sys.exit(1)
+    return 0
+
+
+@cli.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    default="./rez-packages",
+    help="Output directory for the rez packages",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of worker processes (default: CPU count)",
+)
+@click.option(
+    "--node-version",
+    default="16",
+    help="Node.js version to use for entries that do not set one",
+)
+@click.option(
+    "--combined",
+    is_flag=True,
+    help="Install all npm entries with a single npm install, then split them",
+)
+@click.option(
+    "--executor",
+    default="process",
+    type=click.Choice(["process", "pipeline"]),
+    help="Build entries in worker processes, or overlap their fetch, copy and shim stages",
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    help="Persistent download cache directory (default: ~/.cache/npm2rez)",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Fail instead of downloading packages that are not cached",
+)
+@click.option(
+    "--installer",
+    default="npm",
+    type=click.Choice(["npm", "native"]),
+    help="Install with the npm executable or natively from the registry",
+)
+@click.option(
+    "--registry",
+    default=None,
+    help="npm registry URL (default: npm configuration or registry.npmjs.org)",
+)
+@click.option(
+    "--metadata-ttl",
+    type=int,
+    default=None,
+    help="Seconds cached package metadata is used before revalidating it (default: 300)",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Rebuild packages even if their inputs did not change",
+)
+@click.option(
+    "--store",
+    default=None,
+    help="Content-addressed store to hardlink node_modules files from (default: copy files)",
+)
+@click.option(
+    "--git-mirror/--no-git-mirror",
+    default=True,
+    help="Check out GitHub sources from a local bare mirror in the cache directory",
+)
+@click.option(
+    "--build-cache/--no-build-cache",
+    default=True,
+    help="Reuse the npm run build output of GitHub sources built before from the same commit",
+)
+@click.option(
+    "--staging-dir",
+    default=None,
+    help="Directory to build packages in before moving them into place, such as a tmpfs",
+)
+@click.option(
+    "--prune",
+    is_flag=True,
+    help="Remove tests, docs, examples, source maps and similar files from node_modules",
+)
+@click.option(
+    "--prune-ts",
+    is_flag=True,
+    help="Also prune TypeScript sources (declaration files are kept)",
+)
+@click.option(
+    "--prune-rules",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="File with extra prune glob rules, one per line (implies --prune)",
+)
+@click.option(
+    "--payload",
+    default="dir",
+    type=click.Choice(["dir", "tar", "tar.gz", "tar.xz"]),
+    help="Ship node_modules as directories or as one archive unpacked on first use",
+)
+def batch(manifest, output, jobs, node_version, combined, executor, cache_dir, offline,
+          installer, registry, metadata_ttl, force, store, git_mirror, build_cache, staging_dir,
+          prune, prune_ts, prune_rules, payload):
+    """Create rez packages for every entry in a manifest file"""
     try:
-        result = extract_node_package(args, output)
-        if result:
-            click.echo(f"Successfully extracted package to: {output}")
-            return 0
+        entries = load_manifest(manifest)
+    except Exception as e:
+        click.echo(f"Error reading manifest: {str(e)}")
+        sys.exit(1)
+
+    def report(result):
+        label = f"{result['name']}@{result['version']}"
+        if result["success"]:
+            click.echo(f"OK      {label} -> {result['package_dir']}")
         else:
-            click.echo(f"Failed to extract package to: {output}")
-            return 1
+            click.echo(f"FAILED  {label}: {result['error']}")
+
+    summary = run_batch(
+        entries,
+        output,
+        jobs=jobs,
+        node_version=node_version,
+        options={
+            "cache_dir": cache_dir,
+            "offline": offline,
+            "installer": installer,
+            "registry": registry,
+            "metadata_ttl": metadata_ttl,
+            "force": force,
+            "store": store,
+            "git_mirror": git_mirror,
+            "build_cache": build_cache,
+            "staging_dir": staging_dir,
+            "prune": prune,
+            "prune_ts": prune_ts,
+            "prune_rules": prune_rules,
+            "payload": payload,
+        },
+        combined=combined,
+        on_result=report,
+        executor=executor
+    )
+    click.echo(
+        f"Batch finished in {summary['duration']:.1f}s: "
+        f"{summary['succeeded']} succeeded, {summary['failed']} failed, "
+        f"{summary['total']} total"
+    )
+    if summary["failed"]:
+        sys.exit(1)
+    return 0
+
+
+@cli.command()
+@click.option(
+    "--output",
+    default="./rez-packages",
+    help="Output directory of the rez packages",
+)
+@click.option(
+    "--rescan",
+    is_flag=True,
+    help="Rebuild the index from the package directories first",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of package families scanned at the same time by --rescan",
+)
+@click.option("--name", default=None, help="Only list versions of this npm or rez package")
+@click.option("--version", default=None, help="Only list this version")
+@click.option("--json", "as_json", is_flag=True, help="Print the packages as JSON")
+def index(output, rescan, jobs, name, version, as_json):
+    """List the packages of an output repository from its index
+
+    Exits with 1 if no package matches, so that "does X@Y exist?" can be
+    answered with ``npm2rez index --name X --version Y``.
+    """
+    try:
+        if rescan:
+            count = repoindex.rescan(output, jobs=jobs)
+            click.echo(f"Indexed {count} packages in {repoindex.get_index_path(output)}",
+                       err=as_json)
+        packages = repoindex.find_packages(output, name, version)
     except Exception as e:
-        click.echo(f"Error extracting package: {str(e)}")
-        return 1
+        click.echo(f"Error reading index: {str(e)}")
+        sys.exit(1)
+
+    if as_json:
+        click.echo(json.dumps(packages, indent=2))
+    else:
+        for package in packages:
+            click.echo(
+                f"{package['rez_name']}-{package['version']}  {package['name']}  "
+                f"{package['source']}  {package['files']} files  "
+                f"{package['payload_bytes']} bytes"
+            )
+    if not packages:
+        sys.exit(1)
+    return 0
+
+
+@cli.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    help="Unix socket to listen on (default: <cache-dir>/serve.sock)",
+)
+@click.option(
+    "--tcp",
+    is_flag=True,
+    help="Listen on --host and --port instead of a Unix socket, reachable by every local user",
+)
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    help="Address to listen on with --tcp",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=8765,
+    help="TCP port to listen on with --tcp",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Maximum number of jobs running at the same time (default: CPU count)",
+)
+@click.option(
+    "--output",
+    default="./rez-packages",
+    help="Output directory for jobs that do not set one",
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    help="Persistent download cache directory (default: ~/.cache/npm2rez)",
+)
+@click.option(
+    "--installer",
+    default="npm",
+    type=click.Choice(["npm", "native"]),
+    help="Install with the npm executable or natively from the registry",
+)
+@click.option(
+    "--registry",
+    default=None,
+    help="npm registry URL (default: npm configuration or registry.npmjs.org)",
+)
+@click.option(
+    "--metadata-ttl",
+    type=int,
+    default=None,
+    help="Seconds cached package metadata is used before revalidating it (default: 300)",
+)
+@click.option(
+    "--store",
+    default=None,
+    help="Content-addressed store to hardlink node_modules files from (default: copy files)",
+)
+@click.option(
+    "--git-mirror/--no-git-mirror",
+    default=True,
+    help="Check out GitHub sources from a local bare mirror in the cache directory",
+)
+@click.option(
+    "--build-cache/--no-build-cache",
+    default=True,
+    help="Reuse the npm run build output of GitHub sources built before from the same commit",
+)
+@click.option(
+    "--staging-dir",
+    default=None,
+    help="Directory to build packages in before moving them into place, such as a tmpfs",
+)
+@click.option("--quiet", is_flag=True, help="Do not log requests")
+def serve(socket_path, tcp, host, port, jobs, output, cache_dir, installer, registry,
+          metadata_ttl, store, git_mirror, build_cache, staging_dir, quiet):
+    """Run a daemon that serves create and extract jobs with warm caches"""
+    if tcp:
+        socket_path = None
+    elif not socket_path and hasattr(socket, "AF_UNIX"):
+        socket_path = get_default_socket(cache_dir)
+    server = make_server(
+        socket_path,
+        host=host,
+        port=port,
+        jobs=jobs,
+        defaults={
+            "output": output,
+            "cache_dir": cache_dir,
+            "installer": installer,
+            "registry": registry,
+            "metadata_ttl": metadata_ttl,
+            "store": store,
+            "git_mirror": git_mirror,
+            "build_cache": build_cache,
+            "staging_dir": staging_dir,
+        },
+        quiet=quiet,
+    )
+    if socket_path:
+        click.echo(f"npm2rez serving on {server.server_address}")
+    else:
+        click.echo(f"npm2rez serving on http://{host}:{server.server_address[1]}")
+    # Stop cleanly when a service manager terminates the daemon
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
 
 
 def main():
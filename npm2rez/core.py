@@ -2,38 +2,414 @@
 Core functionality for npm2rez - A tool to convert Node.js packages to rez packages
 """
 
+import filecmp
+import hashlib
 import json
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+
+from npm2rez import buildcache, cache, gitmirror, metadata, packlist, registry, repoindex, store
+from npm2rez.archive import get_payload_mode, remove_archives, write_archive
+from npm2rez.deps import (
+    build_dependency_graph,
+    closure_roots,
+    dependency_closure,
+    get_bin_names,
+    has_native_addons,
+    load_lockfile,
+    merge_cycles,
+    nest_duplicates,
+    read_package_json,
+    topological_levels,
+)
+from npm2rez.fastcopy import link_file, list_modules, transfer_many, transfer_node_modules
+from npm2rez.locking import (
+    make_build_dir,
+    make_staging_dir,
+    package_lock,
+    publish_dir,
+    remove_build_dir,
+)
+from npm2rez.prune import get_prune_rules, print_size_report, prune_node_modules
+from npm2rez.report import phase, run_in_context
+from npm2rez.stamp import get_fingerprint, is_up_to_date, write_stamp
 
 
 def create_package(args):
-    """Create rez package"""
-    # Convert package name to rez compatible format (use underscore instead of hyphen)
-    rez_name = convert_name_to_rez_format(args.name)
+    """Create rez package
 
-    # Create output directory
+    Raises:
+        RuntimeError: If the package could not be installed, nothing is
+            published then
+    """
+    is_test = hasattr(args, "_is_test") and args._is_test
+    # Version ranges and dist-tags become the version they resolve to
+    metadata.resolve_version(args)
+    if getattr(args, "resolve_deps", False) and args.source == "npm" and not is_test:
+        return create_dependency_packages(args)
+
+    package_dir = get_package_dir(args)
+
+    # Only one job builds a given package version, the others wait and reuse it
+    with phase("create_package", package=f"{args.name}@{args.version}") as record, \
+            package_lock(package_dir):
+        # Skip packages already built from the same inputs
+        if not getattr(args, "force", False) and is_up_to_date(package_dir,
+                                                                 get_fingerprint(args)):
+            print(f"{package_dir} is up to date")
+            record["skipped"] = True
+            return package_dir
+
+        # Build in a private directory, the package only appears once complete
+        build_dir = make_build_dir(package_dir, getattr(args, "staging_dir", None))
+        try:
+            # Create package.py file
+            create_package_py(args, build_dir)
+
+            # Install Node.js package
+            installed = install_node_package(args, build_dir)
+            record["success"] = bool(installed)
+            if not installed:
+                raise RuntimeError(f"Failed to install {args.name}@{args.version}")
+            finish_payload(args, build_dir)
+            write_stamp(build_dir, args)
+            with phase("publish"):
+                publish_package(build_dir, package_dir)
+        finally:
+            remove_build_dir(build_dir)
+
+    return package_dir
+
+
+def finish_payload(args, package_dir):
+    """Prune and pack the payload of a freshly installed package
+
+    Args:
+        args: Command line arguments, may provide ``prune``, ``prune_ts``,
+            ``prune_rules`` and ``payload``
+        package_dir: Package version directory
+    """
+    payload_dirs = get_variant_dirs(args, package_dir)
+    rules = get_prune_rules(args)
+    if rules:
+        for payload_dir in payload_dirs:
+            with phase("prune") as record:
+                report = prune_node_modules(os.path.join(payload_dir, "node_modules"), rules)
+                record["files"] = sum(stats["removed_files"] for stats in report.values())
+                record["bytes"] = sum(stats["removed_bytes"] for stats in report.values())
+            print_size_report(report)
+
+    mode = get_payload_mode(args)
+    if mode == "dir":
+        for payload_dir in payload_dirs:
+            remove_archives(payload_dir)
+        return
+    archives = []
+    for payload_dir in payload_dirs:
+        with phase("archive", mode=mode) as record:
+            archives.append(write_archive(payload_dir, mode))
+            record["bytes"] = os.path.getsize(os.path.join(payload_dir, archives[-1][0]))
+        print(f"Packed payload into {os.path.join(payload_dir, archives[-1][0])}")
+    # One package.py serves every variant, so key the cache by all of their archives
+    digest = archives[0][1] if len(archives) == 1 else hashlib.sha256(
+        "".join(archive_digest for _, archive_digest in archives).encode("utf-8")
+    ).hexdigest()
+    create_package_py(args, package_dir, archive=(archives[0][0], digest))
+
+
+def get_node_versions(args):
+    """Get the Node.js versions a package is built for
+
+    Args:
+        args: Command line arguments with ``node_version``, such as ``16``
+            or ``16,18,20``
+
+    Returns:
+        list: Node.js versions, one per variant
+    """
+    versions = str(getattr(args, "node_version", None) or "16").split(",")
+    return [version.strip() for version in versions if version.strip()]
+
+
+def get_variant_dirs(args, package_dir):
+    """Get the payload directories of a package version
+
+    A package built for one Node.js version keeps its payload in the
+    package version directory. Several versions become rez variants, each
+    with its payload in a ``nodejs-<version>`` subdirectory.
+
+    Args:
+        args: Command line arguments with ``node_version``
+        package_dir: Package version directory
+
+    Returns:
+        list: Payload directories, one per Node.js version
+    """
+    versions = get_node_versions(args)
+    if len(versions) == 1:
+        return [package_dir]
+    return [os.path.join(package_dir, f"nodejs-{version}") for version in versions]
+
+
+def get_rez_requirement(name, version):
+    """Get the rez requirement of an npm package version
+
+    Args:
+        name: Package name
+        version: Package version
+
+    Returns:
+        str: Rez requirement such as ``types_node-18.11.9``
+    """
+    return f"{convert_name_to_rez_format(name)}-{version}"
+
+
+def create_dependency_packages(args):
+    """Create one rez package per npm package in the dependency tree
+
+    The package is installed once into a temporary npm project. Its lockfile
+    describes the dependency graph, which is built level by level so that
+    independent packages are created concurrently. Each rez package only
+    contains its own npm package and requires the rez packages of its
+    dependencies. Packages deeper than ``args.deps_depth`` bundle their
+    remaining dependencies instead, and the packages of a dependency cycle
+    are bundled into one package. When the tree holds several versions of a
+    package, only one gets a package, the others are nested in the packages
+    requiring them, so that the requirements of the root never conflict.
+
+    Args:
+        args: Command line arguments, see create_package. Also uses
+            ``deps_depth`` (optional) and ``jobs`` (optional)
+
+    Returns:
+        str: Package directory of the requested package
+    """
     output_dir = os.path.abspath(args.output)
-    package_dir = os.path.join(output_dir, rez_name, args.version)
-    os.makedirs(package_dir, exist_ok=True)
+    temp_dir = make_staging_dir(output_dir, "temp_deps")
+    try:
+        if getattr(args, "lockfile", None):
+            # The lockfile already describes the tree, no npm needed
+            if not install_from_lockfile(args, temp_dir):
+                raise RuntimeError(f"Failed to materialize {args.lockfile}")
+            lockfile = load_lockfile(args.lockfile)
+        else:
+            npm = getattr(args, "npm", None) or get_npm_executable()
+            if not npm:
+                raise RuntimeError("npm command not found, cannot resolve dependencies")
+            _install_npm_project(npm, args, temp_dir)
+            lockfile = load_lockfile(os.path.join(temp_dir, "package-lock.json"))
+        # Optional packages for another platform are locked but not installed
+        lockfile["packages"] = {
+            location: meta for location, meta in lockfile["packages"].items()
+            if not (meta.get("optional") and not registry.platform_matches(meta))
+        }
+        root_location = f"node_modules/{args.name}"
+        graph = build_dependency_graph(
+            lockfile, root_location, getattr(args, "deps_depth", None)
+        )
+        root_key = next(key for key, node in graph.items() if node["location"] == root_location)
+        for name, version in nest_duplicates(graph, root_key):
+            print(f"Nesting {name}@{version} in the packages that require it, "
+                  f"another version of {name} has a package of its own")
+        for key, members in merge_cycles(graph, root_key):
+            cycle = ", ".join(f"{name}@{version}" for name, version in members)
+            print(f"Bundling dependency cycle {cycle} into {key[0]}@{key[1]}")
+        levels = topological_levels(graph)
+
+        print(f"Resolved {len(graph)} packages in {len(levels)} levels")
+        package_dirs = {}
+        with ThreadPoolExecutor(max_workers=getattr(args, "jobs", None)) as executor:
+            for level in levels:
+                nodes = [graph[key] for key in level]
+                # Phases of worker threads belong to the current report
+                futures = [
+                    executor.submit(
+                        run_in_context(_create_dependency_package, args, temp_dir, node)
+                    )
+                    for node in nodes
+                ]
+                for node, future in zip(nodes, futures):
+                    package_dirs[node["location"]] = future.result()
+
+        return package_dirs[root_location]
+    finally:
+        # Clean up temporary directory
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-    # Create package.py file
-    create_package_py(args, package_dir)
 
-    # Install Node.js package
-    install_node_package(args, package_dir)
+def _create_dependency_package(args, project_dir, node):
+    """Create the rez package of one dependency graph node
 
+    Args:
+        args: Command line arguments of the requested package
+        project_dir: Temporary npm project holding the installed tree
+        node: Dependency graph node
+
+    Returns:
+        str: Package directory
+    """
+    node_args = SimpleNamespace(
+        name=node["name"],
+        version=node["version"],
+        source="npm",
+        repo=None,
+        output=args.output,
+        node_version=args.node_version,
+        requires=[get_rez_requirement(*key) for key in node["requires"]],
+        prune=getattr(args, "prune", False),
+        prune_ts=getattr(args, "prune_ts", False),
+        prune_rules=getattr(args, "prune_rules", None),
+        payload=getattr(args, "payload", None),
+        staging_dir=getattr(args, "staging_dir", None),
+    )
+    package_dir = get_package_dir(node_args)
+
+    members = node.get("members", [])
+    fingerprint = get_fingerprint(
+        node_args, resolve_deps=True, bundle=node["bundle"],
+        members=[f"{member['name']}@{member['version']}" for member in members],
+        nested=[f"{entry['path']}@{entry['version']}" for entry in node.get("nested", [])],
+    )
+    with phase("create_package", package=f"{node['name']}@{node['version']}") as record, \
+            package_lock(package_dir):
+        if not getattr(args, "force", False) and is_up_to_date(package_dir, fingerprint):
+            print(f"{package_dir} is up to date")
+            record["skipped"] = True
+            return package_dir
+
+        build_dir = make_build_dir(package_dir, node_args.staging_dir)
+        try:
+            _build_dependency_package(args, node_args, project_dir, node, build_dir)
+            write_stamp(build_dir, node_args, fingerprint=fingerprint, resolve_deps=True,
+                        requires=node_args.requires)
+            with phase("publish"):
+                publish_package(build_dir, package_dir)
+        finally:
+            remove_build_dir(build_dir)
+        print(f"Created {node['name']}@{node['version']} at {package_dir}")
     return package_dir
 
 
-def create_package_py(args, package_dir):
-    """Create package.py file"""
+def _build_dependency_package(args, node_args, project_dir, node, build_dir):
+    """Write package.py, node_modules and bin of a dependency package to its build directory
+
+    Like _install_variants, the payload is built for the first Node.js
+    variant and hardlinked into the others. The tree is installed once, so
+    a package with native addons cannot be built for several variants.
+    """
+    create_package_py(node_args, build_dir)
+    variant_dirs = get_variant_dirs(node_args, build_dir)
+    payload_dir = variant_dirs[0]
+    node_modules_dir = os.path.join(payload_dir, "node_modules")
+
+    location = node["location"]
+    if node["bundle"]:
+        # Past the depth limit the package carries its own dependency closure
+        pairs = []
+        for root in closure_roots(dependency_closure(project_dir, location)):
+            target = f"node_modules/{node['name']}" if root == location else root
+            pairs.append((
+                os.path.join(project_dir, *root.split("/")),
+                os.path.join(payload_dir, *target.split("/"))
+            ))
+    else:
+        # Nested node_modules hold dependencies, which get packages of their own.
+        # The other members of a dependency cycle are shipped alongside.
+        pairs = []
+        for package in [node] + node.get("members", []):
+            package_src = os.path.join(project_dir, *package["location"].split("/"))
+            dst_dir = os.path.join(node_modules_dir, *package["name"].split("/"))
+            pairs.extend(
+                (os.path.join(package_src, item), os.path.join(dst_dir, item))
+                for item in os.listdir(package_src) if item != "node_modules"
+            )
+    # Other versions of packages that have a package of their own are nested
+    # where require() finds them first, with the closure of bundled ones
+    for entry in node.get("nested", []):
+        package_src = os.path.join(project_dir, *entry["location"].split("/"))
+        dst_dir = os.path.join(payload_dir, *entry["path"].split("/"))
+        if entry["bundle"]:
+            for root in closure_roots(dependency_closure(project_dir, entry["location"])):
+                if root == entry["location"]:
+                    target = entry["path"]
+                else:
+                    target = f"{entry['path']}/node_modules/{root.rsplit('node_modules/', 1)[-1]}"
+                pairs.append((
+                    os.path.join(project_dir, *root.split("/")),
+                    os.path.join(payload_dir, *target.split("/"))
+                ))
+            continue
+        pairs.extend(
+            (os.path.join(package_src, item), os.path.join(dst_dir, item))
+            for item in os.listdir(package_src) if item != "node_modules"
+        )
+    with phase("copy") as copy_record:
+        stats = transfer_many(pairs, copy_function=store.get_copy_function(args))
+        copy_record.update(stats._asdict())
+
+    for package in [node] + node.get("members", []):
+        package_src = os.path.join(project_dir, *package["location"].split("/"))
+        bin_names = get_bin_names(read_package_json(package_src))
+        if bin_names:
+            create_bin_files(node_args, os.path.join(payload_dir, "bin"), package["name"],
+                             bin_names)
+
+    if len(variant_dirs) > 1:
+        if has_native_addons(node_modules_dir):
+            raise ValueError(
+                f"{node['name']}@{node['version']} has native addons, --resolve-deps "
+                "cannot build it for several Node.js versions"
+            )
+        _link_variants(node_args, variant_dirs)
+
+    finish_payload(node_args, build_dir)
+
+
+def get_package_dir(args):
+    """Get the rez package directory for a package version
+
+    Args:
+        args: Command line arguments with ``name``, ``version`` and ``output``
+
+    Returns:
+        str: Absolute path to ``<output>/<rez_name>/<version>``
+    """
+    # Convert package name to rez compatible format (use underscore instead of hyphen)
+    rez_name = convert_name_to_rez_format(args.name)
+    return os.path.join(os.path.abspath(args.output), rez_name, args.version)
+
+
+def create_package_py(args, package_dir, archive=None):
+    """Create package.py file
+
+    Args:
+        args: Command line arguments
+        package_dir: Package version directory
+        archive: (file name, sha256) of the payload archive, None when the
+            payload is shipped as directories
+    """
     package_py_path = os.path.join(package_dir, "package.py")
 
     # Convert package name to rez compatible format (use underscore instead of hyphen)
     rez_name = convert_name_to_rez_format(args.name)
 
+    # Additional requirements, such as rez packages of npm dependencies
+    requires = "".join(f'    "{request}",\n' for request in getattr(args, "requires", []))
+
+    # Several Node.js versions become variants, one version is a plain requirement
+    node_versions = get_node_versions(args)
+    variants = ""
+    if len(node_versions) == 1:
+        requires = f'    "nodejs-{node_versions[0]}+",\n' + requires
+    else:
+        variants = "\nvariants = [\n" + "".join(
+            f'    ["nodejs-{version}"],\n' for version in node_versions
+        ) + "]\n"
+
     # Prepare template content
     package_content = f'''
 # env variable is provided by Rez at runtime
@@ -45,20 +421,60 @@ version = "{args.version}"
 description = "Rez package for {args.name} Node.js package"
 
 requires = [
-    "nodejs-{args.node_version}+",
-]
-
+{requires}]
+{variants}
 def commands():
 '''
 
+    if archive:
+        # Unpack the payload into a local cache on first use
+        archive_name, digest = archive
+        # Variants share the package.py, this.root is the root of the variant
+        variant_dir = "" if not variants else (
+            "    payload_dir = os.path.join(payload_dir, os.path.basename(this.root))\n"
+        )
+        package_content += f'''
+    import os
+    import shutil
+    import tarfile
+
+    # Unpack the payload archive into a local cache on first use
+    cache_root = os.environ.get("NPM2REZ_PAYLOAD_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "npm2rez", "payloads")
+    payload_dir = os.path.join(cache_root, "{rez_name}", "{args.version}", "{digest[:16]}")
+{variant_dir}    if not os.path.isdir(payload_dir):
+        os.makedirs(os.path.dirname(payload_dir), exist_ok=True)
+        staging_dir = "%s.tmp-%d" % (payload_dir, os.getpid())
+        with tarfile.open(os.path.join(this.root, "{archive_name}")) as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(staging_dir, filter="data")
+            else:
+                tar.extractall(staging_dir)
+        try:
+            os.rename(staging_dir, payload_dir)
+        except OSError:
+            # Another process unpacked the payload first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
     # Add bin directory to PATH
-    package_content += '''
+    env.PATH.append(os.path.join(payload_dir, "bin"))
+
+    # Add to NODE_PATH
+    node_modules_dir = os.path.join(payload_dir, "node_modules")
+    if "NODE_PATH" not in env:
+        env.NODE_PATH = node_modules_dir
+    else:
+        env.NODE_PATH.append(node_modules_dir)
+'''
+    else:
+        # Add bin directory to PATH
+        package_content += '''
     # Add bin directory to PATH
     env.PATH.append("{root}/bin")
 '''
 
-    # Add to NODE_PATH
-    package_content += '''
+        # Add to NODE_PATH
+        package_content += '''
     # Add to NODE_PATH
     if "NODE_PATH" not in env:
         env.NODE_PATH = "{root}/node_modules"
@@ -66,11 +482,11 @@ def commands():
         env.NODE_PATH.append("{root}/node_modules")
 '''
 
-    # Write to file
-    with open(package_py_path, "w", encoding="utf-8") as f:
-        f.write(package_content)
-
-    print(f"Created {package_py_path}")
+    # Write to file, leaving an identical package.py untouched
+    with phase("package_py") as record:
+        record["files"] = int(_write_if_changed(package_py_path, package_content))
+    if record["files"]:
+        print(f"Created {package_py_path}")
 
 
 def create_bin_files(args, bin_dir, package_name, bin_files):
@@ -82,8 +498,15 @@ def create_bin_files(args, bin_dir, package_name, bin_files):
         package_name: Name of the package
         bin_files: List of binary file names
     """
+    with phase("shims") as record:
+        record["files"] = _create_bin_files(bin_dir, package_name, bin_files)
+
+
+def _create_bin_files(bin_dir, package_name, bin_files):
+    """Write the shims of create_bin_files, returning how many were written"""
     os.makedirs(bin_dir, exist_ok=True)
 
+    written = 0
     for bin_file in bin_files:
         dst_path = os.path.join(bin_dir, bin_file)
         bin_name = os.path.splitext(bin_file)[0]
@@ -95,30 +518,88 @@ def create_bin_files(args, bin_dir, package_name, bin_files):
 
             # For .cmd files, create a portable batch file
             if bin_file.endswith(".cmd"):
-                with open(dst_path, "w", encoding="utf-8") as f:
-                    f.write("@echo off\n")
-                    f.write(
-                        f"node \"%~dp0\\..\\node_modules\\{package_name}\\bin\\{bin_name}\" %*\n"
-                    )
-            else:
-                # For non-cmd files, create executable script
-                if os.path.exists(dst_path):
-                    os.remove(dst_path)
-                with open(dst_path, "w", encoding="utf-8") as f:
-                    f.write("#!/usr/bin/env node\n")
-                    f.write(f"require(\"../node_modules/{package_name}/bin/{bin_name}\");\n")
-                # Make the file executable
-                os.chmod(dst_path, 0o755)
-        else:  # Unix
-            # On Unix, create executable script
-            if os.path.exists(dst_path):
-                os.remove(dst_path)
-
-            with open(dst_path, "w", encoding="utf-8") as f:
-                f.write("#!/usr/bin/env node\n")
-                f.write(f"require(\"../node_modules/{package_name}/bin/{bin_name}\");\n")
-            # Make the file executable
-            os.chmod(dst_path, 0o755)
+                written += _write_if_changed(
+                    dst_path,
+                    "@echo off\n"
+                    f"node \"%~dp0\\..\\node_modules\\{package_name}\\bin\\{bin_name}\" %*\n"
+                )
+                continue
+
+        # Create an executable script requiring the package binary
+        written += _write_if_changed(
+            dst_path,
+            "#!/usr/bin/env node\n"
+            f"require(\"../node_modules/{package_name}/bin/{bin_name}\");\n",
+            mode=0o755
+        )
+    return written
+
+
+def _write_if_changed(path, content, mode=None):
+    """Write a text file unless it already has the same content
+
+    Unchanged files keep their modification time, so file system and NFS
+    client caches stay valid across rebuilds.
+
+    Args:
+        path: File path
+        content: Text content
+        mode: File mode to apply, if any
+
+    Returns:
+        bool: True if the file was written
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            changed = f.read() != content
+    except (OSError, UnicodeDecodeError):
+        changed = True
+
+    if changed:
+        if os.path.islink(path):
+            os.remove(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    if mode is not None and (changed or os.stat(path).st_mode & 0o777 != mode):
+        os.chmod(path, mode)
+    return changed
+
+
+def keep_unchanged_mtimes(package_dir, build_dir):
+    """Carry the modification times of unchanged package.py and shims over to a new build
+
+    Like _write_if_changed for packages built from scratch in a build directory.
+
+    Args:
+        package_dir: Published package version directory, may not exist
+        build_dir: Build directory about to replace it
+    """
+    bin_dir = os.path.join(build_dir, "bin")
+    paths = ["package.py"]
+    if os.path.isdir(bin_dir):
+        paths += [os.path.join("bin", name) for name in os.listdir(bin_dir)]
+
+    for path in paths:
+        old_path = os.path.join(package_dir, path)
+        new_path = os.path.join(build_dir, path)
+        if os.path.isfile(old_path) and os.path.isfile(new_path) and \
+                filecmp.cmp(old_path, new_path, shallow=False):
+            stat = os.stat(old_path)
+            os.utime(new_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def publish_package(build_dir, package_dir):
+    """Publish a finished build directory and record it in the repository index
+
+    Args:
+        build_dir: Build directory with a build stamp
+        package_dir: Package version directory to replace
+    """
+    keep_unchanged_mtimes(package_dir, build_dir)
+    # Scan the build directory, it is usually on a faster filesystem
+    entry = repoindex.scan_package(build_dir)
+    publish_dir(build_dir, package_dir)
+    repoindex.record_package(package_dir, entry)
 
 
 def get_npm_executable():
@@ -127,21 +608,101 @@ def get_npm_executable():
     Returns:
         str or None: Path to npm executable or None if not found
     """
-    npm = shutil.which("npm")
+    with phase("toolchain_probe"):
+        npm = shutil.which("npm")
+
+        # Check if npm is available
+        try:
+            if npm:
+                subprocess.check_call(
+                    [npm, "--version"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+                return npm
+            else:
+                raise FileNotFoundError("npm not found")
+        except (subprocess.SubprocessError, FileNotFoundError):
+            return None
+
+
+def get_npm_install_args(args, offline=False):
+    """Get the extra arguments of an npm install
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``, ``offline``
+            and ``registry``
+        offline: Force ``--offline``
+
+    Returns:
+        list: Arguments to append to ``npm install``
+    """
+    install_args = cache.npm_cache_args(args, offline=offline)
+    if getattr(args, "registry", None):
+        install_args += ["--registry", registry.get_registry(args)]
+    return install_args
 
-    # Check if npm is available
-    try:
-        if npm:
-            subprocess.check_call(
-                [npm, "--version"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            return npm
-        else:
-            raise FileNotFoundError("npm not found")
-    except (subprocess.SubprocessError, FileNotFoundError):
-        return None
+
+def get_npm_env_kwargs(args):
+    """Get the subprocess keyword arguments of npm for a Node.js variant build
+
+    node-gyp and prebuild-install build or fetch native addons for the
+    Node.js version in ``npm_config_target`` instead of the running one.
+
+    Args:
+        args: Command line arguments, variant builds have ``_variant`` set
+
+    Returns:
+        dict: ``{"env": ...}`` for variant builds, else empty
+    """
+    if not getattr(args, "_variant", False):
+        return {}
+    target = str(args.node_version)
+    if target.isdigit():
+        # Addons are ABI compatible within a major version
+        target = f"{target}.0.0"
+    env = dict(os.environ)
+    env.update({"npm_config_target": target, "npm_config_runtime": "node"})
+    return {"env": env}
+
+
+def _install_npm_project(npm, args, project_dir):
+    """Run npm install for a single package in a temporary npm project
+
+    Args:
+        npm: Path to npm executable
+        args: Command line arguments with ``name`` and ``version``
+        project_dir: Empty directory to use as the npm project
+    """
+    # Create package.json in temporary directory
+    package_json = {
+        "name": "temp",
+        "version": "1.0.0",
+        "description": "Temporary package for npm2rez",
+        "dependencies": {}
+    }
+    package_json["dependencies"][args.name] = args.version
+
+    with open(os.path.join(project_dir, "package.json"), "w") as f:
+        json.dump(package_json, f, indent=2)
+
+    # Replay the lockfile of a previous install to skip version resolution,
+    # and stay offline when all of its tarballs are already cached
+    offline = getattr(args, "offline", False)
+    lockfile = cache.load_cached_lockfile(args, args.name, args.version)
+    if lockfile:
+        with open(os.path.join(project_dir, "package-lock.json"), "w") as f:
+            json.dump(lockfile, f, indent=2)
+        offline = offline or cache.lockfile_is_cached(args, lockfile)
+
+    # Install package in temporary directory
+    with phase("npm_install", offline=offline):
+        subprocess.check_call(
+            [npm, "install", *get_npm_install_args(args, offline=offline)],
+            cwd=project_dir,
+            **get_npm_env_kwargs(args)
+        )
+    cache.record_install(args, project_dir)
 
 
 def install_from_npm(npm, args, install_path, is_test=False):
@@ -170,72 +731,332 @@ def install_from_npm(npm, args, install_path, is_test=False):
         print(f"Test mode: Skipped npm install for {args.name}@{args.version}")
         return True
 
-    # Create temporary directory for npm installation
-    temp_dir = os.path.join(os.path.dirname(install_path), "temp_npm")
-    os.makedirs(temp_dir, exist_ok=True)
+    # Create a temporary directory for npm installation, unique to this job
+    temp_dir = make_staging_dir(os.path.dirname(install_path), "temp_npm")
+
+    try:
+        _install_npm_project(npm, args, temp_dir)
+        copy_staged_modules(args, temp_dir, install_path)
+        create_staged_shims(args, temp_dir, install_path)
+        print(f"Installed {args.name}@{args.version} from npm")
+        return True
+    except Exception as e:
+        print(f"Error installing from npm: {e}")
+        _report_offline_miss(args)
+        return False
+    finally:
+        remove_staging(temp_dir)
+
+
+def stage_npm_install(npm, args, install_path):
+    """Run npm install for a package in a new staging project
+
+    This is the fetch stage of install_from_npm, the staged modules are
+    placed with copy_staged_modules and create_staged_shims.
+
+    Args:
+        npm: Path to npm executable
+        args: Command line arguments
+        install_path: Package version directory the staging project is created next to
+
+    Returns:
+        str: Path to the staging project, to be removed with remove_staging
+    """
+    temp_dir = make_staging_dir(os.path.dirname(install_path), "temp_npm")
+    try:
+        _install_npm_project(npm, args, temp_dir)
+    except BaseException:
+        remove_staging(temp_dir)
+        raise
+    return temp_dir
+
+
+def copy_staged_modules(args, temp_dir, install_path):
+    """Move the node_modules of a staging project into a package version
+
+    Args:
+        args: Command line arguments, may provide ``store``
+        temp_dir: Staging project from stage_npm_install
+        install_path: Package version directory
+    """
+    # Create node_modules directory in install_path
+    node_modules_dir = os.path.join(install_path, "node_modules")
+    os.makedirs(node_modules_dir, exist_ok=True)
+
+    # Move the target package and its dependencies from temp_dir to install_path,
+    # the temporary project is thrown away so its files can be renamed
+    temp_modules_dir = os.path.join(temp_dir, "node_modules")
+    temp_package_dir = os.path.join(temp_modules_dir, args.name)
+    if os.path.exists(temp_package_dir):
+        with phase("copy") as record:
+            stats = transfer_node_modules(
+                temp_modules_dir, node_modules_dir, move=True,
+                copy_function=store.get_copy_function(args)
+            )
+            record.update(stats._asdict())
+        print(f"Copied {stats.files} files ({stats.bytes} bytes) to {node_modules_dir}")
+
+
+def create_staged_shims(args, temp_dir, install_path):
+    """Create the bin shims of a package version from its staging project
+
+    Args:
+        args: Command line arguments
+        temp_dir: Staging project from stage_npm_install
+        install_path: Package version directory
+    """
+    # Create bin directory and binary files
+    bin_dir = os.path.join(install_path, "bin")
+    # Find binaries in node_modules/.bin
+    temp_bin_dir = os.path.join(temp_dir, "node_modules", ".bin")
+    if os.path.exists(temp_bin_dir):
+        create_bin_files(args, bin_dir, args.name, os.listdir(temp_bin_dir))
+    else:
+        # For tests, check if there's a .bin directory in the install_path
+        local_bin_dir = os.path.join(install_path, "node_modules", ".bin")
+        if os.path.exists(local_bin_dir):
+            create_bin_files(args, bin_dir, args.name, os.listdir(local_bin_dir))
+
+
+def remove_staging(temp_dir):
+    """Remove a staging directory"""
+    with phase("cleanup"):
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+
+def _report_offline_miss(args):
+    """Explain a failed offline install"""
+    if getattr(args, "offline", False):
+        print(f"Offline mode: {args.name}@{args.version} or one of its dependencies "
+              f"is missing from the cache at {cache.get_cache_dir(args)}")
+
+
+def _materialize_tree(args, install_path, tree):
+    """Stream every tarball of a resolved tree into place, in parallel
+
+    Tarballs with a known integrity are kept in the persistent cache and
+    extracted from there on later installs. Running offline, a tarball
+    missing from the cache fails the install.
+
+    Args:
+        args: Command line arguments, may provide ``jobs``, ``cache_dir``
+            and ``offline``
+        install_path: Directory that receives node_modules
+        tree: Mapping of node_modules location to manifest with a ``dist`` field
+    """
+    # Replace previously installed copies of the top level modules
+    for root in closure_roots(tree):
+        root_path = os.path.join(install_path, *root.split("/"))
+        if os.path.exists(root_path):
+            shutil.rmtree(root_path)
+
+    def extract(item):
+        location, manifest = item
+        dist = manifest.get("dist", {})
+        expected = registry.parse_integrity(dist.get("integrity"), dist.get("shasum"))
+        return registry.download_tarball(
+            dist["tarball"],
+            os.path.join(install_path, *location.split("/")),
+            integrity=dist.get("integrity"),
+            shasum=dist.get("shasum"),
+            cache_path=cache.get_content_path(args, *expected) if expected else None,
+            offline=getattr(args, "offline", False),
+        )
+
+    with phase("download", packages=len(tree)) as record, \
+            ThreadPoolExecutor(max_workers=getattr(args, "jobs", None) or 16) as executor:
+        results = list(executor.map(extract, sorted(tree.items())))
+        files = record["files"] = sum(stats.files for stats in results)
+        size = record["bytes"] = sum(stats.bytes for stats in results)
+    print(f"Extracted {files} files ({size} bytes) to {install_path}")
+
+
+def install_from_lockfile(args, install_path):
+    """Install exactly the tree described by a lockfile, without npm
+
+    Every package is fetched from its ``resolved`` URL, checked against its
+    ``integrity`` and extracted at its lockfile location, or taken from the
+    persistent cache. No version resolution takes place. Dev-only, linked
+    and optional packages for another platform are skipped.
+
+    Args:
+        args: Command line arguments with ``lockfile``, may provide
+            ``registry``, ``cache_dir`` and ``offline``
+        install_path: Path to install package to
+
+    Returns:
+        bool: True if installation was successful
+    """
+    try:
+        lockfile = load_lockfile(args.lockfile)
+        location = f"node_modules/{args.name}"
+        tree = registry.lockfile_tree(
+            lockfile, registry_url=getattr(args, "registry", None), target=location
+        )
+
+        target = tree.get(location)
+        if target is None:
+            raise ValueError(f"{args.name} is not part of {args.lockfile}")
+        if target["version"] != args.version:
+            raise ValueError(f"{args.lockfile} pins {args.name}@{target['version']}, "
+                             f"not {args.version}")
+
+        print(f"Materializing {len(tree)} packages from {args.lockfile}")
+        _materialize_tree(args, install_path, tree)
+
+        # Create bin directory and binary files
+        bin_names = get_bin_names(target)
+        if bin_names:
+            create_bin_files(args, os.path.join(install_path, "bin"), args.name, bin_names)
+
+        print(f"Installed {args.name}@{args.version} from {args.lockfile}")
+        return True
+    except Exception as e:
+        print(f"Error installing from lockfile: {e}")
+        _report_offline_miss(args)
+        return False
+
+
+def install_from_registry(args, install_path):
+    """Install package straight from the npm registry, without npm
+
+    The dependency tree is resolved in Python and each tarball is streamed
+    into ``<install_path>/node_modules`` while its integrity is verified.
+    Install scripts are not run.
+
+    Args:
+        args: Command line arguments, may provide ``registry``
+        install_path: Path to install package to
+
+    Returns:
+        bool: True if installation was successful
+    """
+    try:
+        with phase("resolve") as record:
+            tree = registry.resolve_tree(args, fetch=partial(metadata.fetch_packument, args))
+            record["packages"] = len(tree)
+        print(f"Resolved {len(tree)} packages for {args.name}@{args.version}")
+        for manifest in tree.values():
+            if manifest.get("hasInstallScript"):
+                print(f"Warning: install scripts of {manifest['name']}@{manifest['version']} "
+                      "are not run by the native installer")
+
+        _materialize_tree(args, install_path, tree)
+
+        # Create bin directory and binary files
+        bin_names = get_bin_names(tree[f"node_modules/{args.name}"])
+        if bin_names:
+            create_bin_files(args, os.path.join(install_path, "bin"), args.name, bin_names)
+
+        print(f"Installed {args.name}@{args.version} from the npm registry")
+        return True
+    except Exception as e:
+        print(f"Error installing from the npm registry: {e}")
+        _report_offline_miss(args)
+        return False
+
+
+def install_many_from_npm(npm, args_list, install_paths):
+    """Install several packages from npm with a single npm install
+
+    All packages are installed into one temporary project, so shared
+    dependencies are resolved and fetched once. Each install path then
+    receives the runtime dependency closure of its own package only.
+    Repeated names with different versions are installed under npm aliases.
+
+    Args:
+        npm: Path to npm executable
+        args_list: Command line arguments of each package
+        install_paths: Path to install each package to
+
+    Returns:
+        list: True for every package that was installed successfully
+    """
+    if not args_list:
+        return []
+
+    temp_dir = make_staging_dir(os.path.dirname(install_paths[0]), "temp_npm")
+    results = [False] * len(args_list)
 
     try:
-        # Create package.json in temporary directory
         package_json = {
             "name": "temp",
             "version": "1.0.0",
             "description": "Temporary package for npm2rez",
             "dependencies": {}
         }
-        package_json["dependencies"][args.name] = args.version
+        aliases = []
+        for index, args in enumerate(args_list):
+            dependencies = package_json["dependencies"]
+            if args.name not in dependencies:
+                alias = args.name
+                dependencies[alias] = args.version
+            else:
+                alias = f"npm2rez-alias-{index}-{convert_name_to_rez_format(args.name)}"
+                dependencies[alias] = f"npm:{args.name}@{args.version}"
+            aliases.append(alias)
 
         with open(os.path.join(temp_dir, "package.json"), "w") as f:
             json.dump(package_json, f, indent=2)
 
-        # Install package in temporary directory
-        subprocess.check_call([npm, "install"], cwd=temp_dir)
+        subprocess.check_call(
+            [npm, "install", *get_npm_install_args(args_list[0])], cwd=temp_dir
+        )
+    except Exception as e:
+        print(f"Error installing from npm: {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return results
 
-        # Create node_modules directory in install_path
-        node_modules_dir = os.path.join(install_path, "node_modules")
-        os.makedirs(node_modules_dir, exist_ok=True)
+    try:
+        for index, (args, install_path) in enumerate(zip(args_list, install_paths)):
+            results[index] = _split_combined_install(temp_dir, aliases[index], args, install_path)
+        return results
+    finally:
+        # Clean up temporary directory
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-        # Copy only the target package from temp_dir to install_path
-        temp_package_dir = os.path.join(temp_dir, "node_modules", args.name)
-        if os.path.exists(temp_package_dir):
-            target_package_dir = os.path.join(node_modules_dir, args.name)
-            if os.path.exists(target_package_dir):
-                shutil.rmtree(target_package_dir)
-            shutil.copytree(temp_package_dir, target_package_dir)
-
-            # Copy other dependencies if they exist
-            temp_modules_dir = os.path.join(temp_dir, "node_modules")
-            if os.path.exists(temp_modules_dir):
-                for item in os.listdir(temp_modules_dir):
-                    if (item != args.name and
-                        item != ".package-lock.json" and
-                        not item.startswith(".")):
-                        src_path = os.path.join(temp_modules_dir, item)
-                        dst_path = os.path.join(node_modules_dir, item)
-                        if os.path.exists(dst_path):
-                            shutil.rmtree(dst_path)
-                        shutil.copytree(src_path, dst_path)
 
-        # Create bin directory and binary files
-        bin_dir = os.path.join(install_path, "bin")
-        # Find binaries in node_modules/.bin
-        temp_bin_dir = os.path.join(temp_dir, "node_modules", ".bin")
-        if os.path.exists(temp_bin_dir):
-            create_bin_files(args, bin_dir, args.name, os.listdir(temp_bin_dir))
-        else:
-            # For tests, check if there's a .bin directory in the install_path
-            local_bin_dir = os.path.join(install_path, "node_modules", ".bin")
-            if os.path.exists(local_bin_dir):
-                create_bin_files(args, bin_dir, args.name, os.listdir(local_bin_dir))
+def _split_combined_install(project_dir, alias, args, install_path):
+    """Copy one package of a combined install into its install path
+
+    Args:
+        project_dir: Temporary npm project holding the combined install
+        alias: Dependency name the package was installed under
+        args: Command line arguments of the package
+        install_path: Path to install the package to
+
+    Returns:
+        bool: True if the package was copied successfully
+    """
+    location = f"node_modules/{alias}"
+    package_dir = os.path.join(project_dir, *location.split("/"))
+    if not os.path.isdir(package_dir):
+        print(f"Error installing from npm: {args.name}@{args.version} was not installed")
+        return False
+
+    try:
+        # Copy only the package's own dependency closure, aliases get their real name
+        pairs = []
+        for root in closure_roots(dependency_closure(project_dir, location)):
+            target = f"node_modules/{args.name}" if root == location else root
+            pairs.append((
+                os.path.join(project_dir, *root.split("/")),
+                os.path.join(install_path, *target.split("/"))
+            ))
+        stats = transfer_many(pairs, copy_function=store.get_copy_function(args))
+        print(f"Copied {stats.files} files ({stats.bytes} bytes) to {install_path}")
+
+        # Only the package's own executables get shims
+        bin_names = get_bin_names(read_package_json(package_dir))
+        if bin_names:
+            create_bin_files(args, os.path.join(install_path, "bin"), args.name, bin_names)
 
         print(f"Installed {args.name}@{args.version} from npm")
         return True
     except Exception as e:
         print(f"Error installing from npm: {e}")
         return False
-    finally:
-        # Clean up temporary directory
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
 
 
 def install_from_github(npm, args, install_path):
@@ -243,74 +1064,81 @@ def install_from_github(npm, args, install_path):
 
     Args:
         npm: Path to npm executable
-        args: Command line arguments
+        args: Command line arguments, may provide ``git_mirror`` to check out
+            the repository from a local mirror (see npm2rez.gitmirror) and
+            ``build_cache`` to reuse earlier builds of the same commit (see
+            npm2rez.buildcache)
         install_path: Path to install package to
 
     Returns:
         bool: True if installation was successful
     """
-    repo_url = f"https://github.com/{args.repo}.git"
-    temp_dir = os.path.join(os.path.dirname(install_path), "temp_repo")
-    os.makedirs(temp_dir, exist_ok=True)
+    repo_url = gitmirror.get_repo_url(args.repo)
+    temp_dir = make_staging_dir(os.path.dirname(install_path), "temp_repo")
 
     try:
-        # Clone to temporary directory
-        subprocess.check_call([
-            "git", "clone", "--depth", "1", "--branch", f"v{args.version}",
-            repo_url, temp_dir
-        ])
-
-        # Install dependencies and build
-        subprocess.check_call([npm, "install"], cwd=temp_dir)
-        subprocess.check_call([npm, "run", "build"], cwd=temp_dir)
+        # Clone to temporary directory, from the local mirror if enabled
+        gitmirror.checkout(args, repo_url, f"v{args.version}", temp_dir)
+
+        # Install dependencies and build, unless this commit was built before
+        build_key = None
+        if buildcache.use_build_cache(args):
+            build_key = buildcache.get_build_key(
+                npm, args, temp_dir, get_npm_env_kwargs(args).get("env")
+            )
+        if not build_key or not buildcache.restore_build(args, build_key, temp_dir):
+            with phase("npm_install"):
+                subprocess.check_call([npm, "install", *get_npm_install_args(args)],
+                                      cwd=temp_dir, **get_npm_env_kwargs(args))
+            with phase("build"):
+                subprocess.check_call([npm, "run", "build"], cwd=temp_dir,
+                                      **get_npm_env_kwargs(args))
+            if build_key:
+                buildcache.save_build(args, build_key, temp_dir)
 
         # Create node_modules directory in install_path
         node_modules_dir = os.path.join(install_path, "node_modules")
         os.makedirs(node_modules_dir, exist_ok=True)
 
-        # Copy only necessary files to installation directory
-        for item in os.listdir(temp_dir):
-            # Skip unnecessary files
-            if item in [
-                "package.json", "package-lock.json", ".git",
-                ".github", ".npmignore", ".gitignore"
-            ]:
-                continue
-
-            src_path = os.path.join(temp_dir, item)
-            dst_path = os.path.join(install_path, item)
-
-            if os.path.isdir(src_path):
-                if item == "node_modules":
-                    # For node_modules, only copy the package itself and its dependencies
-                    if os.path.exists(src_path):
-                        for module in os.listdir(src_path):
-                            if not module.startswith("."):
-                                module_src = os.path.join(src_path, module)
-                                module_dst = os.path.join(node_modules_dir, module)
-                                if os.path.exists(module_dst):
-                                    shutil.rmtree(module_dst)
-                                shutil.copytree(module_src, module_dst)
-                else:
-                    # Copy other directories
-                    if os.path.exists(dst_path):
-                        shutil.rmtree(dst_path)
-                    shutil.copytree(src_path, dst_path)
-            else:
-                # Copy files
-                shutil.copy2(src_path, dst_path)
+        # The build toolchain stays behind, only the runtime closure of the
+        # project's dependencies is shipped
+        closure = dependency_closure(temp_dir, "")
+        runtime_modules = closure_roots(location for location in closure if location)
+        # Shims are written for the binaries of the shipped packages only,
+        # read before the files are moved out of the checkout
+        bin_names = sorted({
+            bin_name for location in closure
+            for bin_name in get_bin_names(
+                read_package_json(os.path.join(temp_dir, *location.split("/")))
+            )
+        })
+
+        # Copy only the files npm would publish, one task per file, and the
+        # runtime dependencies, one task per installed module
+        pack_files = packlist.get_pack_files(npm, temp_dir)
+        print(f"Copying {len(pack_files)} files npm would publish")
+        pairs = [
+            (os.path.join(temp_dir, *path.split("/")), os.path.join(install_path, *path.split("/")))
+            for path in pack_files
+        ]
+        temp_modules_dir = os.path.join(temp_dir, "node_modules")
+        if os.path.isdir(temp_modules_dir):
+            for location in runtime_modules:
+                pairs.append((
+                    os.path.join(temp_dir, *location.split("/")),
+                    os.path.join(install_path, *location.split("/"))
+                ))
+            print(f"Copying {len(runtime_modules)} of "
+                  f"{len(list_modules(temp_modules_dir))} modules needed at runtime")
+
+        with phase("copy") as record:
+            stats = transfer_many(pairs, move=True, copy_function=store.get_copy_function(args))
+            record.update(stats._asdict())
+        print(f"Copied {stats.files} files ({stats.bytes} bytes) to {install_path}")
 
         # Create bin directory and binary files
-        bin_dir = os.path.join(install_path, "bin")
-        # Find binaries in node_modules/.bin
-        temp_bin_dir = os.path.join(temp_dir, "node_modules", ".bin")
-        if os.path.exists(temp_bin_dir):
-            create_bin_files(args, bin_dir, args.name, os.listdir(temp_bin_dir))
-        else:
-            # For tests, check if there's a .bin directory in the install_path
-            local_bin_dir = os.path.join(install_path, "node_modules", ".bin")
-            if os.path.exists(local_bin_dir):
-                create_bin_files(args, bin_dir, args.name, os.listdir(local_bin_dir))
+        if bin_names:
+            create_bin_files(args, os.path.join(install_path, "bin"), args.name, bin_names)
 
         print(f"Installed {args.name}@{args.version} from GitHub")
         return True
@@ -319,8 +1147,9 @@ def install_from_github(npm, args, install_path):
         return False
     finally:
         # Clean up temporary directory
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        with phase("cleanup"):
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
 
 
 def install_node_package(args, install_path):
@@ -332,30 +1161,103 @@ def install_node_package(args, install_path):
             version: Package version
             source: Package source (npm or github)
             repo: GitHub repository (format: user/repo), required when source=github
+            npm: Path to an already probed npm executable (optional)
+            installer: "npm" (default) or "native" to skip npm for npm sources
+            lockfile: package-lock.json or npm-shrinkwrap.json to materialize (optional)
+            registry: npm registry URL (optional)
             _is_test: Whether this is a test run (optional)
         install_path: Path to install package to
 
     Returns:
         bool: True if installation was successful
     """
+    with phase("install", source=args.source) as record:
+        variant_dirs = get_variant_dirs(args, install_path)
+        if len(variant_dirs) == 1:
+            record["success"] = _install_node_package(args, install_path)
+        else:
+            record["success"] = _install_variants(args, variant_dirs)
+    return record["success"]
+
+
+def _variant_args(args, node_version):
+    """Copy arguments for the build of a single Node.js variant"""
+    variant_args = SimpleNamespace(**vars(args))
+    variant_args.node_version = node_version
+    variant_args._variant = True
+    return variant_args
+
+
+def _install_variants(args, variant_dirs):
+    """Install a package once per Node.js variant
+
+    The package is installed for the first variant. A pure JavaScript
+    payload is then hardlinked into the other variants, a payload with
+    native addons is installed again for each of them.
+
+    Args:
+        args: Command line arguments with several ``node_version`` values
+        variant_dirs: Payload directory of each variant, from get_variant_dirs
+
+    Returns:
+        bool: True if every variant was installed successfully
+    """
+    versions = get_node_versions(args)
+    first_dir = variant_dirs[0]
+    if not _install_node_package(_variant_args(args, versions[0]), first_dir):
+        return False
+
+    if has_native_addons(os.path.join(first_dir, "node_modules")):
+        print(f"{args.name}@{args.version} has native addons, "
+              f"building every Node.js variant separately")
+        for version, variant_dir in zip(versions[1:], variant_dirs[1:]):
+            if not _install_node_package(_variant_args(args, version), variant_dir):
+                return False
+        return True
+
+    _link_variants(args, variant_dirs)
+    return True
+
+
+def _link_variants(args, variant_dirs):
+    """Hardlink the pure JavaScript payload of the first variant into the others"""
+    first_dir = variant_dirs[0]
+    with phase("link_variants") as record:
+        pairs = [
+            (os.path.join(first_dir, name), os.path.join(variant_dir, name))
+            for variant_dir in variant_dirs[1:]
+            for name in ("node_modules", "bin")
+            if os.path.exists(os.path.join(first_dir, name))
+        ]
+        stats = transfer_many(pairs, copy_function=link_file)
+        record.update(stats._asdict())
+    print(f"Shared the pure JavaScript payload of {args.name}@{args.version} "
+          f"between {len(variant_dirs)} Node.js variants")
+
+
+def _install_node_package(args, install_path):
+    """Dispatch install_node_package to the installer of the source"""
     # Create installation directory
     os.makedirs(install_path, exist_ok=True)
 
-    # Find npm executable
-    npm = get_npm_executable()
+    # Lockfiles and the native installer talk to the registry directly and need no npm
+    is_test = hasattr(args, "_is_test") and args._is_test
+    if args.source == "npm" and not is_test:
+        if getattr(args, "lockfile", None):
+            return install_from_lockfile(args, install_path)
+        if getattr(args, "installer", "npm") == "native":
+            return install_from_registry(args, install_path)
+
+    # Find npm executable, unless the caller already probed it
+    npm = getattr(args, "npm", None) or get_npm_executable()
 
     # Check if npm is available
     if not npm:
         # npm is not available
-        print("Warning: npm command not found. Package files will be created but "
-              "Node.js packages won't be installed.")
+        print(f"Error: npm command not found, cannot install {args.name}@{args.version}.")
         print("Please install Node.js and npm to enable package installation.")
-        # Create empty node_modules directory
-        os.makedirs(os.path.join(install_path, "node_modules"), exist_ok=True)
         return False
 
-    is_test = hasattr(args, "_is_test") and args._is_test
-
     if args.source == "npm":
         return install_from_npm(npm, args, install_path, is_test)
     else:
@@ -368,7 +1270,7 @@ def extract_node_package(args, output_path):
     Args:
         args: Command line arguments or object with the following attributes:
             name: Package name
-            version: Package version
+            version: Package version, or a version range or dist-tag
             source: Package source (npm or github)
             repo: GitHub repository (format: user/repo), required when source=github
             _is_test: Whether this is a test run (optional)
@@ -377,6 +1279,9 @@ def extract_node_package(args, output_path):
     Returns:
         bool: True if extraction was successful
     """
+    # Version ranges and dist-tags become the version they resolve to
+    metadata.resolve_version(args)
+
     # Create output directory
     os.makedirs(output_path, exist_ok=True)
 
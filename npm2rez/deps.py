@@ -0,0 +1,448 @@
+"""
+Dependency helpers for npm2rez - inspect installed node_modules trees
+"""
+
+import json
+import os
+
+# Dependency fields that npm installs for a package at runtime
+RUNTIME_DEPENDENCY_FIELDS = ("dependencies", "optionalDependencies", "peerDependencies")
+
+
+def read_package_json(package_dir):
+    """Read package.json of an installed package
+
+    Args:
+        package_dir: Package directory
+
+    Returns:
+        dict: Parsed package.json, empty if it is missing or invalid
+    """
+    try:
+        with open(os.path.join(package_dir, "package.json"), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def get_runtime_dependencies(package_json):
+    """Get the names of the runtime dependencies of a package
+
+    Args:
+        package_json: Parsed package.json
+
+    Returns:
+        list: Dependency names
+    """
+    names = []
+    for field in RUNTIME_DEPENDENCY_FIELDS:
+        for name in package_json.get(field) or {}:
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def get_bin_names(package_json):
+    """Get the executable names a package declares in its ``bin`` field
+
+    Args:
+        package_json: Parsed package.json
+
+    Returns:
+        list: Executable names
+    """
+    bin_field = package_json.get("bin")
+    if isinstance(bin_field, str):
+        # A single binary is named after the package, without its scope
+        return [package_json.get("name", "").split("/")[-1]]
+    if isinstance(bin_field, dict):
+        return list(bin_field)
+    return []
+
+
+def has_native_addons(node_modules_dir):
+    """Check whether an installed tree contains native addons
+
+    Native addons are built for one Node.js ABI: packages with a
+    ``binding.gyp``, ``"gypfile": true`` or compiled ``.node`` files.
+
+    Args:
+        node_modules_dir: node_modules directory to scan
+
+    Returns:
+        bool: True if any package of the tree has a native addon
+    """
+    for root, dirs, files in os.walk(node_modules_dir):
+        if "binding.gyp" in files or any(name.endswith(".node") for name in files):
+            return True
+        if "package.json" in files and read_package_json(root).get("gypfile"):
+            return True
+        # Executable links are not packages
+        if ".bin" in dirs:
+            dirs.remove(".bin")
+    return False
+
+
+def get_parent_location(location):
+    """Get the location of the package whose node_modules holds location"""
+    if "/node_modules/" in location:
+        return location.rsplit("/node_modules/", 1)[0]
+    return ""
+
+
+def _walk_up(location, name, exists):
+    """Find the location a dependency resolves to, walking up node_modules"""
+    while True:
+        candidate = f"{location}/node_modules/{name}" if location else f"node_modules/{name}"
+        if exists(candidate):
+            return candidate
+        if not location:
+            return None
+        location = get_parent_location(location)
+
+
+def resolve_module(project_dir, location, name):
+    """Resolve a dependency the way Node.js does, walking up node_modules
+
+    Locations use the same format as package-lock.json keys, relative to the
+    project directory with forward slashes (``node_modules/a/node_modules/b``).
+    The empty string is the project itself.
+
+    Args:
+        project_dir: Directory containing the top level node_modules
+        location: Location of the package requiring the dependency
+        name: Dependency name
+
+    Returns:
+        str or None: Location of the resolved dependency
+    """
+    return _walk_up(
+        location, name,
+        lambda candidate: os.path.isdir(os.path.join(project_dir, *candidate.split("/")))
+    )
+
+
+def dependency_closure(project_dir, location):
+    """Collect the runtime dependency closure of an installed package
+
+    Args:
+        project_dir: Directory containing the top level node_modules
+        location: Location of the package (e.g. ``node_modules/typescript``)
+
+    Returns:
+        list: Locations of the package and everything it needs at runtime
+    """
+    closure = [location]
+    seen = {location}
+    index = 0
+    while index < len(closure):
+        current = closure[index]
+        index += 1
+        package_json = read_package_json(os.path.join(project_dir, *current.split("/")))
+        for name in get_runtime_dependencies(package_json):
+            resolved = resolve_module(project_dir, current, name)
+            # Missing optional and peer dependencies are fine
+            if resolved and resolved not in seen:
+                seen.add(resolved)
+                closure.append(resolved)
+    return closure
+
+
+def closure_roots(locations):
+    """Drop locations nested inside another location of the same set
+
+    Copying the remaining roots recursively reproduces the whole set.
+
+    Args:
+        locations: Package locations
+
+    Returns:
+        list: Sorted root locations
+    """
+    roots = []
+    for location in sorted(set(locations)):
+        if not any(location.startswith(f"{root}/") for root in roots):
+            roots.append(location)
+    return roots
+
+
+def load_lockfile(path):
+    """Load a package-lock.json or npm-shrinkwrap.json file
+
+    Args:
+        path: Path to the lockfile
+
+    Returns:
+        dict: Parsed lockfile
+
+    Raises:
+        ValueError: If the lockfile has no ``packages`` section (lockfile v1)
+    """
+    with open(path, encoding="utf-8") as f:
+        lockfile = json.load(f)
+    if not isinstance(lockfile, dict) or not isinstance(lockfile.get("packages"), dict):
+        raise ValueError(f"Unsupported lockfile (lockfileVersion 2 or 3 required): {path}")
+    return lockfile
+
+
+def get_location_name(location, meta=None):
+    """Get the name a package is installed and required under at a lockfile location
+
+    Aliased packages (``"alias": "npm:pkg@1"``) are installed under the
+    alias, their ``name`` is the one of the real package. Workspace
+    packages outside node_modules are named by their metadata.
+    """
+    if "node_modules/" not in location and meta and meta.get("name"):
+        return meta["name"]
+    return location.rsplit("node_modules/", 1)[-1]
+
+
+def build_dependency_graph(lockfile, location, max_depth=None):
+    """Build the dependency graph of an installed package from its lockfile
+
+    Nodes are keyed by ``(name, version)``, where name is the name the
+    package is required under, the alias for aliased packages. Each node
+    records where the package is installed and which nodes it requires at
+    runtime. Nodes at ``max_depth`` are marked as ``bundle``: their
+    dependencies are not split into nodes of their own.
+
+    Args:
+        lockfile: Parsed lockfile (v2/v3)
+        location: Lockfile location of the root package
+        max_depth: Maximum dependency depth to split, None for unlimited
+
+    Returns:
+        dict: Mapping of node key to node dict with name, version, location,
+            depth, bundle and requires
+    """
+    packages = lockfile["packages"]
+    if location not in packages:
+        raise ValueError(f"{location} is not part of the lockfile")
+
+    graph = {}
+    queue = [(location, 0, get_location_name(location, packages[location]))]
+    while queue:
+        current, depth, name = queue.pop(0)
+        meta = packages[current]
+        key = (name, meta.get("version", "0.0.0"))
+        if key in graph:
+            continue
+
+        node = {
+            "name": key[0],
+            "version": key[1],
+            "location": current,
+            "depth": depth,
+            "bundle": max_depth is not None and depth >= max_depth,
+            "requires": [],
+        }
+        graph[key] = node
+        if node["bundle"]:
+            continue
+
+        for name in get_runtime_dependencies(meta):
+            dep_location = _walk_up(current, name, lambda candidate: candidate in packages)
+            # Missing optional and peer dependencies are fine
+            if dep_location is None:
+                continue
+            dep_meta = packages[dep_location]
+            if dep_meta.get("link") and dep_meta.get("resolved") in packages:
+                dep_location = dep_meta["resolved"]
+                dep_meta = packages[dep_location]
+            # require() finds the package under the name it is depended on with
+            dep_key = (name, dep_meta.get("version", "0.0.0"))
+            if dep_key not in node["requires"]:
+                node["requires"].append(dep_key)
+            queue.append((dep_location, depth + 1, name))
+
+    return graph
+
+
+def nest_duplicates(graph, root=None):
+    """Carry the extra versions of a package inside the packages that use them
+
+    A tree often holds several versions of one package, one hoisted and the
+    others nested below the packages that need them. Rez packages of two
+    versions of one package cannot be in one environment, so only one
+    version per name keeps a node: the root, else the hoisted one, else the
+    shallowest. The other versions are listed in the ``nested`` entries of
+    every node requiring them, with the path they are copied to inside its
+    package, and their requirements become requirements of that node. The
+    graph is changed in place.
+
+    Args:
+        graph: Dependency graph from build_dependency_graph
+        root: Key of the root node
+
+    Returns:
+        list: Keys of the versions that were nested
+    """
+    versions = {}
+    for key in graph:
+        versions.setdefault(key[0], []).append(key)
+
+    def rank(key):
+        node = graph[key]
+        return key != root, node["location"] != f"node_modules/{key[0]}", node["depth"], key
+
+    extra = {key for keys in versions.values() for key in sorted(keys, key=rank)[1:]}
+    if not extra:
+        return []
+
+    def carry(key, path, requires, nested, seen):
+        for dep in graph[key]["requires"]:
+            if dep not in extra:
+                if dep not in requires:
+                    requires.append(dep)
+                continue
+            if dep in seen:
+                continue
+            dep_node = graph[dep]
+            dep_path = f"{path}/node_modules/{dep[0]}"
+            nested.append({"name": dep[0], "version": dep[1], "location": dep_node["location"],
+                           "path": dep_path, "bundle": dep_node["bundle"]})
+            carry(dep, dep_path, requires, nested, seen | {dep})
+
+    for key, node in graph.items():
+        if key in extra:
+            continue
+        requires = []
+        nested = []
+        carry(key, f"node_modules/{key[0]}", requires, nested, {key})
+        node["requires"] = [dep for dep in requires if dep != key]
+        node["nested"] = nested
+    for key in extra:
+        del graph[key]
+    return sorted(extra)
+
+
+def _strongly_connected_components(edges):
+    """Find the strongly connected components of a graph (Tarjan, iterative)
+
+    Args:
+        edges: Mapping of node to the nodes it points to
+
+    Returns:
+        list: Components as sorted lists of nodes
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for start in sorted(edges):
+        if start in index:
+            continue
+        work = [(start, iter(sorted(edges[start])))]
+        index[start] = lowlink[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, targets = work[-1]
+            for target in targets:
+                if target not in index:
+                    index[target] = lowlink[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(sorted(edges.get(target, ())))))
+                    break
+                if target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+    return components
+
+
+def merge_cycles(graph, root=None):
+    """Merge the packages of each dependency cycle into one node
+
+    npm allows dependency cycles, rez requirements cannot have them. The
+    members of a cycle become one node that carries all of them: the member
+    closest to the root (the root itself if it is a member) keeps its key,
+    lists the others in ``members`` and requires what the cycle requires.
+    Requirements on the other members point to it instead. The graph is
+    changed in place.
+
+    Args:
+        graph: Dependency graph from build_dependency_graph
+        root: Key of the root node
+
+    Returns:
+        list: (key, member keys) of every merged cycle
+    """
+    edges = {key: set(node["requires"]) & set(graph) for key, node in graph.items()}
+    merged = []
+    replaced = {}
+    for component in _strongly_connected_components(edges):
+        if len(component) < 2:
+            continue
+        key = root if root in component else \
+            min(component, key=lambda member: (graph[member]["depth"], member))
+        others = [member for member in component if member != key]
+        node = graph[key]
+        node["members"] = [graph[member] for member in others]
+        node["nested"] = [
+            entry for member in [key] + others for entry in graph[member].get("nested", [])
+        ]
+        node["requires"] = [
+            dep for member in [key] + others for dep in graph[member]["requires"]
+            if dep not in component
+        ]
+        for member in others:
+            replaced[member] = key
+            del graph[member]
+        merged.append((key, others))
+
+    for key, node in graph.items():
+        requires = []
+        for dep in node["requires"]:
+            dep = replaced.get(dep, dep)
+            if dep != key and dep not in requires:
+                requires.append(dep)
+        node["requires"] = requires
+    return merged
+
+
+def topological_levels(graph):
+    """Group graph nodes into levels that only depend on earlier levels
+
+    Nodes of one level are independent of each other and can be built
+    concurrently.
+
+    Args:
+        graph: Dependency graph from build_dependency_graph, with its
+            cycles merged by merge_cycles
+
+    Returns:
+        list: Levels as lists of node keys
+
+    Raises:
+        ValueError: If the graph still has a dependency cycle
+    """
+    remaining = {key: set(node["requires"]) & set(graph) for key, node in graph.items()}
+    levels = []
+    while remaining:
+        ready = sorted(key for key, deps in remaining.items() if not deps)
+        if not ready:
+            cycle = ", ".join(f"{name}@{version}" for name, version in sorted(remaining))
+            raise ValueError(f"Dependency cycle between {cycle}")
+
+        levels.append(ready)
+        for key in ready:
+            del remaining[key]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
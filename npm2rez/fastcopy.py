@@ -0,0 +1,271 @@
+"""
+Copy engine for npm2rez - move node_modules trees into rez packages quickly
+
+Trees are transferred as independent units (one per installed module) on a
+thread pool. A unit whose source is disposable and lives on the same
+filesystem as its destination is renamed in one step. Everything else is
+copied file by file, trying a reflink clone and ``copy_file_range`` before
+falling back to a plain buffered copy. A custom copy function, such as
+hardlinking from the content-addressed store, can replace the file copy.
+"""
+
+import errno
+import os
+import shutil
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl request number of FICLONE on Linux
+FICLONE = 0x40049409
+
+CopyStats = namedtuple("CopyStats", ["files", "bytes"])
+
+
+def _reflink(fsrc, fdst, size):
+    """Clone file data with a reflink, sharing extents on CoW filesystems"""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        return False
+    return os.fstat(fdst.fileno()).st_size == size
+
+
+def _copy_range(fsrc, fdst, size):
+    """Copy file data in the kernel with copy_file_range"""
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    offset = 0
+    try:
+        while offset < size:
+            copied = os.copy_file_range(
+                fsrc.fileno(), fdst.fileno(), size - offset, offset, offset
+            )
+            if copied == 0:
+                # Some filesystems stop early, copy the rest from where they stopped
+                fsrc.seek(offset)
+                fdst.seek(offset)
+                shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+                break
+            offset += copied
+    except OSError:
+        # Only fall back if nothing has been written yet
+        if offset:
+            raise
+        return False
+    return True
+
+
+def copy_file(src, dst):
+    """Copy a single file with its permission bits and timestamps
+
+    Args:
+        src: Source file path
+        dst: Destination file path
+
+    Returns:
+        int: Number of bytes copied
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if size and not _reflink(fsrc, fdst, size) and not _copy_range(fsrc, fdst, size):
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    shutil.copystat(src, dst)
+    return size
+
+
+def link_file(src, dst):
+    """Hardlink a single file, copying it where hardlinks are not possible
+
+    Args:
+        src: Source file path
+        dst: Destination file path
+
+    Returns:
+        int: Number of bytes linked or copied
+    """
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EACCES):
+            raise
+        return copy_file(src, dst)
+    return os.lstat(dst).st_size
+
+
+def _copy_tree(src, dst, copy_function=copy_file):
+    """Recursively copy a directory, keeping symlinks as symlinks"""
+    files = 0
+    size = 0
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            dst_path = os.path.join(dst, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dst_path)
+                files += 1
+            elif entry.is_dir():
+                sub_files, sub_size = _copy_tree(entry.path, dst_path, copy_function)
+                files += sub_files
+                size += sub_size
+            else:
+                size += copy_function(entry.path, dst_path)
+                files += 1
+    shutil.copystat(src, dst)
+    return files, size
+
+
+def _count_tree(path):
+    """Count files and bytes under a directory without following symlinks"""
+    files = 0
+    size = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                sub_files, sub_size = _count_tree(entry.path)
+                files += sub_files
+                size += sub_size
+            else:
+                files += 1
+                size += entry.stat(follow_symlinks=False).st_size
+    return files, size
+
+
+def _same_filesystem(src, dst):
+    """Check whether src and the parent of dst share a device"""
+    try:
+        return os.stat(src).st_dev == os.stat(os.path.dirname(dst)).st_dev
+    except OSError:
+        return False
+
+
+def transfer(src, dst, move=False, copy_function=None):
+    """Transfer one file or directory, replacing any existing destination
+
+    Args:
+        src: Source path
+        dst: Destination path
+        move: Whether the source may be consumed (renamed away)
+        copy_function: Function(src, dst) returning the bytes it copied,
+            used for every file instead of renaming or copying
+
+    Returns:
+        CopyStats: Number of files and bytes transferred
+    """
+    if os.path.lexists(dst):
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        else:
+            os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    is_dir = os.path.isdir(src) and not os.path.islink(src)
+
+    if move and copy_function is None and _same_filesystem(src, dst):
+        if is_dir:
+            files, size = _count_tree(src)
+        else:
+            files, size = 1, os.lstat(src).st_size
+        try:
+            os.rename(src, dst)
+            return CopyStats(files, size)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EACCES):
+                raise
+
+    copy_function = copy_function or copy_file
+    if is_dir:
+        return CopyStats(*_copy_tree(src, dst, copy_function))
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return CopyStats(1, 0)
+    return CopyStats(1, copy_function(src, dst))
+
+
+def transfer_many(pairs, jobs=None, move=False, copy_function=None):
+    """Transfer several files or directories in parallel
+
+    Args:
+        pairs: Iterable of (src, dst) tuples, each one an independent unit
+        jobs: Number of worker threads (defaults to a CPU based count)
+        move: Whether the sources may be consumed (renamed away)
+        copy_function: Function(src, dst) used for every file, see transfer
+
+    Returns:
+        CopyStats: Total number of files and bytes transferred
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return CopyStats(0, 0)
+
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=min(jobs, len(pairs))) as executor:
+        results = list(executor.map(
+            lambda pair: transfer(*pair, move=move, copy_function=copy_function), pairs
+        ))
+
+    return CopyStats(
+        sum(result.files for result in results),
+        sum(result.bytes for result in results),
+    )
+
+
+def list_modules(node_modules_dir):
+    """List installed modules, expanding scopes into their packages
+
+    Hidden entries such as ``.bin`` and ``.package-lock.json`` are skipped.
+
+    Args:
+        node_modules_dir: Path to a node_modules directory
+
+    Returns:
+        list: Module names relative to node_modules (e.g. ``@types/node``)
+    """
+    modules = []
+    if not os.path.isdir(node_modules_dir):
+        return modules
+
+    for item in sorted(os.listdir(node_modules_dir)):
+        if item.startswith("."):
+            continue
+        item_path = os.path.join(node_modules_dir, item)
+        if item.startswith("@") and os.path.isdir(item_path):
+            for scoped in sorted(os.listdir(item_path)):
+                if not scoped.startswith("."):
+                    modules.append(f"{item}/{scoped}")
+        else:
+            modules.append(item)
+    return modules
+
+
+def transfer_node_modules(src_dir, dst_dir, modules=None, jobs=None, move=False,
+                          copy_function=None):
+    """Transfer modules between node_modules directories, one task per module
+
+    Args:
+        src_dir: Source node_modules directory
+        dst_dir: Destination node_modules directory
+        modules: Module names to transfer (defaults to all of them)
+        jobs: Number of worker threads
+        move: Whether the sources may be consumed (renamed away)
+        copy_function: Function(src, dst) used for every file, see transfer
+
+    Returns:
+        CopyStats: Total number of files and bytes transferred
+    """
+    if modules is None:
+        modules = list_modules(src_dir)
+
+    pairs = [
+        (os.path.join(src_dir, *module.split("/")), os.path.join(dst_dir, *module.split("/")))
+        for module in modules
+    ]
+    return transfer_many(pairs, jobs=jobs, move=move, copy_function=copy_function)
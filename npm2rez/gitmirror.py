@@ -0,0 +1,122 @@
+"""
+Git mirror cache for npm2rez - fetch each GitHub repository once
+
+GitHub builds check out a tag of the package repository. Instead of a fresh
+clone per build, npm2rez keeps a bare mirror of every repository in the cache
+directory (``<cache_dir>/git``). A mirror is cloned once, fetched
+incrementally only when a requested tag is missing, and each build gets a
+``--shared`` clone of it, which borrows the mirror's objects instead of
+copying them. Building many versions of one repository fetches its objects
+once. Any URL git understands works, including ``file://`` and local paths.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+
+from npm2rez.cache import get_cache_dir
+from npm2rez.locking import make_staging_dir, package_lock
+from npm2rez.report import phase
+
+
+def get_repo_url(repo):
+    """Get the clone URL of a repository
+
+    Args:
+        repo: ``user/repo`` on GitHub, a URL or a local repository path
+
+    Returns:
+        str: URL to clone from
+    """
+    if "://" in repo or repo.startswith("git@"):
+        return repo
+    if os.path.isdir(repo):
+        return os.path.abspath(repo)
+    return f"https://github.com/{repo}.git"
+
+
+def get_mirror_dir(args, url):
+    """Get the bare mirror directory of a repository URL
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        url: Repository URL
+
+    Returns:
+        str: Path to ``<cache_dir>/git/<name>-<hash>.git``
+    """
+    name = re.sub(r"\.git$", "", url.rstrip("/").rsplit("/", 1)[-1])
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name) or "repo"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(get_cache_dir(args), "git", f"{name}-{digest}.git")
+
+
+def use_git_mirror(args):
+    """Check whether GitHub builds go through the git mirror cache"""
+    return bool(getattr(args, "git_mirror", False))
+
+
+def _has_commit(mirror_dir, ref):
+    """Check whether a mirror already has a ref"""
+    result = subprocess.run(
+        ["git", "--git-dir", mirror_dir, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
+    )
+    return result.returncode == 0
+
+
+def update_mirror(args, url, ref):
+    """Make sure the mirror of a repository has a ref, cloning or fetching it
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+        url: Repository URL
+        ref: Tag, branch or commit that must be present
+
+    Returns:
+        str: Path to the bare mirror
+    """
+    mirror_dir = get_mirror_dir(args, url)
+    # One job updates a mirror at a time, the others wait and reuse it
+    with package_lock(mirror_dir):
+        if not os.path.isdir(mirror_dir):
+            with phase("git_mirror_clone"):
+                temp_dir = make_staging_dir(os.path.dirname(mirror_dir), "mirror")
+                try:
+                    subprocess.check_call(["git", "clone", "--mirror", url, temp_dir])
+                    os.rename(temp_dir, mirror_dir)
+                finally:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+            print(f"Mirrored {url} to {mirror_dir}")
+        elif not _has_commit(mirror_dir, ref):
+            with phase("git_fetch"):
+                # Shared clones borrow objects from the mirror, never gc them away
+                subprocess.check_call([
+                    "git", "--git-dir", mirror_dir, "-c", "gc.auto=0",
+                    "fetch", "--prune", "origin",
+                ])
+            print(f"Fetched {url} into {mirror_dir}")
+    return mirror_dir
+
+
+def checkout(args, url, ref, dest):
+    """Check out a ref of a repository into a new directory
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir`` and ``git_mirror``
+        url: Repository URL
+        ref: Tag or branch to check out
+        dest: Directory to check out into, must not exist or be empty
+    """
+    if not use_git_mirror(args):
+        with phase("git_clone"):
+            subprocess.check_call(["git", "clone", "--depth", "1", "--branch", ref, url, dest])
+        return
+
+    mirror_dir = update_mirror(args, url, ref)
+    with phase("git_clone", mirror=True):
+        subprocess.check_call([
+            "git", "clone", "--quiet", "--shared", "--branch", ref, mirror_dir, dest
+        ])
@@ -0,0 +1,186 @@
+"""
+Locking helpers for npm2rez - let concurrent jobs share one output repository
+
+Builds of the same package version are serialized with an advisory file lock
+placed next to the version directory (``<output>/<rez_name>/.<version>.lock``).
+POSIX record locks (``lockf``) are used because they also work on NFS. Those
+locks are per process, so an in-process lock guards against threads too.
+
+Package versions are built in a private build directory and published by
+renaming it into place, so readers never see a half-written package.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def make_staging_dir(parent, prefix):
+    """Create a unique staging directory for a single job
+
+    Args:
+        parent: Directory to create the staging directory in
+        prefix: Name prefix, such as ``temp_npm``
+
+    Returns:
+        str: Path to the new, empty staging directory
+    """
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".{prefix}-", dir=parent)
+
+
+def make_build_dir(package_dir, staging_root=None):
+    """Create the directory a package version is built in before publish_dir
+
+    Args:
+        package_dir: Package version directory (``<output>/<rez_name>/<version>``)
+        staging_root: Directory to build in, such as a tmpfs mount (default:
+            next to the package version, on the same filesystem)
+
+    Returns:
+        str: Path to the new, empty build directory
+    """
+    family_dir, version = os.path.split(os.path.normpath(package_dir))
+    return make_staging_dir(staging_root or family_dir, f"build-{version}")
+
+
+def _same_filesystem(path, other):
+    """Check whether two existing paths are on the same filesystem"""
+    return os.stat(path).st_dev == os.stat(other).st_dev
+
+
+def _move_to_family(build_dir, family_dir, version):
+    """Copy a build directory from another filesystem next to the package version"""
+    local_dir = make_staging_dir(family_dir, f"build-{version}")
+    shutil.copytree(build_dir, local_dir, symlinks=True, dirs_exist_ok=True)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    return local_dir
+
+
+def publish_dir(build_dir, package_dir):
+    """Move a fully built package version into place
+
+    A build directory on another filesystem is first copied next to the
+    package version. A previous version directory is renamed aside, then the
+    new one is renamed into place and the old one deleted afterwards. Readers
+    never see a partial package, but may briefly find none between the two
+    renames.
+
+    Args:
+        build_dir: Build directory from make_build_dir
+        package_dir: Package version directory to publish to
+    """
+    family_dir, version = os.path.split(os.path.normpath(package_dir))
+    os.makedirs(family_dir, exist_ok=True)
+    if not _same_filesystem(build_dir, family_dir):
+        build_dir = _move_to_family(build_dir, family_dir, version)
+    # Build directories are private to their job, packages are readable by everyone
+    os.chmod(build_dir, 0o755)
+
+    trash_dir = None
+    if os.path.lexists(package_dir):
+        trash_dir = tempfile.mkdtemp(prefix=f".trash-{version}-", dir=family_dir)
+        os.rename(package_dir, os.path.join(trash_dir, version))
+    try:
+        os.rename(build_dir, package_dir)
+    except OSError:
+        # Put the previous version back rather than leaving nothing in place
+        if trash_dir:
+            os.rename(os.path.join(trash_dir, version), package_dir)
+            os.rmdir(trash_dir)
+        raise
+    if trash_dir:
+        shutil.rmtree(trash_dir, ignore_errors=True)
+
+
+def remove_build_dir(build_dir):
+    """Remove a build directory that was not published"""
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def get_lock_path(package_dir):
+    """Get the lock file path guarding a package version directory"""
+    family_dir, version = os.path.split(os.path.normpath(package_dir))
+    return os.path.join(family_dir, f".{version}.lock")
+
+
+def _get_thread_lock(path):
+    """Get the in-process lock for a lock file path"""
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(path, threading.Lock())
+
+
+def _try_lock_file(fd):
+    """Try to take an exclusive lock on a file without blocking"""
+    try:
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_file(fd):
+    """Release a lock taken by _try_lock_file"""
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def package_lock(package_dir, poll_interval=0.5):
+    """Hold the build lock of a package version directory
+
+    Blocks while another thread or process builds the same package version.
+
+    Args:
+        package_dir: Package version directory (``<output>/<rez_name>/<version>``)
+        poll_interval: Seconds between attempts while waiting
+
+    Yields:
+        bool: True if another job held the lock and had to be waited for
+    """
+    lock_path = get_lock_path(package_dir)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    thread_lock = _get_thread_lock(lock_path)
+    waited = not thread_lock.acquire(blocking=False)
+    if waited:
+        print(f"Waiting for another job building {package_dir}")
+        thread_lock.acquire()
+
+    try:
+        # Not using open() keeps the descriptor independent of Python file objects
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if not _try_lock_file(fd):
+                if not waited:
+                    print(f"Waiting for another job building {package_dir}")
+                waited = True
+                while not _try_lock_file(fd):
+                    time.sleep(poll_interval)
+            try:
+                yield waited
+            finally:
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+    finally:
+        thread_lock.release()
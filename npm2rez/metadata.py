@@ -0,0 +1,207 @@
+"""
+Packument cache for npm2rez - download package metadata once
+
+Packuments are kept compressed in a sqlite database in the cache directory
+(``<cache_dir>/metadata.db``), together with the ETag and Last-Modified
+headers of the registry response. The most recently used ones are also kept
+decoded in memory, for long-running processes such as ``npm2rez serve``. A
+cached packument younger than the TTL is used as is. An older one is
+revalidated with a conditional request, which the registry answers with an
+empty 304 response while the packument has not changed. Version ranges and
+dist-tags given on the command line are resolved against these packuments.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from npm2rez.cache import get_cache_dir
+from npm2rez.registry import (
+    ACCEPT_HEADER,
+    get_packument_url,
+    get_registry,
+    open_url,
+    resolve_manifest,
+)
+from npm2rez.semver import is_valid
+
+# Seconds a cached packument is used without asking the registry
+DEFAULT_METADATA_TTL = 300
+
+# Decoded packuments kept in memory, least recently used ones are dropped
+MEMORY_CACHE_SIZE = 256
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packuments (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fetched REAL NOT NULL,
+    body BLOB NOT NULL
+)
+"""
+
+
+def get_metadata_db(args=None):
+    """Get the path of the packument cache database
+
+    Args:
+        args: Command line arguments, may provide ``cache_dir``
+
+    Returns:
+        str: Path to ``<cache_dir>/metadata.db``
+    """
+    return os.path.join(get_cache_dir(args), "metadata.db")
+
+
+def get_metadata_ttl(args=None):
+    """Get the seconds a cached packument is used without revalidation"""
+    ttl = getattr(args, "metadata_ttl", None)
+    return DEFAULT_METADATA_TTL if ttl is None else ttl
+
+
+@contextmanager
+def _connect(args):
+    """Open the packument cache database for one transaction"""
+    db_path = get_metadata_db(args)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    # Concurrent jobs share the database, writers wait for each other
+    db = sqlite3.connect(db_path, timeout=60)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(_SCHEMA)
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _load(db, url):
+    """Load the cache row of a packument URL, None if it is not cached"""
+    return db.execute(
+        "SELECT etag, last_modified, fetched, body FROM packuments WHERE url = ?", (url,)
+    ).fetchone()
+
+
+def _decode(body):
+    """Decode a compressed packument"""
+    return json.loads(zlib.decompress(body).decode("utf-8"))
+
+
+def _remember(key, fetched, packument):
+    """Keep a decoded packument in memory"""
+    with _memory_lock:
+        _memory[key] = (fetched, packument)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def fetch_packument(args, name, timeout=60):
+    """Fetch the abbreviated packument of a package through the cache
+
+    Args:
+        args: Command line arguments, may provide ``registry``,
+            ``cache_dir``, ``offline`` and ``metadata_ttl``
+        name: Package name
+        timeout: Network timeout in seconds
+
+    Returns:
+        dict: Packument
+
+    Raises:
+        ValueError: If running offline and the packument is not cached
+    """
+    url = get_packument_url(get_registry(args), name)
+    key = (get_metadata_db(args), url)
+    with _memory_lock:
+        cached = _memory.get(key)
+    if cached and (getattr(args, "offline", False)
+                   or time.time() - cached[0] < get_metadata_ttl(args)):
+        return cached[1]
+
+    fetched, packument = _fetch_packument(args, name, url, timeout)
+    _remember(key, fetched, packument)
+    return packument
+
+
+def _fetch_packument(args, name, url, timeout):
+    """Fetch a packument through the database cache
+
+    Returns:
+        tuple: (time the packument was last validated, packument)
+    """
+    with _connect(args) as db:
+        row = _load(db, url)
+    if row:
+        etag, last_modified, fetched, body = row
+        if getattr(args, "offline", False) or time.time() - fetched < get_metadata_ttl(args):
+            return fetched, _decode(body)
+    elif getattr(args, "offline", False):
+        raise ValueError(f"Metadata of {name} is not cached, cannot fetch it offline")
+
+    headers = {"Accept": ACCEPT_HEADER}
+    if row and etag:
+        headers["If-None-Match"] = etag
+    if row and last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        with open_url(url, headers, timeout) as response:
+            data = response.read()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or not row:
+            raise
+        # Not modified, the cached packument is fresh again
+        fetched = time.time()
+        with _connect(args) as db:
+            db.execute("UPDATE packuments SET fetched = ? WHERE url = ?", (fetched, url))
+        return fetched, _decode(body)
+    except OSError as e:
+        if not row:
+            raise
+        print(f"Warning: using cached metadata of {name}, the registry failed: {e}")
+        return fetched, _decode(body)
+
+    packument = json.loads(data.decode("utf-8"))
+    fetched = time.time()
+    with _connect(args) as db:
+        db.execute(
+            "INSERT OR REPLACE INTO packuments (url, etag, last_modified, fetched, body) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (url, etag, last_modified, fetched, zlib.compress(data)),
+        )
+    return fetched, packument
+
+
+def resolve_version(args):
+    """Resolve a version range or dist-tag in ``args.version`` to a version
+
+    Exact versions, GitHub sources and lockfile builds are left alone.
+
+    Args:
+        args: Command line arguments with ``name`` and ``version``, see
+            fetch_packument for the optional ones
+
+    Returns:
+        str: Exact version, also stored in ``args.version``
+    """
+    if getattr(args, "source", "npm") != "npm" or getattr(args, "lockfile", None) \
+            or is_valid(str(args.version)):
+        return args.version
+
+    manifest = resolve_manifest(fetch_packument(args, args.name), str(args.version))
+    print(f"Resolved {args.name}@{args.version} to {manifest['version']}")
+    args.version = manifest["version"]
+    return args.version
@@ -0,0 +1,237 @@
+"""
+Pack lists for npm2rez - select the files npm would publish
+
+GitHub builds ship the files of the built checkout that ``npm pack`` would
+put into the registry tarball, not the whole checkout. The list comes from
+``npm pack --dry-run --json``. When npm cannot produce it, the same rules are
+applied in Python: the ``files`` field of package.json, else ``.npmignore``
+(or ``.gitignore``) at the top of the package, plus the files npm always
+includes or ignores. Rules are matched like ``.gitignore`` patterns, as npm
+does: case-sensitive, with ``**`` matching any number of directories.
+"""
+
+import functools
+import json
+import os
+import re
+import subprocess
+import tempfile
+
+from npm2rez.deps import read_package_json
+
+# Files npm never packs
+ALWAYS_IGNORED = (
+    ".git/",
+    "CVS/",
+    ".svn/",
+    ".hg/",
+    ".lock-wscript",
+    ".wafpickle-*",
+    ".*.swp",
+    ".DS_Store",
+    "._*",
+    "npm-debug.log",
+    ".npmrc",
+    "config.gypi",
+    "*.orig",
+    ".gitignore",
+    ".npmignore",
+    "/node_modules/",
+    "/package-lock.json",
+    "/yarn.lock",
+    "/pnpm-lock.yaml",
+)
+
+# Files npm always packs, whatever the other rules say. npm ignores the
+# case of README and LICENSE names
+ALWAYS_INCLUDED = (
+    "/package.json",
+    "/README*",
+    "/Readme*",
+    "/readme*",
+    "/LICENSE*",
+    "/License*",
+    "/license*",
+    "/LICENCE*",
+    "/Licence*",
+    "/licence*",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_pattern(pattern):
+    """Compile a .gitignore pattern into (regex, directories only)"""
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # Patterns without an inner slash match at any depth
+    if "/" not in pattern:
+        pattern = "**/" + pattern
+    pattern = pattern.lstrip("/")
+
+    regex = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            regex.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("/**", index) and index + 3 == len(pattern):
+            regex.append("/.*")
+            index += 3
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            regex.append(re.escape(pattern[index]))
+        elif char == "[" and "]" in pattern[index + 2:]:
+            end = pattern.index("]", index + 2)
+            members = pattern[index + 1:end].replace("\\", "\\\\")
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            regex.append(f"[{members}]")
+            index = end
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return re.compile("".join(regex)), dir_only
+
+
+def is_excluded(path, rules):
+    """Check whether .gitignore style rules match a file
+
+    The file matches if the last rule matching it, or one of its parent
+    directories, is not a negation.
+
+    Args:
+        path: File path relative to the package, with forward slashes
+        rules: Patterns in order, ``!`` negates a pattern
+
+    Returns:
+        bool: True if the rules match the file
+    """
+    parts = path.split("/")
+    candidates = [("/".join(parts[:index]), True) for index in range(1, len(parts))]
+    candidates.append((path, False))
+
+    excluded = False
+    for rule in rules:
+        negated = rule.startswith("!")
+        regex, dir_only = _compile_pattern(rule[1:] if negated else rule)
+        if any(regex.fullmatch(candidate) for candidate, is_dir in candidates
+               if is_dir or not dir_only):
+            excluded = not negated
+    return excluded
+
+
+def _read_ignore_rules(path):
+    """Read the rules of an ignore file, empty if it is missing"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _anchor(pattern):
+    """Anchor a ``files`` entry of package.json to the package root"""
+    negation = "!" if pattern.startswith("!") else ""
+    pattern = os.path.normpath(pattern[len(negation):]).replace("\\", "/").rstrip("/")
+    return negation + "/" + pattern.lstrip("/")
+
+
+def _walk_files(package_dir):
+    """Yield the paths of all files of a checkout, relative with forward slashes"""
+    for root, dirs, files in os.walk(package_dir):
+        relative_root = os.path.relpath(root, package_dir).replace(os.sep, "/")
+        prefix = "" if relative_root == "." else relative_root + "/"
+        # Never descend into the metadata or the installed dependencies
+        dirs[:] = [
+            name for name in dirs
+            if name != ".git" and not (prefix == "" and name == "node_modules")
+        ]
+        for name in files:
+            yield prefix + name
+
+
+def list_pack_files(package_dir):
+    """List the files npm would pack, without running npm
+
+    Args:
+        package_dir: Package directory
+
+    Returns:
+        list: Sorted file paths relative to the package, with forward slashes
+    """
+    package_json = read_package_json(package_dir)
+    included = list(ALWAYS_INCLUDED)
+    for field in ("main", "bin"):
+        value = package_json.get(field)
+        values = value.values() if isinstance(value, dict) else [value]
+        included.extend(_anchor(path) for path in values if isinstance(path, str))
+
+    files_field = package_json.get("files")
+    if isinstance(files_field, list):
+        patterns = [_anchor(pattern) for pattern in files_field if isinstance(pattern, str)]
+
+        def is_ignored(path):
+            return not is_excluded(path, patterns)
+    else:
+        rules = _read_ignore_rules(os.path.join(package_dir, ".npmignore"))
+        if not rules and not os.path.exists(os.path.join(package_dir, ".npmignore")):
+            rules = _read_ignore_rules(os.path.join(package_dir, ".gitignore"))
+
+        def is_ignored(path):
+            return is_excluded(path, rules)
+
+    return sorted(
+        path for path in _walk_files(package_dir)
+        if is_excluded(path, included)
+        or not (is_ignored(path) or is_excluded(path, ALWAYS_IGNORED))
+    )
+
+
+def npm_pack_files(npm, package_dir):
+    """List the files npm would pack, as reported by ``npm pack --dry-run``
+
+    Args:
+        npm: Path to npm executable
+        package_dir: Package directory
+
+    Returns:
+        list or None: Sorted file paths relative to the package, None if npm
+            could not list them
+    """
+    with tempfile.TemporaryFile() as output:
+        try:
+            subprocess.check_call(
+                [npm, "pack", "--dry-run", "--json", "--ignore-scripts"],
+                cwd=package_dir, stdout=output, stderr=subprocess.DEVNULL
+            )
+            output.seek(0)
+            packs = json.loads(output.read().decode("utf-8"))
+            return sorted(entry["path"] for entry in packs[0]["files"])
+        except (OSError, subprocess.SubprocessError, ValueError, LookupError, TypeError):
+            return None
+
+
+def get_pack_files(npm, package_dir):
+    """List the files npm would pack, from npm or the Python rules
+
+    Bundled dependencies are left out, node_modules is shipped separately.
+
+    Args:
+        npm: Path to npm executable
+        package_dir: Package directory
+
+    Returns:
+        list: Sorted file paths relative to the package, with forward slashes
+    """
+    files = npm_pack_files(npm, package_dir)
+    if files is None:
+        files = list_pack_files(package_dir)
+    return [path for path in files if not path.startswith("node_modules/")]
@@ -0,0 +1,237 @@
+"""
+Pipelined builds for npm2rez - overlap network and disk work across packages
+
+Every package build is split into stages connected by bounded queues:
+
+    fetch -> copy -> shims -> finish
+
+``fetch`` runs npm install into a staging project (network bound), ``copy``
+moves the staged node_modules into the package version, ``shims`` writes the
+bin scripts and ``finish`` prunes, packs, stamps and publishes the package. While one
+package is being copied, the next ones are already fetching. The bounded
+queues keep fast stages from running far ahead of slow ones, so staging
+projects do not pile up on disk.
+
+The stages themselves are the blocking functions of npm2rez.core, run in a
+thread pool by an asyncio event loop.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from npm2rez.core import (
+    copy_staged_modules,
+    create_package,
+    create_package_py,
+    create_staged_shims,
+    finish_payload,
+    get_node_versions,
+    get_package_dir,
+    install_node_package,
+    publish_package,
+    remove_staging,
+    stage_npm_install,
+)
+from npm2rez.locking import make_build_dir, package_lock, remove_build_dir
+from npm2rez.metadata import resolve_version
+from npm2rez.report import run_in_context
+from npm2rez.stamp import get_fingerprint, is_up_to_date, write_stamp
+
+# Items waiting between two stages, per queue
+DEFAULT_QUEUE_SIZE = 2
+
+
+def run_stages(items, stages, queue_size=DEFAULT_QUEUE_SIZE, on_done=None):
+    """Pass items through a pipeline of blocking stage functions
+
+    Every stage has its own workers and reads from a bounded queue fed by the
+    previous stage. A stage function takes an item and returns nothing; it
+    may set ``item["done"]`` to let the item skip the remaining stages. An
+    exception marks the item as failed with ``item["error"]`` and passes it
+    to the ``on_error`` callable of the item, if any.
+
+    Args:
+        items: Iterable of dict items
+        stages: List of (name, function, workers) tuples
+        queue_size: Maximum number of items waiting in front of a stage
+        on_done: Optional callback invoked with each item leaving the pipeline
+
+    Returns:
+        list: Items in the order they left the pipeline
+    """
+    return asyncio.run(_run_stages(items, stages, queue_size, on_done))
+
+
+async def _run_stages(items, stages, queue_size, on_done):
+    """Run the pipeline of run_stages on the current event loop"""
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    finished = []
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0][2]):
+            await queues[0].put(None)
+
+    async def work(index, function, executor):
+        while True:
+            item = await queues[index].get()
+            if item is None:
+                return
+            if not item.get("done"):
+                try:
+                    await loop.run_in_executor(executor, run_in_context(function, item))
+                except Exception as e:
+                    item["done"] = True
+                    item["error"] = str(e) or type(e).__name__
+                    if item.get("on_error"):
+                        item["on_error"]()
+            if index + 1 < len(stages):
+                await queues[index + 1].put(item)
+            else:
+                finished.append(item)
+                if on_done:
+                    on_done(item)
+
+    async def stage(index, executor):
+        _, function, workers = stages[index]
+        await asyncio.gather(*(work(index, function, executor) for _ in range(workers)))
+        # Stop the workers of the next stage once everything has been handed on
+        if index + 1 < len(stages):
+            for _ in range(stages[index + 1][2]):
+                await queues[index + 1].put(None)
+
+    with ThreadPoolExecutor(max_workers=sum(workers for _, _, workers in stages)) as executor:
+        await asyncio.gather(feed(), *(stage(index, executor) for index in range(len(stages))))
+    return finished
+
+
+def _uses_staging(args):
+    """Check whether a build installs through an npm staging project"""
+    return (
+        args.source == "npm"
+        and getattr(args, "installer", "npm") == "npm"
+        and not getattr(args, "lockfile", None)
+        and len(get_node_versions(args)) == 1
+    )
+
+
+def _fetch(job):
+    """Fetch stage: lock, skip up to date packages, install into staging"""
+    args = job["args"]
+    if args.source == "github" and not args.repo:
+        raise ValueError("When using github source, repo is required")
+    resolve_version(args)
+    if getattr(args, "resolve_deps", False) and args.source == "npm":
+        # Dependency packages run their own parallel build
+        job["package_dir"] = create_package(args)
+        job["done"] = True
+        return
+
+    package_dir = job["package_dir"] = get_package_dir(args)
+    stack = job["stack"] = ExitStack()
+    job["on_error"] = stack.close
+    stack.enter_context(package_lock(package_dir))
+
+    if not getattr(args, "force", False) and is_up_to_date(package_dir, get_fingerprint(args)):
+        print(f"{package_dir} is up to date")
+        job["done"] = True
+        stack.close()
+        return
+
+    # Packages are built in a private directory and published once complete
+    build_dir = job["build_dir"] = make_build_dir(package_dir, getattr(args, "staging_dir", None))
+    stack.callback(remove_build_dir, build_dir)
+    create_package_py(args, build_dir)
+
+    if not _uses_staging(args):
+        # Other installers write into the build directory directly
+        if not install_node_package(args, build_dir):
+            raise RuntimeError(f"Failed to install {args.name}@{args.version}")
+        return
+
+    if not getattr(args, "npm", None):
+        raise RuntimeError("npm command not found")
+    job["staging"] = stage_npm_install(args.npm, args, build_dir)
+    stack.callback(remove_staging, job["staging"])
+
+
+def _copy(job):
+    """Copy stage: move the staged node_modules into the build directory"""
+    if job.get("staging"):
+        copy_staged_modules(job["args"], job["staging"], job["build_dir"])
+
+
+def _shims(job):
+    """Shims stage: write the bin scripts of the package"""
+    if job.get("staging"):
+        create_staged_shims(job["args"], job["staging"], job["build_dir"])
+
+
+def _finish(job):
+    """Finish stage: prune, pack, stamp and publish the package, then release it"""
+    args = job["args"]
+    finish_payload(args, job["build_dir"])
+    write_stamp(job["build_dir"], args)
+    publish_package(job["build_dir"], job["package_dir"])
+    job["stack"].close()
+    print(f"Installed {args.name}@{args.version}")
+
+
+def get_stages(jobs):
+    """Get the stages of a package build and their worker counts
+
+    Args:
+        jobs: Number of packages fetching at the same time
+
+    Returns:
+        list: (name, function, workers) tuples for run_stages
+    """
+    disk_workers = max(1, min(jobs, 2))
+    return [
+        ("fetch", _fetch, jobs),
+        ("copy", _copy, disk_workers),
+        ("shims", _shims, 1),
+        ("finish", _finish, disk_workers),
+    ]
+
+
+def build_pipelined(args_list, jobs=None, queue_size=DEFAULT_QUEUE_SIZE, on_result=None):
+    """Build packages through the fetch, copy, shims and finish pipeline
+
+    Args:
+        args_list: create_package arguments of every package
+        jobs: Number of packages fetching at the same time (defaults to the CPU count)
+        queue_size: Maximum number of packages waiting in front of a stage
+        on_result: Optional callback invoked with each result as it completes
+
+    Returns:
+        list: Results with name, version, success, package_dir, error and
+            duration, in the order the packages finished
+    """
+    jobs = jobs or os.cpu_count() or 1
+
+    def items():
+        for args in args_list:
+            yield {"args": args, "start": time.time()}
+
+    def done(job):
+        args = job["args"]
+        result = {
+            "name": args.name,
+            "version": args.version,
+            "success": not job.get("error"),
+            "package_dir": None if job.get("error") else job.get("package_dir"),
+            "error": job.get("error"),
+            "duration": time.time() - job["start"],
+        }
+        job["result"] = result
+        if on_result:
+            on_result(result)
+
+    finished = run_stages(items(), get_stages(jobs), queue_size, on_done=done)
+    return [job["result"] for job in finished]
@@ -0,0 +1,307 @@
+"""
+Payload pruning for npm2rez - drop files a runtime never needs
+
+Rules are case-sensitive glob patterns matched against paths relative to
+each installed package. A rule ending with ``/`` matches directories, a rule
+without any other ``/`` matches names at any depth, otherwise it is anchored
+at the package root. A rule starting with ``!`` keeps what earlier rules
+removed. Later rules win. Files referenced by a package's ``main``,
+``exports``, ``bin`` and similar fields are never removed, nor are scripts
+and JSON files matched by a documentation rule only.
+"""
+
+import fnmatch
+import os
+
+from npm2rez.deps import read_package_json
+from npm2rez.fastcopy import list_modules
+
+# Directories are only dropped at the top of a package, "test" or "doc"
+# directories deeper down are usually part of the code
+DEFAULT_PRUNE_RULES = (
+    "/test/",
+    "/tests/",
+    "__tests__/",
+    "__mocks__/",
+    "/spec/",
+    "/doc/",
+    "/docs/",
+    "/example/",
+    "/examples/",
+    "/benchmark/",
+    "/benchmarks/",
+    "/coverage/",
+    "/.github/",
+    "*.map",
+    "*.md",
+    "*.markdown",
+    "CHANGELOG*",
+    "Changelog*",
+    "changelog*",
+    "CHANGES*",
+    "HISTORY*",
+    "History*",
+    ".npmignore",
+    ".travis.yml",
+    ".editorconfig",
+    ".eslintrc*",
+    ".prettierrc*",
+    # License files have to ship with the code
+    "!LICENSE*",
+    "!License*",
+    "!license*",
+    "!LICENCE*",
+    "!Licence*",
+    "!licence*",
+    "!COPYING*",
+)
+
+# Rules for documentation, which may be shipped as code too (yaml's
+# dist/doc/*.js, history.js...), so they never remove scripts or JSON files
+DOCUMENTATION_RULES = frozenset((
+    "/doc/",
+    "/docs/",
+    "/example/",
+    "/examples/",
+    "*.md",
+    "*.markdown",
+    "CHANGELOG*",
+    "Changelog*",
+    "changelog*",
+    "CHANGES*",
+    "HISTORY*",
+    "History*",
+))
+
+# Files a documentation rule never removes
+_CODE_EXTENSIONS = (".js", ".cjs", ".mjs", ".json")
+
+TYPESCRIPT_PRUNE_RULES = (
+    "*.ts",
+    "*.tsx",
+    "*.mts",
+    "*.cts",
+    "!*.d.ts",
+    "!*.d.mts",
+    "!*.d.cts",
+)
+
+# package.json fields pointing at files needed at runtime
+ENTRY_POINT_FIELDS = ("main", "module", "browser", "types", "typings", "exports", "bin")
+
+# Extensions Node.js tries when resolving an entry point without one
+_RESOLVE_EXTENSIONS = ("", ".js", ".json", ".node", ".cjs", ".mjs")
+
+
+def get_prune_rules(args):
+    """Get the pruning rules of a build
+
+    Args:
+        args: Command line arguments, may provide ``prune``, ``prune_ts``
+            and ``prune_rules`` (a file with one rule per line)
+
+    Returns:
+        list or None: Rules in order, None if pruning is disabled
+    """
+    rules_file = getattr(args, "prune_rules", None)
+    if not (getattr(args, "prune", False) or rules_file):
+        return None
+
+    rules = list(DEFAULT_PRUNE_RULES)
+    if getattr(args, "prune_ts", False):
+        rules.extend(TYPESCRIPT_PRUNE_RULES)
+    if rules_file:
+        with open(rules_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    rules.append(line)
+    return rules
+
+
+def _match_rule(rule, path, is_dir):
+    """Check whether a rule matches a package relative path"""
+    if rule.endswith("/"):
+        if not is_dir:
+            return False
+        rule = rule[:-1]
+    if "/" in rule:
+        return fnmatch.fnmatchcase(path, rule.lstrip("/"))
+    return fnmatch.fnmatchcase(path.rsplit("/", 1)[-1], rule)
+
+
+def is_pruned(path, rules):
+    """Check whether the rules remove a file
+
+    The file is removed if the last rule matching it, or one of its parent
+    directories, is not a negation. Documentation rules never match scripts
+    and JSON files.
+
+    Args:
+        path: File path relative to the package, with forward slashes
+        rules: Pruning rules
+
+    Returns:
+        bool: True if the file should be removed
+    """
+    parts = path.split("/")
+    candidates = [("/".join(parts[:index]), True) for index in range(1, len(parts))]
+    candidates.append((path, False))
+
+    is_code = path.endswith(_CODE_EXTENSIONS)
+
+    pruned = False
+    for rule in rules:
+        negated = rule.startswith("!")
+        pattern = rule[1:] if negated else rule
+        if is_code and pattern in DOCUMENTATION_RULES:
+            continue
+        if any(_match_rule(pattern, candidate, is_dir) for candidate, is_dir in candidates):
+            pruned = not negated
+    return pruned
+
+
+def _collect_strings(value):
+    """Collect every string of a nested package.json field"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [item for child in value.values() for item in _collect_strings(child)]
+    if isinstance(value, list):
+        return [item for child in value for item in _collect_strings(child)]
+    return []
+
+
+def get_entry_points(package_json):
+    """Get the files a package references as entry points
+
+    Args:
+        package_json: Parsed package.json
+
+    Returns:
+        list: Normalized paths relative to the package, may contain ``*``
+    """
+    entry_points = ["index.js"]
+    for field in ENTRY_POINT_FIELDS:
+        for value in _collect_strings(package_json.get(field)):
+            path = os.path.normpath(value).replace("\\", "/")
+            if path not in (".", "..") and not path.startswith("../"):
+                entry_points.append(path)
+    return entry_points
+
+
+def is_protected(path, entry_points):
+    """Check whether a file is needed by an entry point
+
+    Args:
+        path: File path relative to the package, with forward slashes
+        entry_points: Entry points from get_entry_points
+
+    Returns:
+        bool: True if the file must be kept
+    """
+    for entry_point in entry_points:
+        if "*" in entry_point:
+            if fnmatch.fnmatch(path, entry_point):
+                return True
+        elif any(path == entry_point + ext for ext in _RESOLVE_EXTENSIONS):
+            return True
+        elif path.startswith(entry_point + "/"):
+            # Directory entry points resolve to files inside them
+            return True
+    return False
+
+
+def iter_packages(node_modules_dir, location="node_modules"):
+    """Yield (location, directory) for every package below a node_modules directory"""
+    for module in list_modules(node_modules_dir):
+        package_dir = os.path.join(node_modules_dir, *module.split("/"))
+        if not os.path.isdir(package_dir) or os.path.islink(package_dir):
+            continue
+        package_location = f"{location}/{module}"
+        yield package_location, package_dir
+        nested = os.path.join(package_dir, "node_modules")
+        yield from iter_packages(nested, f"{package_location}/node_modules")
+
+
+def prune_package(package_dir, rules):
+    """Remove files matching the rules from one installed package
+
+    Nested node_modules directories are left alone, they hold packages of
+    their own.
+
+    Args:
+        package_dir: Installed package directory
+        rules: Pruning rules
+
+    Returns:
+        dict: files and bytes kept, removed_files and removed_bytes
+    """
+    entry_points = get_entry_points(read_package_json(package_dir))
+    stats = {"files": 0, "bytes": 0, "removed_files": 0, "removed_bytes": 0}
+    # Directories something was removed from
+    touched = set()
+
+    for root, _, files in os.walk(package_dir, topdown=False):
+        relative_root = os.path.relpath(root, package_dir).replace(os.sep, "/")
+        if relative_root == "node_modules" or relative_root.startswith("node_modules/"):
+            continue
+        prefix = "" if relative_root == "." else relative_root + "/"
+
+        for name in files:
+            file_path = os.path.join(root, name)
+            path = prefix + name
+            size = os.lstat(file_path).st_size
+            if path != "package.json" and is_pruned(path, rules) and \
+                    not is_protected(path, entry_points):
+                os.remove(file_path)
+                touched.add(root)
+                stats["removed_files"] += 1
+                stats["removed_bytes"] += size
+            else:
+                stats["files"] += 1
+                stats["bytes"] += size
+
+        # Drop directories emptied by pruning
+        if prefix and root in touched and not os.listdir(root):
+            os.rmdir(root)
+            touched.add(os.path.dirname(root))
+    return stats
+
+
+def prune_node_modules(node_modules_dir, rules):
+    """Prune every package of a node_modules tree
+
+    Args:
+        node_modules_dir: node_modules directory
+        rules: Pruning rules
+
+    Returns:
+        dict: Mapping of package location to prune_package stats
+    """
+    return {
+        location: prune_package(package_dir, rules)
+        for location, package_dir in iter_packages(node_modules_dir)
+    }
+
+
+def print_size_report(report, limit=10):
+    """Print what pruning removed and which dependencies are the largest
+
+    Args:
+        report: Result of prune_node_modules
+        limit: Number of dependencies to list
+    """
+    removed_files = sum(stats["removed_files"] for stats in report.values())
+    removed_bytes = sum(stats["removed_bytes"] for stats in report.values())
+    kept_files = sum(stats["files"] for stats in report.values())
+    kept_bytes = sum(stats["bytes"] for stats in report.values())
+    print(f"Pruned {removed_files} files ({removed_bytes} bytes), "
+          f"kept {kept_files} files ({kept_bytes} bytes) in {len(report)} packages")
+
+    largest = sorted(report.items(), key=lambda item: (-item[1]["bytes"], item[0]))[:limit]
+    if largest:
+        print("Largest dependencies:")
+        for location, stats in largest:
+            name = location.rsplit("node_modules/", 1)[-1]
+            print(f"  {name:<40} {stats['bytes']:>12} bytes {stats['files']:>7} files")
@@ -0,0 +1,446 @@
+"""
+npm registry client for npm2rez - install packages without the npm executable
+
+Packuments are fetched over HTTP, the dependency tree is resolved and laid
+out the way npm hoists it, and every tarball is streamed straight into its
+final node_modules location while its integrity hash is computed.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from npm2rez import __version__
+from npm2rez.deps import get_parent_location
+from npm2rez.fastcopy import CopyStats
+from npm2rez.semver import max_satisfying, satisfies
+
+DEFAULT_REGISTRY = "https://registry.npmjs.org"
+
+# Abbreviated metadata is much smaller and has everything an install needs
+ACCEPT_HEADER = "application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8, */*"
+
+_NODE_ARCHES = {
+    "x86_64": "x64",
+    "amd64": "x64",
+    "aarch64": "arm64",
+    "arm64": "arm64",
+    "i386": "ia32",
+    "i686": "ia32",
+    "x86": "ia32",
+    "armv7l": "arm",
+}
+
+
+def get_registry(args=None):
+    """Get the registry URL
+
+    Args:
+        args: Command line arguments, may provide ``registry``
+
+    Returns:
+        str: Registry URL without trailing slash
+    """
+    registry = (
+        getattr(args, "registry", None)
+        or os.environ.get("NPM_CONFIG_REGISTRY")
+        or os.environ.get("npm_config_registry")
+        or DEFAULT_REGISTRY
+    )
+    return registry.rstrip("/")
+
+
+def get_packument_url(registry, name):
+    """Get the packument URL of a package, escaping the scope separator"""
+    return f"{registry}/{name.replace('/', '%2f')}"
+
+
+def open_url(url, headers=None, timeout=60):
+    """Open a URL with the npm2rez user agent"""
+    request_headers = {"User-Agent": f"npm2rez/{__version__}"}
+    request_headers.update(headers or {})
+    request = urllib.request.Request(url, headers=request_headers)
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def fetch_packument(registry, name, timeout=60):
+    """Fetch the abbreviated packument of a package
+
+    Args:
+        registry: Registry URL
+        name: Package name
+        timeout: Network timeout in seconds
+
+    Returns:
+        dict: Packument
+    """
+    url = get_packument_url(registry, name)
+    with open_url(url, {"Accept": ACCEPT_HEADER}, timeout) as response:
+        return json.load(response)
+
+
+def _spec_matches(version, spec, packument):
+    """Check whether a version matches a range or dist-tag"""
+    dist_tags = packument.get("dist-tags", {})
+    if spec in dist_tags:
+        return version == dist_tags[spec]
+    return satisfies(version, spec or "*")
+
+
+def resolve_manifest(packument, spec):
+    """Pick the version manifest matching a range, version or dist-tag
+
+    Args:
+        packument: Packument of the package
+        spec: Version range, exact version or dist-tag
+
+    Returns:
+        dict: Version manifest
+
+    Raises:
+        ValueError: If no version matches
+    """
+    versions = packument.get("versions", {})
+    dist_tags = packument.get("dist-tags", {})
+    spec = (spec or "").strip() or "latest"
+
+    if spec in dist_tags:
+        version = dist_tags[spec]
+    elif spec in versions:
+        version = spec
+    else:
+        # Like npm, prefer the latest tag when it satisfies the range
+        latest = dist_tags.get("latest")
+        if latest in versions and satisfies(latest, spec):
+            version = latest
+        else:
+            version = max_satisfying(versions, spec)
+
+    if version not in versions:
+        raise ValueError(f"No version of {packument.get('name')} matches {spec}")
+    return versions[version]
+
+
+def lockfile_tree(lockfile, registry_url=None, target=None):
+    """Turn lockfile entries into a tree of installable manifests
+
+    Dev-only packages and optional packages for another platform are left
+    out, like ``npm ci --omit=dev`` does.
+
+    Args:
+        lockfile: Parsed package-lock.json or npm-shrinkwrap.json (v2/v3)
+        registry_url: Registry replacing the default registry host in
+            ``resolved`` URLs, for mirrors
+        target: Lockfile location of the requested package, checked to be
+            installed at runtime
+
+    Returns:
+        dict: Mapping of node_modules location to manifest with a ``dist`` field
+
+    Raises:
+        ValueError: If an entry cannot be fetched as a tarball, or if the
+            target is a dev-only package
+    """
+    packages = lockfile["packages"]
+    if target and packages.get(target, {}).get("dev"):
+        raise ValueError(f"{target} is a dev-only package of the lockfile, "
+                         "it is not installed at runtime")
+
+    tree = {}
+    for location, meta in packages.items():
+        # Skip the project itself, dev-only packages, workspace links and
+        # packages shipped inside their parent's tarball
+        if not location or meta.get("dev") or meta.get("link") or meta.get("inBundle"):
+            continue
+        # npm skips optional packages that do not support this platform
+        if meta.get("optional") and not platform_matches(meta):
+            continue
+        resolved = meta.get("resolved")
+        if not resolved or not resolved.startswith(("http://", "https://")):
+            raise ValueError(f"Cannot fetch {location} from {resolved!r}")
+        if registry_url and resolved.startswith(DEFAULT_REGISTRY + "/"):
+            resolved = registry_url.rstrip("/") + resolved[len(DEFAULT_REGISTRY):]
+
+        manifest = dict(meta)
+        manifest["name"] = meta.get("name") or location.rsplit("node_modules/", 1)[-1]
+        manifest["dist"] = {"tarball": resolved, "integrity": meta.get("integrity")}
+        tree[location] = manifest
+    return tree
+
+
+def _allowed(value, allowed):
+    """Check a value against an npm os/cpu list supporting ``!`` negation"""
+    if not allowed:
+        return True
+    if f"!{value}" in allowed:
+        return False
+    positives = [item for item in allowed if not item.startswith("!")]
+    return not positives or value in positives
+
+
+def platform_matches(manifest):
+    """Check whether a manifest's ``os`` and ``cpu`` fields allow this machine"""
+    node_platform = "win32" if sys.platform.startswith("win") else sys.platform
+    if node_platform.startswith("linux"):
+        node_platform = "linux"
+    machine = platform.machine().lower()
+    node_arch = _NODE_ARCHES.get(machine, machine)
+    return _allowed(node_platform, manifest.get("os")) and _allowed(node_arch, manifest.get("cpu"))
+
+
+def _iter_dependencies(manifest):
+    """Yield (name, spec, optional) for every dependency npm installs"""
+    optional = manifest.get("optionalDependencies") or {}
+    peer_meta = manifest.get("peerDependenciesMeta") or {}
+    for name, spec in (manifest.get("dependencies") or {}).items():
+        if name not in optional:
+            yield name, spec, False
+    for name, spec in optional.items():
+        yield name, spec, True
+    for name, spec in (manifest.get("peerDependencies") or {}).items():
+        yield name, spec, bool(peer_meta.get(name, {}).get("optional"))
+
+
+def _place(tree, packuments, parent, name, spec):
+    """Find where a dependency goes in the tree
+
+    Returns:
+        tuple: (location, is_new) where is_new is False if an installed
+            package already satisfies the dependency
+    """
+    location = parent
+    while True:
+        candidate = f"{location}/node_modules/{name}" if location else f"node_modules/{name}"
+        if candidate in tree:
+            if _spec_matches(tree[candidate]["version"], spec, packuments[name]) or not parent:
+                return candidate, False
+            # A different version is visible from here, nest below the parent
+            nested = f"{parent}/node_modules/{name}"
+            return nested, nested not in tree
+        if not location:
+            # Nothing visible, hoist to the top level
+            return candidate, True
+        location = get_parent_location(location)
+
+
+def resolve_tree(args, fetch=None, jobs=None):
+    """Resolve the dependency tree of a package without npm
+
+    Args:
+        args: Command line arguments with ``name`` and ``version``
+        fetch: Function(name) returning a packument, defaults to the registry
+        jobs: Number of concurrent packument requests
+
+    Returns:
+        dict: Mapping of node_modules location to version manifest
+    """
+    if fetch is None:
+        registry = get_registry(args)
+
+        def fetch(name):
+            return fetch_packument(registry, name)
+
+    packuments = {}
+    tree = {}
+    level = [("", args.name, args.version, False)]
+    with ThreadPoolExecutor(max_workers=jobs or 16) as executor:
+        while level:
+            # Fetch every packument of this level concurrently
+            missing = sorted({name for _, name, _, _ in level if name not in packuments})
+            for name, packument in zip(missing, executor.map(_safe_call(fetch), missing)):
+                packuments[name] = packument
+
+            next_level = []
+            for parent, name, spec, optional in level:
+                try:
+                    if isinstance(packuments[name], Exception):
+                        raise packuments[name]
+                    manifest = resolve_manifest(packuments[name], spec)
+                    if not platform_matches(manifest):
+                        raise ValueError(f"{name}@{manifest['version']} does not support "
+                                         "this platform")
+                except Exception:
+                    if optional:
+                        continue
+                    raise
+
+                location, is_new = _place(tree, packuments, parent, name, spec)
+                if not is_new:
+                    continue
+                tree[location] = manifest
+                for dep_name, dep_spec, dep_optional in _iter_dependencies(manifest):
+                    next_level.append((location, dep_name, dep_spec, dep_optional))
+            level = next_level
+    return tree
+
+
+def _safe_call(function):
+    """Wrap a function so that exceptions are returned instead of raised"""
+    def wrapper(*args):
+        try:
+            return function(*args)
+        except Exception as e:
+            return e
+    return wrapper
+
+
+def parse_integrity(integrity=None, shasum=None):
+    """Get the hash algorithm and expected digest of a tarball
+
+    Args:
+        integrity: SRI string such as ``sha512-<base64>``
+        shasum: Legacy hex encoded sha1 digest
+
+    Returns:
+        tuple or None: (algorithm, digest bytes), None if nothing to verify
+    """
+    for entry in (integrity or "").split():
+        algorithm, _, digest = entry.partition("-")
+        if algorithm in ("sha512", "sha384", "sha256", "sha1"):
+            try:
+                return algorithm, base64.b64decode(digest)
+            except (binascii.Error, ValueError):
+                continue
+    if shasum:
+        return "sha1", binascii.unhexlify(shasum)
+    return None
+
+
+class _HashingReader:
+    """File object wrapper hashing everything read through it, and copying it if asked"""
+
+    def __init__(self, fileobj, algorithm, copy=None):
+        self.fileobj = fileobj
+        self.hasher = hashlib.new(algorithm)
+        self.copy = copy
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        if self.copy is not None:
+            self.copy.write(data)
+        return data
+
+
+def _member_path(member):
+    """Get a tarball member path relative to the package root"""
+    # Tarballs put everything below one top level directory, usually package/
+    parts = member.name.replace("\\", "/").split("/", 1)
+    if len(parts) < 2 or not parts[1]:
+        return None
+    path = os.path.normpath(parts[1])
+    if os.path.isabs(path) or path == ".." or path.startswith(".." + os.sep):
+        raise ValueError(f"Unsafe path in tarball: {member.name}")
+    return path
+
+
+def extract_stream(fileobj, dest_dir):
+    """Extract a gzipped package tarball from a stream
+
+    Args:
+        fileobj: File object positioned at the start of the tarball
+        dest_dir: Package directory to extract into
+
+    Returns:
+        CopyStats: Number of files and bytes extracted
+    """
+    files = 0
+    size = 0
+    os.makedirs(dest_dir, exist_ok=True)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            path = _member_path(member)
+            if path is None:
+                continue
+            target = os.path.join(dest_dir, path)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as f:
+                    shutil.copyfileobj(tar.extractfile(member), f, 1024 * 1024)
+                os.chmod(target, 0o755 if member.mode & 0o111 else 0o644)
+                files += 1
+                size += member.size
+    return CopyStats(files, size)
+
+
+def download_tarball(url, dest_dir, integrity=None, shasum=None, timeout=60,
+                     cache_path=None, offline=False):
+    """Stream a package tarball into a directory, verifying its integrity
+
+    The archive is never held in memory. If the integrity check fails the
+    extracted files are removed. With a cache path, a cached tarball is
+    extracted instead of downloading it, and a downloaded one is written to
+    the cache once verified.
+
+    Args:
+        url: Tarball URL
+        dest_dir: Package directory to extract into
+        integrity: Expected SRI integrity string
+        shasum: Expected legacy sha1 hex digest
+        timeout: Network timeout in seconds
+        cache_path: Cached tarball path, see npm2rez.cache.get_content_path
+        offline: Fail instead of downloading a tarball that is not cached
+
+    Returns:
+        CopyStats: Number of files and bytes extracted
+
+    Raises:
+        ValueError: If the tarball does not match its integrity hash, or is
+            not cached when running offline
+    """
+    expected = parse_integrity(integrity, shasum)
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                return _extract_verified(f, dest_dir, expected, cache_path)
+        except ValueError:
+            # A corrupt cache entry is replaced by a fresh download
+            if offline:
+                raise
+            os.remove(cache_path)
+    elif offline:
+        raise ValueError(f"{url} is missing from the cache")
+
+    with open_url(url, timeout=timeout) as response:
+        if not cache_path:
+            return _extract_verified(response, dest_dir, expected, url)
+
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as copy:
+                stats = _extract_verified(response, dest_dir, expected, url, copy)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return stats
+
+
+def _extract_verified(fileobj, dest_dir, expected, source, copy=None):
+    """Extract a tarball stream, removing the files if it fails its integrity check"""
+    reader = _HashingReader(fileobj, expected[0] if expected else "sha512", copy)
+    try:
+        stats = extract_stream(reader, dest_dir)
+        # Hash the padding after the end of the archive too
+        while reader.read(1024 * 1024):
+            pass
+        if expected and reader.hasher.digest() != expected[1]:
+            raise ValueError(f"Integrity check failed for {source}")
+    except Exception:
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        raise
+    return stats
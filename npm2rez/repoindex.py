@@ -0,0 +1,250 @@
+"""
+Repository index for npm2rez - answer package queries without walking the tree
+
+Every package version npm2rez publishes is recorded in a sqlite database at
+the root of the output repository (``<output>/.npm2rez-index.db``): rez
+name, npm name, version, source, fingerprint, payload size, file count and
+creation time. "Does X@Y exist?" and "which versions of X are there?" become
+index lookups instead of directory walks, which are slow on network
+filesystems. Packages removed or copied in by other means are picked up by
+rescan, which rebuilds the index from the stamps on disk, scanning package
+families in parallel.
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from npm2rez.semver import parse_version, version_key
+from npm2rez.stamp import STAMP_FILE, read_stamp
+
+INDEX_FILE = ".npm2rez-index.db"
+
+COLUMNS = (
+    "rez_name",
+    "version",
+    "name",
+    "source",
+    "fingerprint",
+    "payload_bytes",
+    "files",
+    "created",
+)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS packages (
+        rez_name TEXT NOT NULL,
+        version TEXT NOT NULL,
+        name TEXT,
+        source TEXT,
+        fingerprint TEXT,
+        payload_bytes INTEGER,
+        files INTEGER,
+        created REAL,
+        PRIMARY KEY (rez_name, version)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS packages_name ON packages (name)",
+)
+
+
+def get_index_path(output):
+    """Get the index database of an output repository
+
+    Args:
+        output: Output repository directory
+
+    Returns:
+        str: Path to ``<output>/.npm2rez-index.db``
+    """
+    return os.path.join(os.path.abspath(output), INDEX_FILE)
+
+
+@contextmanager
+def _connect(output):
+    """Open the index database of a repository for one transaction"""
+    index_path = get_index_path(output)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # The default rollback journal, WAL needs shared memory that NFS lacks
+    db = sqlite3.connect(index_path, timeout=60)
+    try:
+        for statement in _SCHEMA:
+            db.execute(statement)
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _count_files(path):
+    """Count files and bytes below a directory with os.scandir"""
+    files = 0
+    size = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                sub_files, sub_size = _count_files(entry.path)
+                files += sub_files
+                size += sub_size
+            else:
+                files += 1
+                size += entry.stat(follow_symlinks=False).st_size
+    return files, size
+
+
+def scan_package(package_dir):
+    """Describe a finished package version directory
+
+    Args:
+        package_dir: Package version directory, or the build directory
+            about to be published as one
+
+    Returns:
+        dict or None: Index columns other than rez_name and version, None
+            if the directory has no build stamp
+    """
+    stamp = read_stamp(package_dir)
+    if not stamp:
+        return None
+    files, size = _count_files(package_dir)
+    return {
+        "name": stamp.get("name"),
+        "source": stamp.get("source"),
+        "fingerprint": stamp.get("fingerprint"),
+        "payload_bytes": size,
+        "files": files,
+        "created": os.stat(os.path.join(package_dir, STAMP_FILE)).st_mtime,
+    }
+
+
+def _row(package_dir, entry):
+    """Build the index row of a package version directory"""
+    family_dir, version = os.path.split(os.path.abspath(package_dir))
+    values = dict(entry, rez_name=os.path.basename(family_dir), version=version)
+    return tuple(values[column] for column in COLUMNS)
+
+
+def _insert(db, rows):
+    """Insert or replace index rows"""
+    db.executemany(
+        f"INSERT OR REPLACE INTO packages ({', '.join(COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+        rows,
+    )
+
+
+def record_package(package_dir, entry=None):
+    """Record a published package version in the index of its repository
+
+    A failing index never fails the build, rescan repairs it.
+
+    Args:
+        package_dir: Published package version directory,
+            ``<output>/<rez_name>/<version>``
+        entry: Result of scan_package, scanned from package_dir if omitted
+
+    Returns:
+        bool: True if the package was recorded
+    """
+    try:
+        entry = entry or scan_package(package_dir)
+        if not entry:
+            return False
+        output = os.path.dirname(os.path.dirname(os.path.abspath(package_dir)))
+        with _connect(output) as db:
+            _insert(db, [_row(package_dir, entry)])
+        return True
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: could not index {package_dir}: {e}")
+        return False
+
+
+def _scan_family(family_dir):
+    """Scan every version directory of a package family"""
+    rows = []
+    try:
+        with os.scandir(family_dir) as it:
+            versions = [entry.path for entry in it
+                        if entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")]
+    except OSError:
+        return rows
+    for package_dir in versions:
+        entry = scan_package(package_dir)
+        if entry:
+            rows.append(_row(package_dir, entry))
+    return rows
+
+
+def rescan(output, jobs=None):
+    """Rebuild the index of a repository from the package directories
+
+    Only complete package versions, those with a build stamp, are indexed.
+    Build, trash and other hidden directories are skipped.
+
+    Args:
+        output: Output repository directory
+        jobs: Number of families scanned at the same time
+
+    Returns:
+        int: Number of indexed package versions
+    """
+    with os.scandir(output) as it:
+        family_dirs = [entry.path for entry in it
+                       if entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")]
+
+    # Network filesystems answer many small requests better in parallel
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        rows = [row for family_rows in executor.map(_scan_family, family_dirs)
+                for row in family_rows]
+
+    with _connect(output) as db:
+        db.execute("DELETE FROM packages")
+        _insert(db, rows)
+    return len(rows)
+
+
+def _sort_key(package):
+    """Sort packages by rez name, then semantic version"""
+    parsed = parse_version(package["version"])
+    if parsed is None:
+        return package["rez_name"], 1, package["version"]
+    return package["rez_name"], 0, version_key(parsed)
+
+
+def find_packages(output, name=None, version=None):
+    """Look up package versions in the index of a repository
+
+    Args:
+        output: Output repository directory
+        name: npm or rez package name, all packages if omitted
+        version: Exact version, all versions if omitted
+
+    Returns:
+        list: Dicts with the index columns, sorted by rez name and version
+    """
+    if not os.path.exists(get_index_path(output)):
+        return []
+
+    clauses = []
+    params = []
+    if name:
+        clauses.append("(name = ? OR rez_name = ?)")
+        params += [name, name]
+    if version:
+        clauses.append("version = ?")
+        params.append(version)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with _connect(output) as db:
+        rows = db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM packages{where}", params
+        ).fetchall()
+    return sorted((dict(zip(COLUMNS, row)) for row in rows), key=_sort_key)
+
+
+def has_package(output, name, version):
+    """Check whether the index of a repository has a package version"""
+    return bool(find_packages(output, name, version))
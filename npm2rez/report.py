@@ -0,0 +1,171 @@
+"""
+Timing reports for npm2rez - find out where a conversion spends its time
+
+Code paths wrap their phases (toolchain probe, npm install, git clone,
+build, copy, shim generation, cleanup) in ``phase()``. While a report is
+being collected, every phase records its duration, nested phases and any
+counters such as files and bytes. Outside of ``collect()`` phases cost
+next to nothing.
+"""
+
+import cProfile
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+
+from npm2rez import __version__
+
+# Phase record that new phases are added to, None when not collecting
+_current = ContextVar("npm2rez_report_phase", default=None)
+
+
+@contextmanager
+def collect(**fields):
+    """Collect the phases run inside the block into a report
+
+    Args:
+        **fields: Fields to record at the top of the report
+
+    Yields:
+        dict: The report, complete once the block exits
+    """
+    report = {
+        "npm2rez_version": __version__,
+        "started": datetime.now(timezone.utc).isoformat(),
+    }
+    report.update(fields)
+    report["phases"] = []
+
+    token = _current.set(report)
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report["duration"] = round(time.perf_counter() - start, 6)
+        _current.reset(token)
+        report["totals"] = summarize(report)
+
+
+@contextmanager
+def phase(name, **fields):
+    """Time a phase of the current report
+
+    Args:
+        name: Phase name, such as ``npm_install`` or ``copy``
+        **fields: Fields to record on the phase
+
+    Yields:
+        dict: The phase record, callers may add counters such as
+            ``files`` and ``bytes``
+    """
+    record = {"name": name}
+    record.update(fields)
+    parent = _current.get()
+    if parent is None:
+        yield record
+        return
+
+    record["phases"] = []
+    parent["phases"].append(record)
+    token = _current.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        record["duration"] = round(time.perf_counter() - start, 6)
+        _current.reset(token)
+        if not record["phases"]:
+            del record["phases"]
+
+
+def run_in_context(function, *args, **kwargs):
+    """Bind a function to the current report, for running it in another thread
+
+    Returns:
+        callable: Function without arguments running function(*args, **kwargs)
+    """
+    context = copy_context()
+    return lambda: context.run(function, *args, **kwargs)
+
+
+def summarize(report):
+    """Sum up durations, files and bytes by phase name
+
+    Args:
+        report: Report or phase record
+
+    Returns:
+        dict: Mapping of phase name to count, duration, files and bytes
+    """
+    totals = {}
+    stack = list(report.get("phases", []))
+    while stack:
+        record = stack.pop()
+        stack.extend(record.get("phases", []))
+        total = totals.setdefault(record["name"], {"count": 0, "duration": 0.0})
+        total["count"] += 1
+        total["duration"] = round(total["duration"] + record.get("duration", 0.0), 6)
+        for counter in ("files", "bytes"):
+            if counter in record:
+                total[counter] = total.get(counter, 0) + record[counter]
+    return dict(sorted(totals.items(), key=lambda item: -item[1]["duration"]))
+
+
+def write_report(report, path):
+    """Write a report as JSON
+
+    Args:
+        report: Report from collect
+        path: Output file path
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+@contextmanager
+def recorded(report_path=None, profile_path=None, **fields):
+    """Collect a report and optionally a profile of a command run
+
+    Args:
+        report_path: JSON file to write the report to, None to skip it
+        profile_path: File to dump cProfile stats to, None to skip profiling
+        **fields: Fields to record at the top of the report
+
+    Yields:
+        dict: The report being collected
+    """
+    report = None
+    try:
+        with profile(profile_path), collect(**fields) as report:
+            yield report
+    finally:
+        if report_path and report is not None:
+            write_report(report, report_path)
+            print(f"Wrote report to {report_path}")
+
+
+@contextmanager
+def profile(path):
+    """Profile the block with cProfile and dump the stats to a file
+
+    Args:
+        path: Output file for ``pstats``, None to disable profiling
+    """
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Wrote profile to {path}")
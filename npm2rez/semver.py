@@ -0,0 +1,243 @@
+"""
+Semantic versioning for npm2rez - npm compatible version ranges
+
+Supports the range syntax used in package.json files: comparators
+(``<``, ``<=``, ``>``, ``>=``, ``=``), caret and tilde ranges, x-ranges
+(``1.x``, ``1.2.*``, ``*``), hyphen ranges (``1.2 - 2.3.4``) and ``||``.
+"""
+
+import re
+
+_VERSION_RE = re.compile(
+    r"^\s*[v=]*\s*(\d+)\.(\d+)\.(\d+)"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?\s*$"
+)
+_PARTIAL_RE = re.compile(
+    r"^[v=]*(\d+|[xX*])(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?(?:\+[0-9A-Za-z.-]+)?$"
+)
+_OPERATOR_RE = re.compile(r"^(<=|>=|<|>|=|\^|~>?)?(.*)$")
+
+
+def parse_version(version):
+    """Parse a version string
+
+    Args:
+        version: Version such as ``1.2.3`` or ``v2.0.0-beta.1``
+
+    Returns:
+        tuple or None: (major, minor, patch, prerelease) where prerelease is a
+            tuple of identifiers, None if the version is invalid
+    """
+    match = _VERSION_RE.match(version)
+    if not match:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    prerelease = tuple(
+        int(part) if part.isdigit() else part for part in prerelease.split(".")
+    ) if prerelease else ()
+    return int(major), int(minor), int(patch), prerelease
+
+
+def _prerelease_key(prerelease):
+    """Sort key for prerelease identifiers, releases sort last"""
+    if not prerelease:
+        return (1,)
+    return (0, tuple((0, part, "") if isinstance(part, int) else (1, 0, part)
+                     for part in prerelease))
+
+
+def version_key(version):
+    """Sort key for a parsed version or version string"""
+    if isinstance(version, str):
+        version = parse_version(version)
+    major, minor, patch, prerelease = version
+    return major, minor, patch, _prerelease_key(prerelease)
+
+
+def is_valid(version):
+    """Check whether a string is an exact version"""
+    return parse_version(version) is not None
+
+
+def _compare(left, right):
+    """Compare two parsed versions, returning -1, 0 or 1"""
+    left_key = version_key(left)
+    right_key = version_key(right)
+    return (left_key > right_key) - (left_key < right_key)
+
+
+def _parse_partial(text):
+    """Parse a partial version, returning parts with None for wildcards"""
+    match = _PARTIAL_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid version range: {text}")
+    major, minor, patch, prerelease = match.groups()
+    parts = []
+    for part in (major, minor, patch):
+        parts.append(None if part is None or part in "xX*" else int(part))
+    # Anything after a wildcard is a wildcard too
+    for index in range(1, 3):
+        if parts[index - 1] is None:
+            parts[index] = None
+    prerelease = tuple(
+        int(part) if part.isdigit() else part for part in prerelease.split(".")
+    ) if prerelease else ()
+    return parts[0], parts[1], parts[2], prerelease
+
+
+def _fill(major, minor, patch, prerelease=()):
+    """Build a full version from partial parts"""
+    return major or 0, minor or 0, patch or 0, prerelease
+
+
+def _comparators(token):
+    """Expand a single range token into (operator, version) comparators"""
+    operator, text = _OPERATOR_RE.match(token).groups()
+    operator = operator or ""
+    if text in ("", "*", "x", "X"):
+        if operator in ("<", ">"):
+            # Nothing is smaller or larger than every version
+            return [("<", (0, 0, 0, (0,)))]
+        return []
+
+    major, minor, patch, prerelease = _parse_partial(text)
+    if major is None:
+        return []
+
+    if operator == "^":
+        low = _fill(major, minor, patch, prerelease)
+        if major > 0 or minor is None:
+            high = (major + 1, 0, 0, ())
+        elif minor > 0 or patch is None:
+            high = (0, minor + 1, 0, ())
+        else:
+            high = (0, 0, patch + 1, ())
+        return [(">=", low), ("<", high)]
+
+    if operator in ("~", "~>"):
+        low = _fill(major, minor, patch, prerelease)
+        high = (major + 1, 0, 0, ()) if minor is None else (major, minor + 1, 0, ())
+        return [(">=", low), ("<", high)]
+
+    if patch is not None:
+        return [(operator or "=", (major, minor, patch, prerelease))]
+
+    # Partial versions
+    if minor is None:
+        next_version = (major + 1, 0, 0, ())
+    else:
+        next_version = (major, minor + 1, 0, ())
+    low = _fill(major, minor, patch)
+
+    if operator in ("", "="):
+        return [(">=", low), ("<", next_version)]
+    if operator == ">":
+        return [(">=", next_version)]
+    if operator == ">=":
+        return [(">=", low)]
+    if operator == "<":
+        return [("<", low)]
+    return [("<", next_version)]  # "<="
+
+
+def _parse_set(text):
+    """Parse one ``||`` separated comparator set"""
+    text = text.strip()
+    hyphen = re.match(r"^(\S+)\s+-\s+(\S+)$", text)
+    if hyphen:
+        low = _parse_partial(hyphen.group(1))
+        high = _parse_partial(hyphen.group(2))
+        comparators = [(">=", _fill(*low))]
+        if high[0] is None:
+            return comparators
+        if high[2] is not None:
+            comparators.append(("<=", high))
+        elif high[1] is not None:
+            comparators.append(("<", (high[0], high[1] + 1, 0, ())))
+        else:
+            comparators.append(("<", (high[0] + 1, 0, 0, ())))
+        return comparators
+
+    # Allow whitespace between an operator and its version
+    text = re.sub(r"(<=|>=|<|>|=|\^|~>?)\s+", r"\1", text)
+    comparators = []
+    for token in text.split():
+        comparators.extend(_comparators(token))
+    return comparators
+
+
+def parse_range(text):
+    """Parse an npm version range
+
+    Args:
+        text: Range such as ``^4.9``, ``~5.0.2`` or ``>=3 <4 || 5.x``
+
+    Returns:
+        list: Comparator sets, each a list of (operator, parsed version)
+
+    Raises:
+        ValueError: If the range is invalid
+    """
+    return [_parse_set(part) for part in text.split("||")]
+
+
+def _test(operator, version, bound):
+    """Test a parsed version against one comparator"""
+    result = _compare(version, bound)
+    return {
+        "=": result == 0,
+        "<": result < 0,
+        "<=": result <= 0,
+        ">": result > 0,
+        ">=": result >= 0,
+    }[operator]
+
+
+def satisfies(version, range_text):
+    """Check whether a version satisfies an npm range
+
+    Prereleases only match comparators on the same major.minor.patch that
+    also carry a prerelease, like npm does.
+
+    Args:
+        version: Exact version string
+        range_text: npm version range
+
+    Returns:
+        bool: True if the version is in the range
+    """
+    parsed = parse_version(version)
+    if parsed is None:
+        return False
+    try:
+        comparator_sets = parse_range(range_text)
+    except ValueError:
+        return False
+
+    for comparators in comparator_sets:
+        if not all(_test(op, parsed, bound) for op, bound in comparators):
+            continue
+        if parsed[3] and not any(
+            bound[3] and bound[:3] == parsed[:3] for _, bound in comparators
+        ):
+            continue
+        return True
+    return False
+
+
+def max_satisfying(versions, range_text):
+    """Find the highest version that satisfies a range
+
+    Args:
+        versions: Iterable of version strings
+        range_text: npm version range
+
+    Returns:
+        str or None: Highest matching version
+    """
+    matching = [version for version in versions if satisfies(version, range_text)]
+    if not matching:
+        return None
+    return max(matching, key=version_key)
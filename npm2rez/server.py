@@ -0,0 +1,330 @@
+"""
+Daemon mode for npm2rez - serve conversions from a warm process
+
+``npm2rez serve`` listens on a Unix socket, by default
+``<cache_dir>/serve.sock``, or a localhost TCP port and runs create and
+extract jobs posted to it as JSON over HTTP. The daemon has no
+authentication: the socket is only accessible to its owner, and requests
+must be ``application/json`` and name a local ``Host``, so web pages cannot
+post jobs to a TCP port through the browser. Every job skips the
+interpreter and CLI startup and reuses what earlier jobs warmed up: the npm
+executable probed once at startup, the node and npm versions of the build
+cache, the decoded packuments of the metadata cache, the git mirrors and the
+repository index. A package that is already up to date is answered in
+milliseconds.
+
+Endpoints:
+    POST /create: create a rez package, the body holds create options
+    POST /extract: extract a package, the body holds extract options and the
+        required ``output``
+    GET /packages?output=...&name=...&version=...: query a repository index
+    GET /status: uptime and job counters
+
+Example:
+    curl --unix-socket ~/.cache/npm2rez/serve.sock -H "Content-Type: application/json" \\
+        -d '{"name": "typescript", "version": "^4.9"}' http://localhost/create
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from npm2rez import repoindex
+from npm2rez.cache import get_cache_dir
+from npm2rez.core import create_package, extract_node_package, get_npm_executable
+from npm2rez.report import collect
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SOCKET_NAME = "serve.sock"
+
+# Host headers of local clients, a page that rebinds its own name to a
+# local address still sends its own name
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Options a job may set, everything else comes from the server defaults
+JOB_FIELDS = (
+    "name",
+    "version",
+    "source",
+    "repo",
+    "output",
+    "node_version",
+    "cache_dir",
+    "offline",
+    "installer",
+    "registry",
+    "metadata_ttl",
+    "resolve_deps",
+    "deps_depth",
+    "lockfile",
+    "force",
+    "store",
+    "git_mirror",
+    "build_cache",
+    "staging_dir",
+    "prune",
+    "prune_ts",
+    "prune_rules",
+    "payload",
+)
+
+JOB_DEFAULTS = {
+    "source": "npm",
+    "repo": None,
+    "output": "./rez-packages",
+    "node_version": "16",
+}
+
+
+def get_default_socket(cache_dir=None):
+    """Get the Unix socket the daemon listens on by default
+
+    Args:
+        cache_dir: npm2rez cache directory, see npm2rez.cache.get_cache_dir
+
+    Returns:
+        str: Path to ``<cache_dir>/serve.sock``
+    """
+    return os.path.join(get_cache_dir(SimpleNamespace(cache_dir=cache_dir)), SOCKET_NAME)
+
+
+def _host_name(host):
+    """Strip the port from the value of a Host header"""
+    host = host.strip().lower()
+    if host.startswith("["):
+        return host[1:].split("]", 1)[0]
+    return host.rsplit(":", 1)[0] if host.count(":") == 1 else host
+
+
+def _job_args(state, payload, command="create"):
+    """Build the arguments of a job from its JSON body"""
+    if not isinstance(payload, dict):
+        raise ValueError("The request body must be a JSON object")
+    unknown = sorted(set(payload) - set(JOB_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown job options: {', '.join(unknown)}")
+    # Extract jobs never default to the rez repository the daemon writes to
+    required = ("name", "version", "output") if command == "extract" else ("name", "version")
+    for field in required:
+        if not payload.get(field):
+            raise ValueError(f"Missing job option: {field}")
+
+    values = dict(JOB_DEFAULTS)
+    values.update(state.defaults)
+    values.update(payload)
+    if values["source"] == "github" and not values.get("repo"):
+        raise ValueError("When using github source, repo is required")
+    values["version"] = str(values["version"])
+    return SimpleNamespace(npm=state.npm, _is_test=False, **values)
+
+
+def run_job(state, command, payload):
+    """Run a create or extract job
+
+    Args:
+        state: Server state from make_server
+        command: ``create`` or ``extract``
+        payload: Parsed JSON body of the request
+
+    Returns:
+        dict: Result with success, package_dir or output, error, duration
+            and the timing report of the job
+    """
+    start = time.time()
+    result = {"success": False, "error": None}
+    try:
+        args = _job_args(state, payload, command)
+        with state.slots, collect(command=command,
+                                  package=f"{args.name}@{args.version}") as report:
+            if command == "create":
+                result["package_dir"] = create_package(args)
+                result["success"] = True
+            else:
+                result["output"] = os.path.abspath(args.output)
+                result["success"] = bool(extract_node_package(args, args.output))
+                if not result["success"]:
+                    result["error"] = f"Failed to extract {args.name}@{args.version}"
+        result["version"] = args.version
+        result["report"] = report
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+
+    result["duration"] = round(time.time() - start, 6)
+    with state.lock:
+        state.jobs += 1
+        state.failed += 0 if result["success"] else 1
+    return result
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Handle job and query requests of the npm2rez daemon"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _check_host(self):
+        """Reject requests that do not name a local host, sending the error"""
+        host = self.headers.get("Host")
+        if host and _host_name(host) in self.server.state.hosts:
+            return True
+        self._send_json(403, {"success": False, "error": f"Host not allowed: {host}"})
+        return False
+
+    def do_POST(self):  # noqa: N802
+        if not self._check_host():
+            return
+        # Browsers only send JSON cross-site after a preflight the daemon never answers
+        if self.headers.get_content_type() != "application/json":
+            self._send_json(415, {"success": False,
+                                  "error": "Content-Type must be application/json"})
+            return
+        command = self.path.strip("/")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"success": False, "error": f"Invalid JSON: {e}"})
+            return
+        if command not in ("create", "extract"):
+            self._send_json(404, {"success": False, "error": f"Unknown job: {command}"})
+            return
+        result = run_job(self.server.state, command, payload)
+        self._send_json(200 if result["success"] else 422, result)
+
+    def do_GET(self):  # noqa: N802
+        if not self._check_host():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        state = self.server.state
+        if url.path == "/status":
+            self._send_json(200, {
+                "uptime": round(time.time() - state.started, 3),
+                "npm": state.npm,
+                "jobs": state.jobs,
+                "failed": state.failed,
+            })
+        elif url.path == "/packages":
+            output = query.get("output") or state.defaults.get("output") or \
+                JOB_DEFAULTS["output"]
+            packages = repoindex.find_packages(output, query.get("name"), query.get("version"))
+            self._send_json(200 if packages else 404, packages)
+        else:
+            self._send_json(404, {"error": f"Unknown path: {url.path}"})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        if not self.server.state.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server listening on a Unix socket"""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        # A socket left behind by a previous server would fail the bind
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        # Create the socket private, other users must never get to connect
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+
+def make_server(socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, jobs=None,
+                defaults=None, quiet=False):
+    """Create the npm2rez daemon and warm it up
+
+    Args:
+        socket_path: Unix socket to listen on, None to listen on host and port
+        host: Address to listen on without a socket path, requests may also
+            name it in their Host header
+        port: TCP port to listen on without a socket path, 0 for any free port
+        jobs: Maximum number of jobs running at the same time (defaults to
+            the CPU count)
+        defaults: Job options used when a request does not set them, such
+            as ``cache_dir`` or ``registry``
+        quiet: Do not log requests
+
+    Returns:
+        socketserver.BaseServer: Server with a ``state`` attribute, run it
+            with ``serve_forever()``
+    """
+    state = SimpleNamespace(
+        # Probe npm once instead of once per job
+        npm=get_npm_executable(),
+        defaults={key: value for key, value in (defaults or {}).items() if value is not None},
+        slots=threading.BoundedSemaphore(jobs or os.cpu_count() or 1),
+        lock=threading.Lock(),
+        started=time.time(),
+        jobs=0,
+        failed=0,
+        quiet=quiet,
+        hosts=LOCAL_HOSTS if socket_path else LOCAL_HOSTS + (_host_name(host),),
+    )
+    if socket_path:
+        socket_path = os.path.abspath(socket_path)
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.state = state
+    return server
+
+
+def submit(address, command, payload=None, timeout=None):
+    """Send a job or query to a running npm2rez daemon
+
+    Args:
+        address: Unix socket path, or ``host:port``
+        command: ``create``, ``extract``, ``status`` or ``packages``
+        payload: Job options, or query parameters for ``packages``
+        timeout: Socket timeout in seconds, None to wait for the job
+
+    Returns:
+        tuple: (HTTP status, parsed JSON response)
+    """
+    if ":" in address and not os.path.exists(address):
+        host, port = address.rsplit(":", 1)
+        connection = HTTPConnection(host, int(port), timeout=timeout)
+    else:
+        connection = HTTPConnection("localhost", timeout=timeout)
+        connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.sock.settimeout(timeout)
+        connection.sock.connect(address)
+
+    try:
+        if command in ("create", "extract"):
+            body = json.dumps(payload or {}).encode("utf-8")
+            connection.request("POST", f"/{command}", body,
+                               {"Content-Type": "application/json"})
+        else:
+            query = urllib.parse.urlencode(payload or {})
+            connection.request("GET", f"/{command}" + (f"?{query}" if query else ""))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
@@ -0,0 +1,125 @@
+"""
+Build stamps for npm2rez - record finished rez packages
+
+A stamp file is written next to package.py once a package version has been
+built successfully. Its presence marks the version directory as complete,
+and the fingerprint it records lets reruns skip packages whose inputs did
+not change.
+"""
+
+import hashlib
+import json
+import os
+
+from npm2rez import __version__
+from npm2rez.prune import get_prune_rules
+
+STAMP_FILE = ".npm2rez.json"
+
+
+def get_stamp_path(package_dir):
+    """Get the stamp file path of a package version directory"""
+    return os.path.join(package_dir, STAMP_FILE)
+
+
+def hash_file(path):
+    """Get the sha256 hex digest of a file"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_fingerprint(args, **extra):
+    """Compute the fingerprint of the inputs of a package build
+
+    Args:
+        args: Command line arguments of the build
+        **extra: Additional inputs that affect the build
+
+    Returns:
+        str: sha256 hex digest of the build inputs
+    """
+    source = getattr(args, "source", "npm")
+    lockfile = getattr(args, "lockfile", None)
+    inputs = {
+        "name": args.name,
+        "version": args.version,
+        "source": source,
+        "installer": getattr(args, "installer", None) or "npm",
+        "repo": getattr(args, "repo", None),
+        # GitHub builds check out the version tag
+        "ref": f"v{args.version}" if source == "github" else None,
+        "node_version": getattr(args, "node_version", None),
+        "requires": list(getattr(args, "requires", [])),
+        "lockfile": hash_file(lockfile) if lockfile else None,
+        "prune": get_prune_rules(args),
+        "payload": getattr(args, "payload", None) or "dir",
+        "npm2rez_version": __version__,
+    }
+    inputs.update(extra)
+    data = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_up_to_date(package_dir, fingerprint):
+    """Check whether a package version directory was built from the same inputs
+
+    Args:
+        package_dir: Package version directory
+        fingerprint: Fingerprint of the current build inputs
+
+    Returns:
+        bool: True if the stamp records the same fingerprint
+    """
+    stamp = read_stamp(package_dir)
+    return bool(stamp) and stamp.get("fingerprint") == fingerprint
+
+
+def read_stamp(package_dir):
+    """Read the build stamp of a package version directory
+
+    Args:
+        package_dir: Package version directory
+
+    Returns:
+        dict or None: Stamp content, None if the package is not complete
+    """
+    stamp_path = get_stamp_path(package_dir)
+    if not os.path.exists(stamp_path):
+        return None
+    try:
+        with open(stamp_path, encoding="utf-8") as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stamp if isinstance(stamp, dict) else None
+
+
+def write_stamp(package_dir, args, **extra):
+    """Mark a package version directory as complete
+
+    Args:
+        package_dir: Package version directory
+        args: Command line arguments used for the build
+        **extra: Additional fields to record, such as a ``fingerprint``
+            overriding the one computed from args
+
+    Returns:
+        dict: Stamp content
+    """
+    stamp = {
+        "name": args.name,
+        "version": args.version,
+        "source": getattr(args, "source", "npm"),
+        "repo": getattr(args, "repo", None),
+        "node_version": getattr(args, "node_version", None),
+        "npm2rez_version": __version__,
+        "fingerprint": get_fingerprint(args),
+    }
+    stamp.update(extra)
+    with open(get_stamp_path(package_dir), "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=2, sort_keys=True)
+    return stamp
+
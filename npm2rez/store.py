@@ -0,0 +1,124 @@
+"""
+Content-addressed file store for npm2rez - share files between rez packages
+
+Every file of an installed node_modules tree is kept once in the store,
+under the sha256 of its content plus its executable bit. The node_modules
+directories of rez packages are then built from hardlinks into the store,
+so the same dependency shipped with many package versions takes its disk
+space only once.
+"""
+
+import errno
+import os
+import tempfile
+from functools import partial
+
+from npm2rez.fastcopy import copy_file
+from npm2rez.stamp import hash_file
+
+
+def get_store_dir(args):
+    """Get the content-addressed store directory
+
+    Args:
+        args: Command line arguments, may provide ``store``
+
+    Returns:
+        str or None: Absolute store directory, None if the store is disabled
+    """
+    store_dir = getattr(args, "store", None)
+    if not store_dir:
+        return None
+    return os.path.abspath(os.path.expanduser(store_dir))
+
+
+def get_store_path(store_dir, digest, executable=False):
+    """Get the store path of a file
+
+    Executable and regular files with the same content are different store
+    entries, since hardlinks share their permission bits.
+
+    Args:
+        store_dir: Store directory
+        digest: sha256 hex digest of the content
+        executable: Whether the file is executable
+
+    Returns:
+        str: Path of the file in the store
+    """
+    name = digest[2:] + ("-exec" if executable else "")
+    return os.path.join(store_dir, "files", digest[:2], name)
+
+
+def add_file(store_dir, src):
+    """Add a file to the store unless its content is already there
+
+    Store files are read-only, so a hardlinked payload cannot be edited in
+    place by accident.
+
+    Args:
+        store_dir: Store directory
+        src: File to add
+
+    Returns:
+        str: Path of the file in the store
+    """
+    executable = bool(os.stat(src).st_mode & 0o111)
+    store_path = get_store_path(store_dir, hash_file(src), executable)
+    if os.path.exists(store_path):
+        return store_path
+
+    # Copy to a temporary name first, concurrent jobs may add the same file
+    shard_dir = os.path.dirname(store_path)
+    os.makedirs(shard_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=shard_dir, prefix=".tmp-")
+    os.close(fd)
+    try:
+        copy_file(src, temp_path)
+        os.chmod(temp_path, 0o555 if executable else 0o444)
+        os.replace(temp_path, store_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return store_path
+
+
+def link_file(store_dir, src, dst):
+    """Place a file by hardlinking it from the store
+
+    Falls back to copying the store file when it cannot be hardlinked, for
+    example when the store is on another filesystem.
+
+    Args:
+        store_dir: Store directory
+        src: Source file
+        dst: Destination path
+
+    Returns:
+        int: Size of the file
+    """
+    store_path = add_file(store_dir, src)
+    try:
+        os.link(store_path, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EACCES):
+            raise
+        return copy_file(store_path, dst)
+    return os.stat(store_path).st_size
+
+
+def get_copy_function(args):
+    """Get the file copy function for a build
+
+    Args:
+        args: Command line arguments, may provide ``store``
+
+    Returns:
+        callable or None: Function(src, dst) linking files from the store,
+            None to copy files normally
+    """
+    store_dir = get_store_dir(args)
+    if store_dir is None:
+        return None
+    return partial(link_file, store_dir)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Test archive payloads for npm2rez package
+"""
+
+import os
+import tarfile
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez.archive import write_archive
+from npm2rez.core import create_bin_files, create_package_py
+
+
+class FakeEnv:
+    """Minimal stand-in for the rez ``env`` object"""
+
+    def __init__(self):
+        self.__dict__["vars"] = {}
+
+    def __contains__(self, name):
+        return name in self.vars
+
+    def __getattr__(self, name):
+        return self.vars.setdefault(name, [])
+
+    def __setattr__(self, name, value):
+        self.vars[name] = [value]
+
+
+def _make_payload(package_dir, args):
+    """Create a small installed payload"""
+    module = package_dir / "node_modules" / "typescript"
+    (module / "bin").mkdir(parents=True)
+    (module / "bin" / "tsc").write_text("console.log('tsc');\n")
+    (module / "package.json").write_text('{"name": "typescript"}')
+    create_bin_files(args, str(package_dir / "bin"), "typescript", ["tsc"])
+
+
+@pytest.mark.parametrize("mode", ["tar", "tar.gz", "tar.xz"])
+def test_write_archive_is_deterministic(tmp_path, mode):
+    """Test the same payload always produces the same archive"""
+    args = SimpleNamespace(name="typescript", version="4.9.5", node_version="16")
+    digests = []
+    for attempt in ("first", "second"):
+        package_dir = tmp_path / attempt
+        _make_payload(package_dir, args)
+        os.utime(package_dir / "bin" / "tsc", (1000 * len(attempt),) * 2)
+        archive_name, digest = write_archive(str(package_dir), mode)
+        digests.append(digest)
+
+        assert not (package_dir / "node_modules").exists()
+        with tarfile.open(package_dir / archive_name) as tar:
+            names = tar.getnames()
+            assert all(member.mtime == 0 and member.uid == 0 for member in tar.getmembers())
+        assert names == sorted(names, key=lambda name: name.split("/"))
+
+    assert digests[0] == digests[1]
+
+
+def test_package_py_unpacks_archive(tmp_path):
+    """Test package.py unpacks the payload into the local cache once"""
+    args = SimpleNamespace(name="typescript", version="4.9.5", node_version="16")
+    package_dir = tmp_path / "typescript" / "4.9.5"
+    _make_payload(package_dir, args)
+    archive = write_archive(str(package_dir), "tar.gz")
+    create_package_py(args, str(package_dir), archive=archive)
+
+    namespace = {}
+    with open(package_dir / "package.py") as f:
+        exec(f.read(), namespace)
+
+    cache_dir = tmp_path / "cache"
+    for _ in range(2):
+        env = FakeEnv()
+        namespace.update(env=env, this=SimpleNamespace(root=str(package_dir)))
+        with mock.patch.dict(os.environ, {"NPM2REZ_PAYLOAD_CACHE": str(cache_dir)}):
+            namespace["commands"]()
+
+    payload_dir = cache_dir / "typescript" / "4.9.5" / archive[1][:16]
+    assert env.PATH == [str(payload_dir / "bin")]
+    assert env.NODE_PATH == [str(payload_dir / "node_modules")]
+    assert (payload_dir / "node_modules" / "typescript" / "bin" / "tsc").exists()
+    assert os.access(payload_dir / "bin" / "tsc", os.X_OK)
+    assert os.listdir(payload_dir.parent) == [payload_dir.name]
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""
+Test batch conversion for npm2rez package
+"""
+
+import json
+import os
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from npm2rez.batch import build_entry, load_manifest, parse_entry_spec, run_batch
+from npm2rez.cli import cli
+
+
+@pytest.fixture
+def runner():
+    """Create CLI runner for testing"""
+    return CliRunner()
+
+
+def test_parse_entry_spec():
+    """Test parse_entry_spec with plain and scoped names"""
+    assert parse_entry_spec("typescript@4.9.5") == {"name": "typescript", "version": "4.9.5"}
+    assert parse_entry_spec("@types/node@18.11.9") == {
+        "name": "@types/node", "version": "18.11.9"
+    }
+    assert parse_entry_spec("typescript@4.9.5,github,microsoft/TypeScript,18") == {
+        "name": "typescript",
+        "version": "4.9.5",
+        "source": "github",
+        "repo": "microsoft/TypeScript",
+        "node_version": "18",
+    }
+    # Empty fields are skipped
+    assert parse_entry_spec("eslint@8.0.0,npm,,18") == {
+        "name": "eslint", "version": "8.0.0", "source": "npm", "node_version": "18"
+    }
+
+    with pytest.raises(ValueError):
+        parse_entry_spec("typescript")
+
+
+def test_load_manifest_formats(tmp_path):
+    """Test load_manifest with plain, JSON and TOML manifests"""
+    plain = tmp_path / "manifest.txt"
+    plain.write_text("# tools\ntypescript@4.9.5\n\n@types/node@18.11.9  # types\n")
+    assert [e["name"] for e in load_manifest(str(plain))] == ["typescript", "@types/node"]
+
+    as_json = tmp_path / "manifest.json"
+    as_json.write_text(json.dumps({"packages": [
+        "typescript@4.9.5",
+        {"name": "eslint", "version": "8.0.0", "node_version": 18},
+    ]}))
+    entries = load_manifest(str(as_json))
+    assert entries[1] == {"name": "eslint", "version": "8.0.0", "node_version": "18"}
+
+    as_toml = tmp_path / "manifest.toml"
+    as_toml.write_text(
+        '[[package]]\nname = "typescript"\nversion = "4.9.5"\n\n'
+        '[[package]]\nname = "typescript"\nversion = "5.0.2"\nsource = "github"\n'
+        'repo = "microsoft/TypeScript"\n'
+    )
+    entries = load_manifest(str(as_toml))
+    assert [e["version"] for e in entries] == ["4.9.5", "5.0.2"]
+    assert entries[1]["repo"] == "microsoft/TypeScript"
+
+
+def test_build_entry_reports_failure(tmp_path):
+    """Test build_entry never raises and reports the error"""
+    with mock.patch("npm2rez.batch.create_package") as mock_create:
+        mock_create.side_effect = RuntimeError("boom")
+        result = build_entry({"name": "typescript", "version": "4.9.5"}, str(tmp_path))
+
+    assert result["success"] is False
+    assert result["error"] == "boom"
+
+    result = build_entry({"name": "typescript", "version": "4.9.5", "source": "github"},
+                         str(tmp_path))
+    assert result["success"] is False
+    assert "repo is required" in result["error"]
+
+
+def test_run_batch_keeps_going(tmp_path):
+    """Test run_batch continues after failures and summarizes results"""
+    def fake_create(args):
+        if args.name == "broken":
+            raise RuntimeError("install failed")
+        assert args.npm == "/usr/bin/npm"
+        return str(tmp_path / args.name / args.version)
+
+    entries = [
+        {"name": "typescript", "version": "4.9.5"},
+        {"name": "broken", "version": "1.0.0"},
+        {"name": "eslint", "version": "8.0.0"},
+    ]
+    with mock.patch("npm2rez.batch.get_npm_executable") as mock_get_npm:
+        with mock.patch("npm2rez.batch.create_package", side_effect=fake_create):
+            mock_get_npm.return_value = "/usr/bin/npm"
+            summary = run_batch(entries, str(tmp_path), jobs=1)
+
+    # npm is probed once for the whole batch
+    mock_get_npm.assert_called_once()
+    assert summary["total"] == 3
+    assert summary["succeeded"] == 2
+    assert summary["failed"] == 1
+    assert [r["name"] for r in summary["results"]] == ["typescript", "broken", "eslint"]
+
+
+def test_run_batch_process_pool(tmp_path):
+    """Test run_batch with worker processes when every entry fails"""
+    # A file where the output directory should be makes every entry fail
+    output = tmp_path / "not-a-directory"
+    output.write_text("")
+
+    entries = [{"name": "a", "version": "1.0.0"}, {"name": "b", "version": "2.0.0"}]
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value=None):
+        summary = run_batch(entries, str(output), jobs=2)
+
+    assert summary["failed"] == 2
+    assert all(result["error"] for result in summary["results"])
+
+
+def test_batch_command(runner, tmp_path):
+    """Test batch command output"""
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("typescript@4.9.5\n")
+
+    with mock.patch("npm2rez.cli.run_batch") as mock_run:
+        mock_run.return_value = {
+            "total": 1, "succeeded": 1, "failed": 0, "duration": 1.0, "results": []
+        }
+        result = runner.invoke(cli, ["batch", str(manifest), "--jobs", "4"])
+
+    assert result.exit_code == 0
+    assert "1 succeeded, 0 failed" in result.output
+    entries = mock_run.call_args[0][0]
+    assert entries == [{"name": "typescript", "version": "4.9.5"}]
+    assert mock_run.call_args[1]["jobs"] == 4
+
+    # Failed entries fail the command
+    with mock.patch("npm2rez.cli.run_batch") as mock_run:
+        mock_run.return_value = {
+            "total": 1, "succeeded": 0, "failed": 1, "duration": 1.0, "results": []
+        }
+        result = runner.invoke(cli, ["batch", str(manifest)])
+    assert result.exit_code == 1
+
+
+def test_run_batch_combined(tmp_path):
+    """Test run_batch installs npm entries with one combined install"""
+    entries = [
+        {"name": "typescript", "version": "4.9.5"},
+        {"name": "eslint", "version": "8.0.0"},
+        {"name": "typescript", "version": "5.0.2", "source": "github",
+         "repo": "microsoft/TypeScript"},
+    ]
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.batch.install_many_from_npm") as mock_install_many:
+            with mock.patch("npm2rez.batch.create_package") as mock_create:
+                with mock.patch("builtins.print"):
+                    mock_install_many.return_value = [True, False]
+                    summary = run_batch(entries, str(tmp_path), jobs=1, combined=True)
+
+    args_list, package_dirs = mock_install_many.call_args[0][1:]
+    assert [args.name for args in args_list] == ["typescript", "eslint"]
+    # Packages are installed into build directories next to their version directories
+    assert os.path.dirname(package_dirs[0]) == str(tmp_path / "typescript")
+    assert os.path.basename(package_dirs[0]).startswith(".build-4.9.5-")
+    # Only successful installs are published, build directories are cleaned up
+    assert (tmp_path / "typescript" / "4.9.5" / "package.py").exists()
+    assert not (tmp_path / "eslint" / "8.0.0").exists()
+    assert not os.path.exists(package_dirs[1])
+    # The github entry still goes through create_package
+    mock_create.assert_called_once()
+    assert [r["success"] for r in summary["results"]] == [True, False, True]
+
+
+def test_build_combined_isolates_entry_errors(tmp_path):
+    """Test a failing entry of a combined build does not fail the others"""
+    entries = [
+        {"name": "typescript", "version": "4.9.5"},
+        {"name": "eslint", "version": "8.0.0"},
+    ]
+
+    def fake_finish(args, build_dir):
+        if args.name == "eslint":
+            raise OSError("disk full")
+
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.batch.install_many_from_npm", return_value=[True, True]):
+            with mock.patch("npm2rez.batch.finish_payload", side_effect=fake_finish):
+                with mock.patch("builtins.print"):
+                    summary = run_batch(entries, str(tmp_path), jobs=1, combined=True)
+
+    typescript, eslint = summary["results"]
+    assert typescript["success"] is True
+    assert (tmp_path / "typescript" / "4.9.5" / "package.py").exists()
+    assert eslint["success"] is False
+    assert eslint["error"] == "disk full"
+    assert not (tmp_path / "eslint" / "8.0.0").exists()
+
+    # An install that raises fails every pending entry with its error
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.batch.install_many_from_npm",
+                        side_effect=RuntimeError("registry down")):
+            with mock.patch("builtins.print"):
+                summary = run_batch(entries, str(tmp_path), jobs=1, combined=True,
+                                    options={"force": True})
+    assert [r["error"] for r in summary["results"]] == ["registry down", "registry down"]
+
+
+def test_run_batch_manifest_order(tmp_path):
+    """Test entries that fail to resolve are reported in manifest order"""
+    def fake_resolve(args):
+        if args.version == "^9":
+            raise ValueError("No version of typescript matches ^9")
+        return "4.9.5" if args.version == "^4" else args.version
+
+    entries = [
+        {"name": "eslint", "version": "8.0.0"},
+        {"name": "typescript", "version": "^9"},
+        {"name": "typescript", "version": "^4"},
+    ]
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.batch.resolve_version", side_effect=fake_resolve):
+            with mock.patch("npm2rez.batch.create_package",
+                            side_effect=lambda args: str(tmp_path / args.name)):
+                summary = run_batch(entries, str(tmp_path), jobs=1)
+
+    assert [(r["name"], r["version"], r["success"]) for r in summary["results"]] == [
+        ("eslint", "8.0.0", True), ("typescript", "^9", False), ("typescript", "4.9.5", True),
+    ]
+
+
+def test_run_batch_combined_honors_native_installer(tmp_path):
+    """Test combined batches leave native installer entries to create_package"""
+    entries = [{"name": "typescript", "version": "4.9.5"}]
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.batch.install_many_from_npm") as mock_install_many:
+            with mock.patch("npm2rez.batch.create_package") as mock_create:
+                summary = run_batch(entries, str(tmp_path), jobs=1, combined=True,
+                                    options={"installer": "native"})
+
+    mock_install_many.assert_not_called()
+    assert mock_create.call_args[0][0].installer == "native"
+    assert summary["succeeded"] == 1
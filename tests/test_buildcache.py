@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Test the build artifact cache for npm2rez package
+"""
+
+import json
+import os
+import subprocess
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez.buildcache import get_build_cache_dir
+from npm2rez.core import install_from_github
+
+pytestmark = pytest.mark.skipif(
+    subprocess.call(["git", "--version"], stdout=subprocess.DEVNULL) != 0,
+    reason="git is not installed"
+)
+
+
+def _git(*args, cwd):
+    """Run git quietly with a fixed identity"""
+    subprocess.check_call(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """Create a local upstream repository with a v1.0.0 tag"""
+    repo_dir = tmp_path / "upstream"
+    repo_dir.mkdir()
+    _git("init", "-q", cwd=str(repo_dir))
+    (repo_dir / "package.json").write_text(json.dumps({"name": "tool", "version": "1.0.0"}))
+    _git("add", "package.json", cwd=str(repo_dir))
+    _git("commit", "-q", "-m", "1.0.0", cwd=str(repo_dir))
+    _git("tag", "v1.0.0", cwd=str(repo_dir))
+    return repo_dir
+
+
+def _install(args, install_path, npm_calls):
+    """Run install_from_github with real git and a fake npm build"""
+    real_check_call = subprocess.check_call
+
+    def fake_check_call(cmd, **kwargs):
+        if cmd[0] == "git":
+            kwargs.setdefault("stdout", subprocess.DEVNULL)
+            kwargs.setdefault("stderr", subprocess.DEVNULL)
+            return real_check_call(cmd, **kwargs)
+        if cmd[1] == "pack":
+            # No pack list, the files are selected in Python
+            return 0
+        npm_calls.append(cmd[1])
+        if cmd[1:3] == ["run", "build"]:
+            dist_dir = os.path.join(kwargs["cwd"], "dist")
+            os.makedirs(dist_dir)
+            with open(os.path.join(dist_dir, "index.js"), "w") as f:
+                f.write("module.exports = 1;\n")
+        return 0
+
+    os.makedirs(install_path)
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call), \
+            mock.patch("builtins.print"):
+        return install_from_github("/usr/bin/npm", args, install_path)
+
+
+def test_build_cache_skips_npm_for_built_commits(tmp_path, upstream):
+    """Test a second build of the same commit and toolchain is restored from the cache"""
+    args = SimpleNamespace(name="tool", version="1.0.0", repo=str(upstream),
+                           cache_dir=str(tmp_path / "cache"), build_cache=True)
+    npm_calls = []
+
+    with mock.patch("npm2rez.buildcache.get_tool_versions", return_value=("v18.0.0", "9.0.0")):
+        assert _install(args, str(tmp_path / "a"), npm_calls) is True
+        assert npm_calls == ["install", "run"]
+        assert len(os.listdir(get_build_cache_dir(args))) == 1
+
+        assert _install(args, str(tmp_path / "b"), npm_calls) is True
+        assert npm_calls == ["install", "run"]
+
+    with open(tmp_path / "b" / "dist" / "index.js") as f:
+        assert f.read() == "module.exports = 1;\n"
+
+    # Another Node.js version builds again
+    with mock.patch("npm2rez.buildcache.get_tool_versions", return_value=("v20.0.0", "9.0.0")):
+        assert _install(args, str(tmp_path / "c"), npm_calls) is True
+    assert npm_calls == ["install", "run", "install", "run"]
+    assert len(os.listdir(get_build_cache_dir(args))) == 2
+
+
+def test_build_cache_disabled(tmp_path, upstream):
+    """Test nothing is cached without build_cache"""
+    args = SimpleNamespace(name="tool", version="1.0.0", repo=str(upstream),
+                           cache_dir=str(tmp_path / "cache"))
+    npm_calls = []
+
+    assert _install(args, str(tmp_path / "a"), npm_calls) is True
+    assert _install(args, str(tmp_path / "b"), npm_calls) is True
+    assert npm_calls == ["install", "run", "install", "run"]
+    assert not os.path.exists(get_build_cache_dir(args))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+Test persistent download cache for npm2rez package
+"""
+
+import base64
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez import cache
+from npm2rez.core import install_from_npm
+
+
+@pytest.fixture
+def cache_args(tmp_path):
+    """Create arguments using a temporary cache directory"""
+    return SimpleNamespace(
+        name="is-number",
+        version="7.0.0",
+        cache_dir=str(tmp_path / "cache"),
+        offline=False,
+        _is_test=False
+    )
+
+
+def _integrity(data):
+    """Build an SRI sha512 integrity string"""
+    return "sha512-" + base64.b64encode(hashlib.sha512(data).digest()).decode("ascii")
+
+
+def _lockfile(integrity):
+    """Build a minimal v3 lockfile for is-number"""
+    return {
+        "name": "temp",
+        "lockfileVersion": 3,
+        "packages": {
+            "": {"dependencies": {"is-number": "7.0.0"}},
+            "node_modules/is-number": {
+                "version": "7.0.0",
+                "resolved": "https://registry.npmjs.org/is-number/-/is-number-7.0.0.tgz",
+                "integrity": integrity,
+            },
+        },
+    }
+
+
+def test_get_cache_dir(monkeypatch, tmp_path):
+    """Test cache directory precedence"""
+    monkeypatch.setenv("NPM2REZ_CACHE_DIR", str(tmp_path / "env"))
+    assert cache.get_cache_dir() == str(tmp_path / "env")
+    args = SimpleNamespace(cache_dir=str(tmp_path / "arg"))
+    assert cache.get_cache_dir(args) == str(tmp_path / "arg")
+
+
+def test_npm_cache_args(cache_args):
+    """Test npm cache flags"""
+    npm_cache = os.path.join(cache_args.cache_dir, "npm")
+    assert cache.npm_cache_args(cache_args) == ["--cache", npm_cache, "--prefer-offline"]
+    assert cache.npm_cache_args(cache_args, offline=True)[-1] == "--offline"
+    cache_args.offline = True
+    assert cache.npm_cache_args(cache_args)[-1] == "--offline"
+
+
+def test_lockfile_is_cached(cache_args):
+    """Test lockfile_is_cached checks npm's content store"""
+    integrity = _integrity(b"tarball")
+    lockfile = _lockfile(integrity)
+    assert cache.lockfile_is_cached(cache_args, lockfile) is False
+
+    content_path = cache.integrity_to_content_path(cache_args, integrity)
+    assert os.sep.join(["_cacache", "content-v2", "sha512"]) in content_path
+    os.makedirs(os.path.dirname(content_path))
+    with open(content_path, "wb") as f:
+        f.write(b"tarball")
+    assert cache.lockfile_is_cached(cache_args, lockfile) is True
+
+
+def test_record_and_load_lockfile(cache_args, tmp_path):
+    """Test recording an install and loading it back"""
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    assert cache.record_install(cache_args, str(project_dir)) is False
+
+    lockfile = _lockfile(_integrity(b"tarball"))
+    (project_dir / "package-lock.json").write_text(json.dumps(lockfile))
+    assert cache.record_install(cache_args, str(project_dir)) is True
+
+    assert cache.load_cached_lockfile(cache_args, "is-number", "7.0.0") == lockfile
+    assert cache.load_cached_lockfile(cache_args, "is-number", "6.0.0") is None
+
+
+def test_record_install_from_threads(cache_args, tmp_path):
+    """Test threads recording the same entry do not share a temporary file"""
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    lockfile = _lockfile(_integrity(b"tarball"))
+    (project_dir / "package-lock.json").write_text(json.dumps(lockfile))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda _: cache.record_install(cache_args, str(project_dir)), range(32)
+        ))
+
+    assert all(results)
+    assert cache.load_cached_lockfile(cache_args, "is-number", "7.0.0") == lockfile
+    index_dir = os.path.dirname(cache._index_path(cache_args, "is-number", "7.0.0"))
+    assert not [name for name in os.listdir(index_dir) if name.startswith(".tmp-")]
+
+
+def test_install_from_npm_uses_cache(cache_args, tmp_path):
+    """Test install_from_npm replays cached lockfiles offline"""
+    data = b"tarball"
+    lockfile = _lockfile(_integrity(data))
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "package-lock.json").write_text(json.dumps(lockfile))
+    cache.record_install(cache_args, str(project_dir))
+
+    content_path = cache.integrity_to_content_path(cache_args, _integrity(data))
+    os.makedirs(os.path.dirname(content_path))
+    with open(content_path, "wb") as f:
+        f.write(data)
+
+    install_path = tmp_path / "out" / "7.0.0"
+    install_path.mkdir(parents=True)
+
+    def fake_install(cmd, cwd):
+        # The recorded lockfile is replayed into the npm project
+        assert os.path.exists(os.path.join(cwd, "package-lock.json"))
+
+    with mock.patch("subprocess.check_call", side_effect=fake_install) as mock_check_call:
+        with mock.patch("builtins.print"):
+            result = install_from_npm("/usr/bin/npm", cache_args, str(install_path))
+
+    assert result is True
+    cmd = mock_check_call.call_args[0][0]
+    assert cmd[:2] == ["/usr/bin/npm", "install"]
+    assert "--cache" in cmd
+    assert "--offline" in cmd
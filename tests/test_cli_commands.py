@@ -137,7 +137,7 @@ def test_create_command_github_source_missing_repo(runner):
         '--output', './rez-packages',
         '--source', 'github'
     ])
-    assert result.exit_code == 0
+    assert result.exit_code == 1
     assert 'Error: When using github source, --repo is required' in result.output
 
 
@@ -186,5 +186,20 @@ def test_extract_command_failure(runner):
         ])
 
         # Verify result
-        assert result.exit_code == 0
+        assert result.exit_code == 1
         assert 'Failed to extract' in result.output
+
+
+def test_serve_command_default_socket(runner, tmp_path):
+    """Test serve listens on a socket in the cache directory unless --tcp is given"""
+    with mock.patch("npm2rez.cli.make_server") as mock_make_server, \
+            mock.patch("npm2rez.cli.signal.signal"):
+        mock_make_server.return_value.serve_forever.side_effect = KeyboardInterrupt
+        result = runner.invoke(cli, ["serve", "--cache-dir", str(tmp_path)])
+        assert result.exit_code == 0, result.output
+        assert mock_make_server.call_args[0][0] == str(tmp_path / "serve.sock")
+
+        result = runner.invoke(cli, ["serve", "--tcp", "--port", "9000"])
+        assert result.exit_code == 0, result.output
+        assert mock_make_server.call_args[0][0] is None
+        assert mock_make_server.call_args[1]["port"] == 9000
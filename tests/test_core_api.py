@@ -4,6 +4,7 @@
 Test core API functions for npm2rez package
 """
 
+import json
 import os
 from types import SimpleNamespace
 from unittest import mock
@@ -13,11 +14,13 @@ import pytest
 # No need to manually register pyfakefs plugin, it will be registered automatically
 from npm2rez.core import (
     convert_name_to_rez_format,
+    create_bin_files,
     create_package_py,
     extract_node_package,
     get_npm_executable,
     install_from_github,
     install_from_npm,
+    install_many_from_npm,
     install_node_package,
 )
 
@@ -91,6 +94,22 @@ def test_create_package_py(fs, mock_args):
             assert 'env.NODE_PATH = "{root}/node_modules"' in content
 
 
+def test_create_bin_files_only_writes_changes(tmp_path, mock_args):
+    """Test create_bin_files leaves unchanged shims untouched"""
+    bin_dir = tmp_path / "bin"
+    create_bin_files(mock_args, str(bin_dir), "typescript", ["tsc", "tsserver"])
+    tsc = bin_dir / "tsc"
+    assert "node_modules/typescript/bin/tsc" in tsc.read_text()
+    assert os.access(tsc, os.X_OK)
+
+    os.utime(tsc, (0, 0))
+    (bin_dir / "tsserver").write_text("stale")
+    create_bin_files(mock_args, str(bin_dir), "typescript", ["tsc", "tsserver"])
+
+    assert os.stat(tsc).st_mtime == 0
+    assert "node_modules/typescript/bin/tsserver" in (bin_dir / "tsserver").read_text()
+
+
 def test_install_from_npm(fs, mock_args):
     """Test install_from_npm function with test mode"""
     # Create test directory
@@ -173,6 +192,46 @@ def test_install_from_github(fs):
             mock_check_call.assert_called()
 
 
+def test_install_from_github_runtime_closure(tmp_path):
+    """Test install_from_github leaves the build toolchain behind"""
+    args = SimpleNamespace(name="tool", version="1.0.0", repo="user/tool")
+    install_path = tmp_path / "tool" / "1.0.0"
+    install_path.mkdir(parents=True)
+
+    def write_package(path, package_json):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "package.json"), "w") as f:
+            json.dump(package_json, f)
+
+    def fake_check_call(cmd, cwd=None):
+        if cmd[0] == "git":
+            repo_dir = cmd[-1]
+            write_package(repo_dir, {
+                "name": "tool",
+                "bin": {"tool": "cli.js"},
+                "dependencies": {"lib": "^1"},
+                "devDependencies": {"webpack": "^5"},
+            })
+            modules = os.path.join(repo_dir, "node_modules")
+            write_package(os.path.join(modules, "lib"),
+                          {"bin": "lib.js", "name": "lib", "dependencies": {"dep": "^1"}})
+            write_package(os.path.join(modules, "dep"), {})
+            write_package(os.path.join(modules, "webpack"),
+                          {"bin": {"webpack": "cli.js"}, "dependencies": {"acorn": "^8"}})
+            write_package(os.path.join(modules, "acorn"), {})
+            os.makedirs(os.path.join(modules, ".bin"))
+            for name in ("tool", "lib", "webpack"):
+                open(os.path.join(modules, ".bin", name), "w").close()
+
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("builtins.print"):
+            assert install_from_github("/usr/bin/npm", args, str(install_path)) is True
+
+    assert sorted(os.listdir(install_path / "node_modules")) == ["dep", "lib"]
+    # The build toolchain gets no shims
+    assert sorted(os.listdir(install_path / "bin")) == ["lib", "tool"]
+
+
 def test_install_node_package_npm_success(mock_args):
     """Test install_node_package with npm source"""
     with mock.patch('npm2rez.core.get_npm_executable') as mock_get_npm:
@@ -192,6 +251,45 @@ def test_install_node_package_npm_success(mock_args):
             )
 
 
+def test_install_node_package_variants(tmp_path, mock_args):
+    """Test Node.js variants share pure JavaScript payloads and rebuild native ones"""
+    mock_args.node_version = "16,18,20"
+    calls = []
+
+    def fake_install(npm, args, install_path, is_test):
+        calls.append((args.node_version, install_path))
+        package_dir = os.path.join(install_path, "node_modules", args.name)
+        os.makedirs(package_dir)
+        with open(os.path.join(package_dir, "index.js"), "w") as f:
+            f.write("module.exports = {};\n")
+        if args.name == "native":
+            open(os.path.join(package_dir, "binding.gyp"), "w").close()
+        return True
+
+    with mock.patch("npm2rez.core.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.core.install_from_npm", side_effect=fake_install):
+            with mock.patch("builtins.print"):
+                assert install_node_package(mock_args, str(tmp_path / "js")) is True
+                mock_args.name = "native"
+                assert install_node_package(mock_args, str(tmp_path / "native")) is True
+
+    # The pure JavaScript payload is installed once and hardlinked
+    assert calls[0] == ("16", str(tmp_path / "js" / "nodejs-16"))
+    first = tmp_path / "js" / "nodejs-16" / "node_modules" / "typescript" / "index.js"
+    for version in ("18", "20"):
+        variant = tmp_path / "js" / f"nodejs-{version}" / "node_modules" / "typescript"
+        assert os.path.samefile(first, variant / "index.js")
+
+    # Native addons are installed for every variant
+    assert [version for version, _ in calls[1:]] == ["16", "18", "20"]
+    assert calls[3][1] == str(tmp_path / "native" / "nodejs-20")
+
+    create_package_py(mock_args, str(tmp_path / "native"))
+    content = (tmp_path / "native" / "package.py").read_text()
+    assert '["nodejs-18"],' in content
+    assert "nodejs-16+" not in content
+
+
 def test_install_node_package_npm_failure(mock_args):
     """Test install_node_package with npm source when npm fails"""
     # Create a test_args object with _is_test=False
@@ -280,3 +378,52 @@ def test_convert_name_to_rez_format():
 
     # Test with scoped package name
     assert convert_name_to_rez_format("@types/node") == "types_node"
+
+
+def test_install_many_from_npm(tmp_path):
+    """Test one npm install split into per-package payloads"""
+    def fake_npm_install(cmd, cwd):
+        with open(os.path.join(cwd, "package.json")) as f:
+            dependencies = json.load(f)["dependencies"]
+        # The second typescript version is installed under an alias
+        assert dependencies["typescript"] == "4.9.5"
+        alias = "npm2rez-alias-2-typescript"
+        assert dependencies[alias] == "npm:typescript@5.0.2"
+
+        modules = os.path.join(cwd, "node_modules")
+        packages = {
+            "typescript": {"name": "typescript", "bin": {"tsc": "bin/tsc"}},
+            alias: {"name": "typescript", "bin": {"tsc": "bin/tsc"}},
+            "eslint": {"name": "eslint", "dependencies": {"chalk": "^4"}},
+            "chalk": {"name": "chalk"},
+        }
+        for name, package_json in packages.items():
+            os.makedirs(os.path.join(modules, name))
+            with open(os.path.join(modules, name, "package.json"), "w") as f:
+                json.dump(package_json, f)
+
+    args_list = [
+        SimpleNamespace(name="typescript", version="4.9.5", _is_test=False),
+        SimpleNamespace(name="eslint", version="8.0.0", _is_test=False),
+        SimpleNamespace(name="typescript", version="5.0.2", _is_test=False),
+    ]
+    install_paths = [
+        str(tmp_path / "typescript" / "4.9.5"),
+        str(tmp_path / "eslint" / "8.0.0"),
+        str(tmp_path / "typescript" / "5.0.2"),
+    ]
+
+    with mock.patch("subprocess.check_call", side_effect=fake_npm_install) as mock_check_call:
+        with mock.patch("builtins.print"):
+            results = install_many_from_npm("/usr/bin/npm", args_list, install_paths)
+
+    assert results == [True, True, True]
+    mock_check_call.assert_called_once()
+
+    ts_modules = tmp_path / "typescript" / "5.0.2" / "node_modules"
+    assert sorted(os.listdir(ts_modules)) == ["typescript"]
+    assert (tmp_path / "typescript" / "5.0.2" / "bin" / "tsc").exists()
+    assert sorted(os.listdir(tmp_path / "eslint" / "8.0.0" / "node_modules")) == [
+        "chalk", "eslint"
+    ]
+    assert not (tmp_path / "eslint" / "8.0.0" / "bin").exists()
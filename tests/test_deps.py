@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""
+Test dependency helpers for npm2rez package
+"""
+
+import json
+
+import pytest
+
+from npm2rez.deps import (
+    build_dependency_graph,
+    closure_roots,
+    dependency_closure,
+    get_bin_names,
+    get_runtime_dependencies,
+    load_lockfile,
+    merge_cycles,
+    nest_duplicates,
+    resolve_module,
+    topological_levels,
+)
+
+
+def _write_package(path, name, **fields):
+    """Write a package.json into a package directory"""
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "package.json").write_text(json.dumps(dict(name=name, version="1.0.0", **fields)))
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Create an installed npm project
+
+    app -> lib, chalk; lib -> semver (nested copy), missing optional dep
+    """
+    modules = tmp_path / "node_modules"
+    _write_package(modules / "app", "app", dependencies={"lib": "^1", "chalk": "^4"})
+    _write_package(modules / "lib", "lib", dependencies={"semver": "^7"},
+                   optionalDependencies={"fsevents": "*"})
+    _write_package(modules / "lib" / "node_modules" / "semver", "semver")
+    _write_package(modules / "semver", "semver")
+    _write_package(modules / "chalk", "chalk")
+    _write_package(modules / "unrelated", "unrelated")
+    return tmp_path
+
+
+def test_get_runtime_dependencies():
+    """Test runtime dependency names skip devDependencies"""
+    package_json = {
+        "dependencies": {"a": "1"},
+        "optionalDependencies": {"b": "1"},
+        "peerDependencies": {"a": "1", "c": "1"},
+        "devDependencies": {"jest": "1"},
+    }
+    assert get_runtime_dependencies(package_json) == ["a", "b", "c"]
+
+
+def test_get_bin_names():
+    """Test bin names from string and object bin fields"""
+    assert get_bin_names({"name": "@scope/tool", "bin": "cli.js"}) == ["tool"]
+    assert get_bin_names({"bin": {"tsc": "bin/tsc", "tsserver": "bin/tsserver"}}) == [
+        "tsc", "tsserver"
+    ]
+    assert get_bin_names({}) == []
+
+
+def test_resolve_module(project):
+    """Test nested node_modules win over hoisted ones"""
+    root = str(project)
+    assert resolve_module(root, "node_modules/lib", "semver") == \
+        "node_modules/lib/node_modules/semver"
+    assert resolve_module(root, "node_modules/app", "semver") == "node_modules/semver"
+    assert resolve_module(root, "node_modules/app", "missing") is None
+
+
+def test_dependency_closure(project):
+    """Test dependency closure and its copy roots"""
+    closure = dependency_closure(str(project), "node_modules/app")
+    assert set(closure) == {
+        "node_modules/app",
+        "node_modules/lib",
+        "node_modules/chalk",
+        "node_modules/lib/node_modules/semver",
+    }
+    assert closure_roots(closure) == [
+        "node_modules/app", "node_modules/chalk", "node_modules/lib"
+    ]
+
+
+@pytest.fixture
+def lockfile():
+    """Create a lockfile for app -> lib, chalk; lib -> semver@6 (nested), chalk <-> ansi"""
+    return {
+        "lockfileVersion": 3,
+        "packages": {
+            "": {"dependencies": {"app": "1.0.0"}},
+            "node_modules/app": {
+                "version": "1.0.0", "dependencies": {"lib": "^1", "chalk": "^4"}
+            },
+            "node_modules/lib": {
+                "version": "1.2.0", "dependencies": {"semver": "^6"},
+                "optionalDependencies": {"fsevents": "*"}
+            },
+            "node_modules/lib/node_modules/semver": {"version": "6.3.0"},
+            "node_modules/semver": {"version": "7.5.0"},
+            "node_modules/chalk": {"version": "4.1.2", "dependencies": {"ansi": "^1"}},
+            "node_modules/ansi": {"version": "1.0.0", "peerDependencies": {"chalk": "*"}},
+        },
+    }
+
+
+def test_build_dependency_graph(lockfile):
+    """Test graph nodes, nested resolution and requires"""
+    graph = build_dependency_graph(lockfile, "node_modules/app")
+    assert set(graph) == {
+        ("app", "1.0.0"), ("lib", "1.2.0"), ("semver", "6.3.0"),
+        ("chalk", "4.1.2"), ("ansi", "1.0.0"),
+    }
+    assert graph[("app", "1.0.0")]["requires"] == [("lib", "1.2.0"), ("chalk", "4.1.2")]
+    assert graph[("semver", "6.3.0")]["location"] == "node_modules/lib/node_modules/semver"
+
+    limited = build_dependency_graph(lockfile, "node_modules/app", max_depth=1)
+    assert set(limited) == {("app", "1.0.0"), ("lib", "1.2.0"), ("chalk", "4.1.2")}
+    assert limited[("lib", "1.2.0")]["bundle"] is True
+    assert limited[("lib", "1.2.0")]["requires"] == []
+
+
+def test_topological_levels(lockfile):
+    """Test levels build dependencies first and cycles are merged"""
+    graph = build_dependency_graph(lockfile, "node_modules/app")
+    merged = merge_cycles(graph, ("app", "1.0.0"))
+    levels = topological_levels(graph)
+
+    # chalk is reached first, it carries ansi and app still requires it
+    assert merged == [(("chalk", "4.1.2"), [("ansi", "1.0.0")])]
+    assert [member["name"] for member in graph[("chalk", "4.1.2")]["members"]] == ["ansi"]
+    assert ("ansi", "1.0.0") not in graph
+    assert graph[("chalk", "4.1.2")]["requires"] == []
+    assert levels[0] == [("chalk", "4.1.2"), ("semver", "6.3.0")]
+    assert levels[-1] == [("app", "1.0.0")]
+    position = {key: i for i, level in enumerate(levels) for key in level}
+    for key, node in graph.items():
+        for dep in node["requires"]:
+            assert position[dep] < position[key]
+
+
+def test_merge_cycles():
+    """Test every member of a longer cycle stays required"""
+    def node(name, depth, *requires):
+        return {"name": name, "version": "1.0.0", "location": f"node_modules/{name}",
+                "depth": depth, "bundle": False,
+                "requires": [(dep, "1.0.0") for dep in requires]}
+
+    # root -> b -> c -> a -> b, and c -> d outside the cycle
+    graph = {
+        ("root", "1.0.0"): node("root", 0, "b"),
+        ("b", "1.0.0"): node("b", 1, "c"),
+        ("c", "1.0.0"): node("c", 2, "a", "d"),
+        ("a", "1.0.0"): node("a", 3, "b"),
+        ("d", "1.0.0"): node("d", 3),
+    }
+    merged = merge_cycles(graph, ("root", "1.0.0"))
+
+    assert merged == [(("b", "1.0.0"), [("a", "1.0.0"), ("c", "1.0.0")])]
+    assert graph[("b", "1.0.0")]["requires"] == [("d", "1.0.0")]
+    assert topological_levels(graph) == [
+        [("d", "1.0.0")], [("b", "1.0.0")], [("root", "1.0.0")]
+    ]
+
+    # The root itself in a cycle keeps its key
+    graph = {("root", "1.0.0"): node("root", 0, "a"), ("a", "1.0.0"): node("a", 1, "root")}
+    assert merge_cycles(graph, ("root", "1.0.0")) == [(("root", "1.0.0"), [("a", "1.0.0")])]
+    assert graph[("root", "1.0.0")]["requires"] == []
+
+    with pytest.raises(ValueError):
+        topological_levels({("a", "1.0.0"): node("a", 0, "b"), ("b", "1.0.0"): node("b", 1, "a")})
+
+
+def test_nest_duplicates():
+    """Test extra versions are nested in their dependents, aliases keep their name"""
+    lockfile = {
+        "lockfileVersion": 3,
+        "packages": {
+            "": {"dependencies": {"app": "1.0.0"}},
+            "node_modules/app": {
+                "version": "1.0.0",
+                "dependencies": {"lib": "^1", "semver": "^7", "width-cjs": "npm:width@^4"},
+            },
+            "node_modules/lib": {"version": "1.2.0", "dependencies": {"semver": "^6"}},
+            "node_modules/lib/node_modules/semver": {
+                "version": "6.3.0", "dependencies": {"lru": "^6"}
+            },
+            "node_modules/semver": {"version": "7.5.0", "dependencies": {"lru": "^6"}},
+            "node_modules/lru": {"version": "6.0.0"},
+            "node_modules/width-cjs": {"name": "width", "version": "4.2.3"},
+        },
+    }
+    graph = build_dependency_graph(lockfile, "node_modules/app")
+    # require("width-cjs") finds the aliased package under its alias
+    assert ("width-cjs", "4.2.3") in graph
+    assert graph[("app", "1.0.0")]["requires"] == [
+        ("lib", "1.2.0"), ("semver", "7.5.0"), ("width-cjs", "4.2.3")
+    ]
+
+    assert nest_duplicates(graph, ("app", "1.0.0")) == [("semver", "6.3.0")]
+    assert ("semver", "6.3.0") not in graph
+    lib = graph[("lib", "1.2.0")]
+    assert lib["requires"] == [("lru", "6.0.0")]
+    assert lib["nested"] == [{
+        "name": "semver", "version": "6.3.0",
+        "location": "node_modules/lib/node_modules/semver",
+        "path": "node_modules/lib/node_modules/semver", "bundle": False,
+    }]
+    assert graph[("semver", "7.5.0")]["nested"] == []
+    # One version per name is left for rez to resolve
+    names = [key[0] for key in graph]
+    assert len(names) == len(set(names))
+
+
+def test_load_lockfile_rejects_v1(tmp_path):
+    """Test lockfile v1 is rejected"""
+    path = tmp_path / "package-lock.json"
+    path.write_text(json.dumps({"lockfileVersion": 1, "dependencies": {}}))
+    with pytest.raises(ValueError):
+        load_lockfile(str(path))
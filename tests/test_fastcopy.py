@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Test copy engine for npm2rez package
+"""
+
+import os
+from unittest import mock
+
+import pytest
+
+from npm2rez import fastcopy
+from npm2rez.fastcopy import (
+    CopyStats,
+    copy_file,
+    list_modules,
+    transfer,
+    transfer_node_modules,
+)
+
+
+@pytest.fixture
+def node_modules(tmp_path):
+    """Create a small node_modules tree"""
+    root = tmp_path / "src" / "node_modules"
+    (root / "typescript" / "bin").mkdir(parents=True)
+    (root / "typescript" / "bin" / "tsc").write_text("#!/usr/bin/env node\n")
+    (root / "typescript" / "package.json").write_text("{}")
+    (root / "@types" / "node").mkdir(parents=True)
+    (root / "@types" / "node" / "index.d.ts").write_text("export {};\n")
+    (root / ".bin").mkdir()
+    (root / ".package-lock.json").write_text("{}")
+    return root
+
+
+def test_list_modules(node_modules):
+    """Test list_modules expands scopes and skips hidden entries"""
+    assert list_modules(str(node_modules)) == ["@types/node", "typescript"]
+    assert list_modules(str(node_modules / "missing")) == []
+
+
+def test_copy_file_fallbacks(tmp_path):
+    """Test copy_file falls back to a buffered copy"""
+    src = tmp_path / "src.js"
+    src.write_bytes(b"x" * 4096)
+    os.chmod(src, 0o755)
+
+    with mock.patch.object(fastcopy, "_reflink", return_value=False):
+        with mock.patch("os.copy_file_range", side_effect=OSError, create=True):
+            assert copy_file(str(src), str(tmp_path / "dst.js")) == 4096
+
+    assert (tmp_path / "dst.js").read_bytes() == b"x" * 4096
+    assert os.stat(tmp_path / "dst.js").st_mode & 0o777 == 0o755
+
+
+def test_copy_file_range_stops_early(tmp_path):
+    """Test a copy_file_range that stops early is completed by a buffered copy"""
+    src = tmp_path / "src.js"
+    data = bytes(range(256)) * 64
+    src.write_bytes(data)
+
+    def partial_copy(fd_in, fd_out, count, offset_src, offset_dst):
+        # Copy the first kilobyte, then report end of file
+        if offset_src:
+            return 0
+        os.pwrite(fd_out, os.pread(fd_in, 1024, 0), 0)
+        return 1024
+
+    with mock.patch.object(fastcopy, "_reflink", return_value=False):
+        with mock.patch("os.copy_file_range", side_effect=partial_copy, create=True):
+            assert copy_file(str(src), str(tmp_path / "dst.js")) == len(data)
+        with mock.patch("os.copy_file_range", return_value=0, create=True):
+            copy_file(str(src), str(tmp_path / "empty.js"))
+
+    assert (tmp_path / "dst.js").read_bytes() == data
+    assert (tmp_path / "empty.js").read_bytes() == data
+
+
+def test_transfer_node_modules_copy(node_modules, tmp_path):
+    """Test copying modules keeps the source and reports stats"""
+    dst = tmp_path / "dst" / "node_modules"
+    stats = transfer_node_modules(str(node_modules), str(dst), jobs=2)
+
+    assert stats == CopyStats(3, len("#!/usr/bin/env node\n") + 2 + len("export {};\n"))
+    assert (dst / "typescript" / "bin" / "tsc").exists()
+    assert (dst / "@types" / "node" / "index.d.ts").exists()
+    assert not (dst / ".bin").exists()
+    assert (node_modules / "typescript").exists()
+
+
+def test_transfer_node_modules_move(node_modules, tmp_path):
+    """Test moving modules renames them on the same filesystem"""
+    dst = tmp_path / "dst" / "node_modules"
+    stats = transfer_node_modules(str(node_modules), str(dst), move=True)
+
+    assert stats.files == 3
+    assert (dst / "typescript" / "package.json").exists()
+    assert not (node_modules / "typescript").exists()
+
+
+def test_transfer_replaces_destination(tmp_path):
+    """Test transfer replaces an existing destination and keeps symlinks"""
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "index.js").write_text("module.exports = 1;\n")
+    os.symlink("index.js", src / "link.js")
+
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    (dst / "stale.js").write_text("")
+
+    stats = transfer(str(src), str(dst))
+    assert stats.files == 2
+    assert not (dst / "stale.js").exists()
+    assert os.readlink(dst / "link.js") == "index.js"
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+Test the git mirror cache for npm2rez package
+"""
+
+import json
+import os
+import subprocess
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez.core import install_from_github
+from npm2rez.gitmirror import checkout, get_mirror_dir, get_repo_url
+
+pytestmark = pytest.mark.skipif(
+    subprocess.call(["git", "--version"], stdout=subprocess.DEVNULL) != 0,
+    reason="git is not installed"
+)
+
+
+def _git(*args, cwd):
+    """Run git quietly with a fixed identity"""
+    subprocess.check_call(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def _tag_release(repo_dir, version):
+    """Commit a package.json for a version and tag it"""
+    with open(os.path.join(repo_dir, "package.json"), "w") as f:
+        json.dump({"name": "tool", "version": version}, f)
+    _git("add", "package.json", cwd=repo_dir)
+    _git("commit", "-q", "-m", version, cwd=repo_dir)
+    _git("tag", f"v{version}", cwd=repo_dir)
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """Create a local upstream repository with a v1.0.0 tag"""
+    repo_dir = tmp_path / "upstream"
+    repo_dir.mkdir()
+    _git("init", "-q", cwd=str(repo_dir))
+    _tag_release(str(repo_dir), "1.0.0")
+    return repo_dir
+
+
+def test_get_repo_url(tmp_path):
+    """Test GitHub names, URLs and local paths"""
+    assert get_repo_url("microsoft/TypeScript") == "https://github.com/microsoft/TypeScript.git"
+    assert get_repo_url("file:///srv/git/tool.git") == "file:///srv/git/tool.git"
+    assert get_repo_url(str(tmp_path)) == str(tmp_path)
+
+    args = SimpleNamespace(cache_dir=str(tmp_path / "cache"))
+    mirror_dir = get_mirror_dir(args, "https://github.com/microsoft/TypeScript.git")
+    assert os.path.dirname(mirror_dir) == str(tmp_path / "cache" / "git")
+    assert os.path.basename(mirror_dir).startswith("TypeScript-")
+
+
+def test_checkout_fetches_missing_tags_only(tmp_path, upstream):
+    """Test the mirror is cloned once and only fetched for new tags"""
+    args = SimpleNamespace(cache_dir=str(tmp_path / "cache"), git_mirror=True)
+    url = f"file://{upstream}"
+    calls = []
+    real_check_call = subprocess.check_call
+
+    def record(cmd, **kwargs):
+        calls.append(cmd)
+        kwargs.setdefault("stdout", subprocess.DEVNULL)
+        kwargs.setdefault("stderr", subprocess.DEVNULL)
+        return real_check_call(cmd, **kwargs)
+
+    with mock.patch("subprocess.check_call", side_effect=record), \
+            mock.patch("builtins.print"):
+        checkout(args, url, "v1.0.0", str(tmp_path / "a"))
+        checkout(args, url, "v1.0.0", str(tmp_path / "b"))
+        _tag_release(str(upstream), "1.1.0")
+        checkout(args, url, "v1.1.0", str(tmp_path / "c"))
+
+    clones = [call for call in calls if call[1:3] == ["clone", "--mirror"]]
+    fetches = [call for call in calls if "fetch" in call]
+    assert len(clones) == 1
+    assert len(fetches) == 1
+    with open(tmp_path / "b" / "package.json") as f:
+        assert json.load(f)["version"] == "1.0.0"
+    with open(tmp_path / "c" / "package.json") as f:
+        assert json.load(f)["version"] == "1.1.0"
+
+
+def test_install_from_github_with_mirror(tmp_path, upstream):
+    """Test install_from_github checks out a file:// repository through the mirror"""
+    args = SimpleNamespace(name="tool", version="1.0.0", repo=f"file://{upstream}",
+                           cache_dir=str(tmp_path / "cache"), git_mirror=True)
+    install_path = tmp_path / "tool" / "1.0.0"
+    install_path.mkdir(parents=True)
+    real_check_call = subprocess.check_call
+
+    def run_git_only(cmd, **kwargs):
+        # npm install and npm run build are skipped
+        if cmd[0] == "git":
+            return real_check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   **kwargs)
+        return 0
+
+    with mock.patch("subprocess.check_call", side_effect=run_git_only), \
+            mock.patch("builtins.print"):
+        assert install_from_github("/usr/bin/npm", args, str(install_path)) is True
+
+    assert os.path.isdir(get_mirror_dir(args, args.repo))
+    # Only the checkout is shipped, not the git metadata
+    assert not (install_path / ".git").exists()
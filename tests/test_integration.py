@@ -143,7 +143,7 @@ def test_create_command_error_handling(runner, temp_dir):
         ])
 
         # Verify result
-        assert result.exit_code == 0
+        assert result.exit_code == 1
         assert 'Error' in result.output
 
 
@@ -163,5 +163,5 @@ def test_extract_command_error_handling(runner, temp_dir):
         ])
 
         # Verify result
-        assert result.exit_code == 0
+        assert result.exit_code == 1
         assert 'Error' in result.output
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+Test staging directories and package locks for npm2rez package
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez.core import create_package
+from npm2rez.locking import (
+    get_lock_path,
+    make_build_dir,
+    make_staging_dir,
+    package_lock,
+    publish_dir,
+)
+from npm2rez.stamp import read_stamp, write_stamp
+
+
+def test_make_staging_dir_is_unique(tmp_path):
+    """Test every job gets its own hidden staging directory"""
+    first = make_staging_dir(str(tmp_path / "typescript"), "temp_npm")
+    second = make_staging_dir(str(tmp_path / "typescript"), "temp_npm")
+    assert first != second
+    assert os.path.basename(first).startswith(".temp_npm-")
+    assert os.listdir(first) == []
+
+
+def test_get_lock_path(tmp_path):
+    """Test the lock file lives next to the version directory"""
+    package_dir = str(tmp_path / "typescript" / "4.9.5")
+    assert get_lock_path(package_dir) == str(tmp_path / "typescript" / ".4.9.5.lock")
+
+
+def test_package_lock_threads(tmp_path):
+    """Test a second thread waits for the lock holder"""
+    package_dir = str(tmp_path / "typescript" / "4.9.5")
+    events = []
+    holding = threading.Event()
+
+    def hold():
+        with package_lock(package_dir) as waited:
+            events.append(("first", waited))
+            holding.set()
+            time.sleep(0.2)
+            events.append(("released", None))
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait()
+    with mock.patch("builtins.print"):
+        with package_lock(package_dir, poll_interval=0.01) as waited:
+            events.append(("second", waited))
+    thread.join()
+
+    assert events == [("first", False), ("released", None), ("second", True)]
+
+
+def test_package_lock_processes(tmp_path):
+    """Test the file lock excludes other processes"""
+    package_dir = str(tmp_path / "typescript" / "4.9.5")
+    script = (
+        "import sys, time\n"
+        "from npm2rez.locking import package_lock\n"
+        "with package_lock(sys.argv[1]):\n"
+        "    print('locked', flush=True)\n"
+        "    time.sleep(0.5)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, "-c", script, package_dir], stdout=subprocess.PIPE, env=env
+    )
+    try:
+        assert proc.stdout.readline().strip() == b"locked"
+        with mock.patch("builtins.print"):
+            with package_lock(package_dir, poll_interval=0.01) as waited:
+                assert waited is True
+    finally:
+        proc.wait()
+
+
+def test_create_package_reuses_concurrent_build(tmp_path):
+    """Test create_package reuses a package built while it was waiting"""
+    args = SimpleNamespace(
+        name="typescript",
+        version="4.9.5",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16",
+        _is_test=True
+    )
+    package_dir = str(tmp_path / "typescript" / "4.9.5")
+    holding = threading.Event()
+
+    def build_elsewhere():
+        with package_lock(package_dir):
+            holding.set()
+            os.makedirs(package_dir)
+            time.sleep(0.1)
+            write_stamp(package_dir, args)
+
+    thread = threading.Thread(target=build_elsewhere)
+    thread.start()
+    holding.wait()
+    with mock.patch("npm2rez.core.install_node_package") as mock_install:
+        with mock.patch("builtins.print"):
+            assert create_package(args) == package_dir
+    thread.join()
+
+    mock_install.assert_not_called()
+    assert read_stamp(package_dir)["version"] == "4.9.5"
+
+
+def test_publish_dir_replaces_previous_version(tmp_path):
+    """Test publish_dir swaps in a complete build and removes the old version"""
+    package_dir = tmp_path / "typescript" / "4.9.5"
+    (package_dir / "node_modules").mkdir(parents=True)
+    (package_dir / "package.py").write_text("old")
+
+    # Builds on another filesystem are first moved next to the package version
+    build_dir = make_build_dir(str(package_dir), str(tmp_path / "tmpfs"))
+    assert os.path.dirname(build_dir) == str(tmp_path / "tmpfs")
+    with open(os.path.join(build_dir, "package.py"), "w") as f:
+        f.write("new")
+    with mock.patch("npm2rez.locking._same_filesystem", return_value=False):
+        publish_dir(build_dir, str(package_dir))
+
+    assert (package_dir / "package.py").read_text() == "new"
+    assert not (package_dir / "node_modules").exists()
+    assert oct(os.stat(package_dir).st_mode & 0o777) == oct(0o755)
+    assert not os.path.exists(build_dir)
+    # Neither build nor trash directories are left behind
+    assert os.listdir(tmp_path / "typescript") == ["4.9.5"]
+
+
+def test_create_package_failure_keeps_published_version(tmp_path):
+    """Test a failed rebuild leaves the published package untouched"""
+    args = SimpleNamespace(
+        name="typescript",
+        version="4.9.5",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16",
+        staging_dir=str(tmp_path / "staging"),
+        force=True,
+        _is_test=True
+    )
+    package_dir = tmp_path / "typescript" / "4.9.5"
+    package_dir.mkdir(parents=True)
+    (package_dir / "package.py").write_text("published")
+
+    def half_install(args, install_path):
+        # Readers never see the package being built
+        assert (package_dir / "package.py").read_text() == "published"
+        assert os.path.dirname(install_path) == str(tmp_path / "staging")
+        return False
+
+    with mock.patch("npm2rez.core.install_node_package", side_effect=half_install):
+        with mock.patch("builtins.print"):
+            with pytest.raises(RuntimeError, match="Failed to install"):
+                create_package(args)
+
+    assert (package_dir / "package.py").read_text() == "published"
+    assert os.listdir(tmp_path / "staging") == []
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Test the packument cache of npm2rez package
+"""
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez.batch import resolve_entries
+from npm2rez.core import extract_node_package
+from npm2rez.metadata import fetch_packument, resolve_version
+
+
+@pytest.fixture
+def etag_registry():
+    """Serve packuments with ETags, answering conditional requests with 304"""
+    packuments = {}
+    requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+
+    def publish(name, versions, latest=None):
+        packuments["/" + name] = json.dumps({
+            "name": name,
+            "dist-tags": {"latest": latest or versions[-1]},
+            "versions": {version: {"name": name, "version": version} for version in versions},
+        }).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            data = packuments.get(self.path)
+            if data is None:
+                requests.append((self.path, 404))
+                self.send_response(404)
+                self.end_headers()
+                return
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                requests.append((self.path, 304))
+                self.send_response(304)
+                self.end_headers()
+                return
+            requests.append((self.path, 200))
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server.RequestHandlerClass = Handler
+    publish("typescript", ["4.9.4", "4.9.5", "5.0.2", "5.0.4", "5.1.0"], latest="5.0.4")
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield SimpleNamespace(url=f"http://127.0.0.1:{server.server_address[1]}",
+                          publish=publish, requests=requests)
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_packument_ttl_and_revalidation(tmp_path, etag_registry):
+    """Test fresh packuments are reused and stale ones revalidated"""
+    args = SimpleNamespace(registry=etag_registry.url, cache_dir=str(tmp_path))
+
+    assert "5.1.0" in fetch_packument(args, "typescript")["versions"]
+    fetch_packument(args, "typescript")
+    assert etag_registry.requests == [("/typescript", 200)]
+
+    # Once stale, an unchanged packument costs a bodyless 304
+    args.metadata_ttl = 0
+    assert "5.1.0" in fetch_packument(args, "typescript")["versions"]
+    assert etag_registry.requests[-1] == ("/typescript", 304)
+
+    etag_registry.publish("typescript", ["5.1.0", "5.2.2"])
+    assert "5.2.2" in fetch_packument(args, "typescript")["versions"]
+    assert etag_registry.requests[-1] == ("/typescript", 200)
+
+
+def test_fetch_packument_offline(tmp_path, etag_registry):
+    """Test offline runs use stale packuments and fail for missing ones"""
+    args = SimpleNamespace(registry=etag_registry.url, cache_dir=str(tmp_path))
+    fetch_packument(args, "typescript")
+
+    args.offline = True
+    args.metadata_ttl = 0
+    assert fetch_packument(args, "typescript")["name"] == "typescript"
+    with pytest.raises(ValueError):
+        fetch_packument(args, "eslint")
+    assert len(etag_registry.requests) == 1
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("^4.9", "4.9.5"),
+    ("~5.0.2", "5.0.4"),
+    (">=3 <5", "4.9.5"),
+    ("latest", "5.0.4"),
+    ("5.1", "5.1.0"),
+    ("4.9.4", "4.9.4"),
+])
+def test_resolve_version(tmp_path, etag_registry, spec, expected):
+    """Test ranges, partial versions and dist-tags resolve like npm"""
+    args = SimpleNamespace(name="typescript", version=spec, source="npm",
+                           registry=etag_registry.url, cache_dir=str(tmp_path))
+    with mock.patch("builtins.print"):
+        assert resolve_version(args) == expected
+    assert args.version == expected
+    # Exact versions need no metadata
+    assert len(etag_registry.requests) == (0 if spec == expected else 1)
+
+
+def test_resolve_entries(tmp_path, etag_registry):
+    """Test batch entries are resolved and unresolvable ones reported"""
+    entries = [
+        {"name": "typescript", "version": "^4"},
+        {"name": "typescript", "version": "^9"},
+        {"name": "missing", "version": "latest"},
+        {"name": "tool", "version": "main", "source": "github", "repo": "user/tool"},
+    ]
+    options = {"registry": etag_registry.url, "cache_dir": str(tmp_path)}
+
+    with mock.patch("builtins.print"):
+        resolved, failed = resolve_entries(entries, str(tmp_path / "out"), options=options)
+
+    assert [(entry["name"], entry["version"]) for entry in resolved] == [
+        ("typescript", "4.9.5"), ("tool", "main"),
+    ]
+    assert [(result["name"], result["success"]) for result in failed] == [
+        ("typescript", False), ("missing", False),
+    ]
+    assert all(result["error"] for result in failed)
+
+
+def test_extract_resolves_version(tmp_path, etag_registry):
+    """Test extract installs the version a range resolves to"""
+    args = SimpleNamespace(name="typescript", version="^4.9", source="npm", repo=None,
+                           registry=etag_registry.url, cache_dir=str(tmp_path))
+    with mock.patch("npm2rez.core.install_node_package", return_value=True) as mock_install:
+        with mock.patch("builtins.print"):
+            assert extract_node_package(args, str(tmp_path / "out")) is True
+    assert mock_install.call_args[0][0].version == "4.9.5"
@@ -4,6 +4,7 @@
 Test npm2rez package functionality
 """
 
+import json
 import os
 from types import SimpleNamespace
 from unittest import mock
@@ -235,3 +236,235 @@ def test_extract_node_package(tmp_path):
 
             # Verify node_modules directory exists
             assert os.path.exists(str(node_modules_dir))
+
+
+def _fake_npm_tree(cwd, packages=None):
+    """Write an installed tree and its lockfile: app -> lib -> semver (nested)"""
+    packages = packages or {
+        "node_modules/app": {
+            "name": "app", "version": "1.0.0", "bin": {"app": "bin/app"},
+            "dependencies": {"lib": "^1"},
+        },
+        "node_modules/lib": {
+            "name": "lib", "version": "1.2.0", "dependencies": {"semver": "^6"},
+        },
+        "node_modules/lib/node_modules/semver": {"name": "semver", "version": "6.3.0"},
+    }
+    for location, package_json in packages.items():
+        package_dir = os.path.join(cwd, *location.split("/"))
+        os.makedirs(package_dir)
+        with open(os.path.join(package_dir, "package.json"), "w") as f:
+            json.dump(package_json, f)
+        with open(os.path.join(package_dir, "index.js"), "w") as f:
+            f.write("module.exports = {};\n")
+
+    lockfile = {"lockfileVersion": 3, "packages": {"": {"dependencies": {"app": "1.0.0"}}}}
+    for location, package_json in packages.items():
+        meta = {"version": package_json["version"]}
+        if "dependencies" in package_json:
+            meta["dependencies"] = package_json["dependencies"]
+        lockfile["packages"][location] = meta
+    with open(os.path.join(cwd, "package-lock.json"), "w") as f:
+        json.dump(lockfile, f)
+
+
+def test_create_package_resolve_deps(tmp_path):
+    """Test one rez package per npm dependency with requires"""
+    args = SimpleNamespace(
+        name="app",
+        version="1.0.0",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16",
+        npm="/usr/bin/npm",
+        resolve_deps=True,
+        cache_dir=str(tmp_path / "cache"),
+        _is_test=False
+    )
+
+    def fake_check_call(cmd, cwd):
+        _fake_npm_tree(cwd)
+
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("builtins.print"):
+            package_dir = create_package(args)
+
+    assert package_dir == str(tmp_path / "app" / "1.0.0")
+    with open(os.path.join(package_dir, "package.py")) as f:
+        content = f.read()
+    assert '"lib-1.2.0",' in content
+
+    # Each package only carries its own files
+    lib_dir = tmp_path / "lib" / "1.2.0"
+    assert os.listdir(lib_dir / "node_modules") == ["lib"]
+    assert not (lib_dir / "node_modules" / "lib" / "node_modules").exists()
+    assert '"semver-6.3.0",' in (lib_dir / "package.py").read_text()
+    assert (tmp_path / "semver" / "6.3.0" / "node_modules" / "semver" / "index.js").exists()
+    assert (tmp_path / "app" / "1.0.0" / "bin" / "app").exists()
+
+    # Dependencies that already exist are skipped on the next run
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("npm2rez.core.transfer_many") as mock_transfer:
+            with mock.patch("builtins.print"):
+                create_package(args)
+    mock_transfer.assert_not_called()
+
+
+def test_create_package_resolve_deps_variants(tmp_path):
+    """Test dependency packages carry their payload in every Node.js variant"""
+    args = SimpleNamespace(
+        name="app",
+        version="1.0.0",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16,18",
+        npm="/usr/bin/npm",
+        resolve_deps=True,
+        cache_dir=str(tmp_path / "cache"),
+        _is_test=False
+    )
+
+    def fake_check_call(cmd, cwd, **kwargs):
+        _fake_npm_tree(cwd)
+
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("builtins.print"):
+            package_dir = create_package(args)
+
+    for variant in ("nodejs-16", "nodejs-18"):
+        variant_dir = os.path.join(package_dir, variant)
+        assert os.path.exists(os.path.join(variant_dir, "node_modules", "app", "index.js"))
+        assert os.path.exists(os.path.join(variant_dir, "bin", "app"))
+        semver_dir = tmp_path / "semver" / "6.3.0" / variant / "node_modules" / "semver"
+        assert (semver_dir / "index.js").exists()
+    assert not os.path.exists(os.path.join(package_dir, "node_modules"))
+
+    # A native addon is only built for the Node.js version of the install
+    def native_check_call(cmd, cwd, **kwargs):
+        _fake_npm_tree(cwd)
+        open(os.path.join(cwd, "node_modules", "lib", "binding.gyp"), "w").close()
+
+    args.force = True
+    with mock.patch("subprocess.check_call", side_effect=native_check_call):
+        with mock.patch("builtins.print"):
+            with pytest.raises(ValueError, match="native addons"):
+                create_package(args)
+
+
+def test_create_package_resolve_deps_duplicates(tmp_path):
+    """Test a second version of a package is nested instead of required"""
+    args = SimpleNamespace(
+        name="app",
+        version="1.0.0",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16",
+        npm="/usr/bin/npm",
+        resolve_deps=True,
+        cache_dir=str(tmp_path / "cache"),
+        _is_test=False
+    )
+    packages = {
+        "node_modules/app": {
+            "name": "app", "version": "1.0.0",
+            "dependencies": {"lib": "^1", "semver": "^7", "semver-cjs": "npm:semver@^7"},
+        },
+        "node_modules/lib": {"name": "lib", "version": "1.2.0", "dependencies": {"semver": "^6"}},
+        "node_modules/lib/node_modules/semver": {"name": "semver", "version": "6.3.0"},
+        "node_modules/semver": {"name": "semver", "version": "7.5.0"},
+        "node_modules/semver-cjs": {"name": "semver", "version": "7.5.0"},
+    }
+
+    def fake_check_call(cmd, cwd):
+        _fake_npm_tree(cwd, packages)
+
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("builtins.print"):
+            create_package(args)
+
+    app_py = (tmp_path / "app" / "1.0.0" / "package.py").read_text()
+    assert '"semver-7.5.0",' in app_py
+    assert '"semver_cjs-7.5.0",' in app_py
+    lib_dir = tmp_path / "lib" / "1.2.0"
+    assert "semver" not in (lib_dir / "package.py").read_text()
+    assert (lib_dir / "node_modules" / "lib" / "node_modules" / "semver" / "index.js").exists()
+    assert not (tmp_path / "semver" / "6.3.0").exists()
+    # The alias is copied under the name require() uses
+    assert (tmp_path / "semver_cjs" / "7.5.0" / "node_modules" / "semver-cjs"
+            / "index.js").exists()
+
+
+def test_create_package_resolve_deps_cycle(tmp_path):
+    """Test the packages of a dependency cycle are bundled into one package"""
+    args = SimpleNamespace(
+        name="app",
+        version="1.0.0",
+        output=str(tmp_path),
+        source="npm",
+        repo=None,
+        node_version="16",
+        npm="/usr/bin/npm",
+        resolve_deps=True,
+        cache_dir=str(tmp_path / "cache"),
+        _is_test=False
+    )
+    packages = {
+        "node_modules/app": {"name": "app", "version": "1.0.0", "dependencies": {"chalk": "^4"}},
+        "node_modules/chalk": {"name": "chalk", "version": "4.1.2", "dependencies": {"ansi": "^1"}},
+        "node_modules/ansi": {
+            "name": "ansi", "version": "1.0.0", "bin": {"ansi": "cli.js"},
+            "dependencies": {"chalk": "^4"},
+        },
+    }
+
+    def fake_check_call(cmd, cwd):
+        _fake_npm_tree(cwd, packages)
+
+    with mock.patch("subprocess.check_call", side_effect=fake_check_call):
+        with mock.patch("builtins.print"):
+            create_package(args)
+
+    assert '"chalk-4.1.2",' in (tmp_path / "app" / "1.0.0" / "package.py").read_text()
+    chalk_dir = tmp_path / "chalk" / "4.1.2"
+    assert sorted(os.listdir(chalk_dir / "node_modules")) == ["ansi", "chalk"]
+    assert (chalk_dir / "bin" / "ansi").exists()
+    assert "ansi-1.0.0" not in (chalk_dir / "package.py").read_text()
+    assert not (tmp_path / "ansi").exists()
+
+
+def test_create_package_skips_unchanged_inputs(tmp_path, mock_args):
+    """Test reruns skip packages whose fingerprint matches"""
+    mock_args.output = str(tmp_path)
+
+    with mock.patch("npm2rez.core.install_node_package", return_value=True) as mock_install:
+        with mock.patch("builtins.print"):
+            package_dir = create_package(mock_args)
+            package_py = os.path.join(package_dir, "package.py")
+            os.utime(package_py, (0, 0))
+
+            create_package(mock_args)
+            assert mock_install.call_count == 1
+
+            # Forced rebuilds leave an identical package.py untouched
+            mock_args.force = True
+            create_package(mock_args)
+            assert mock_install.call_count == 2
+            assert os.stat(package_py).st_mtime == 0
+
+            # Changed inputs rebuild and rewrite package.py
+            mock_args.force = False
+            mock_args.node_version = "18"
+            create_package(mock_args)
+            assert mock_install.call_count == 3
+            assert os.stat(package_py).st_mtime != 0
+
+            # So does switching installers
+            mock_args.installer = "native"
+            create_package(mock_args)
+            assert mock_install.call_count == 4
+
+    with open(os.path.join(package_dir, ".npm2rez.json")) as f:
+        assert json.load(f)["node_version"] == "18"
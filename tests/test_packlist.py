@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Test the pack lists of npm2rez package
+"""
+
+import json
+import shutil
+
+import pytest
+
+from npm2rez.packlist import get_pack_files, is_excluded, list_pack_files, npm_pack_files
+
+
+def _write(root, files):
+    """Write a tree of files from a {path: content} dict"""
+    for path, content in files.items():
+        file_path = root / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(content)
+
+
+CHECKOUT = {
+    "README.md": "# tool\n",
+    "LICENSE": "MIT\n",
+    "CHANGELOG.md": "1.0.0\n",
+    "package-lock.json": "{}\n",
+    ".github/workflows/ci.yml": "on: push\n",
+    "src/index.ts": "export default 1;\n",
+    "dist/index.js": "module.exports = 1;\n",
+    "dist/index.test.js": "test();\n",
+    "dist/keep.test.js": "test();\n",
+    "bin/tool.js": "#!/usr/bin/env node\n",
+    "test/index.test.ts": "test();\n",
+    "node_modules/lib/package.json": "{}\n",
+}
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    """Create a built checkout of a package"""
+    _write(tmp_path, CHECKOUT)
+    return tmp_path
+
+
+def _package_json(root, **fields):
+    (root / "package.json").write_text(json.dumps({"name": "tool", "version": "1.0.0", **fields}))
+
+
+def test_list_pack_files_files_field(checkout):
+    """Test the files field selects the payload"""
+    _package_json(checkout, files=["dist/"], bin={"tool": "./bin/tool.js"})
+    (checkout / ".npmignore").write_text("*.md\n")
+
+    assert list_pack_files(str(checkout)) == [
+        "LICENSE",
+        "README.md",
+        "bin/tool.js",
+        "dist/index.js",
+        "dist/index.test.js",
+        "dist/keep.test.js",
+        "package.json",
+    ]
+
+
+def test_list_pack_files_npmignore(checkout):
+    """Test .npmignore rules, negations included, and the files npm always ignores"""
+    _package_json(checkout)
+    (checkout / ".npmignore").write_text("# sources\nsrc/\ntest/\n.github/\n*.test.js\n"
+                                         "!keep.test.js\nCHANGELOG.md\n")
+    (checkout / ".gitignore").write_text("dist/\n")
+
+    assert list_pack_files(str(checkout)) == [
+        "LICENSE",
+        "README.md",
+        "bin/tool.js",
+        "dist/index.js",
+        "dist/keep.test.js",
+        "package.json",
+    ]
+
+
+def test_list_pack_files_gitignore(checkout):
+    """Test .gitignore is used without .npmignore"""
+    _package_json(checkout)
+    (checkout / ".gitignore").write_text("src\n")
+
+    files = list_pack_files(str(checkout))
+    assert "src/index.ts" not in files
+    assert "test/index.test.ts" in files
+    assert "package-lock.json" not in files
+    assert not any(path.startswith("node_modules/") for path in files)
+
+
+def test_is_excluded_gitignore_semantics():
+    """Test ** matches zero or more directories, case and anchoring"""
+    assert is_excluded("lib/a.js", ["lib/**/*.js"])
+    assert is_excluded("lib/x/y/a.js", ["lib/**/*.js"])
+    assert not is_excluded("src/lib/a.js", ["lib/**/*.js"])
+    assert is_excluded("a/b", ["**/b"])
+    assert is_excluded("a/x/y/b", ["a/**/b"])
+    assert is_excluded("a/b", ["a/**/b"])
+    assert is_excluded("lib/deep/a.md", ["lib/**"])
+
+    # Case-sensitive
+    assert not is_excluded("Docs/a.md", ["docs/"])
+    assert not is_excluded("README.MD", ["*.md"])
+
+    # A slash anchors the pattern, otherwise it matches at any depth
+    assert is_excluded("src/a.js", ["src"])
+    assert is_excluded("lib/src/a.js", ["src"])
+    assert not is_excluded("lib/src/a.js", ["/src"])
+    assert not is_excluded("lib/src/a.js", ["src/a.js"])
+    # Trailing slashes only match directories
+    assert not is_excluded("lib/build", ["build/"])
+    assert is_excluded("build/a.js", ["build/"])
+    # Negation, character classes and escapes
+    assert not is_excluded("lib/keep.js", ["lib/", "!keep.js"])
+    assert is_excluded("v1.js", ["v[0-9].js"])
+    assert not is_excluded("va.js", ["v[!a].js"])
+    assert is_excluded("*.js", ["\\*.js"])
+    assert not is_excluded("a.js", ["\\*.js"])
+
+
+def test_list_pack_files_globstar(checkout):
+    """Test files entries with ** match files directly inside the directory"""
+    _package_json(checkout, files=["dist/**/*.js", "!dist/*.test.js"])
+    (checkout / "readme.md").write_text("# tool\n")
+    (checkout / "README.md").unlink()
+
+    assert list_pack_files(str(checkout)) == [
+        "LICENSE", "dist/index.js", "package.json", "readme.md",
+    ]
+
+
+@pytest.mark.skipif(not shutil.which("npm"), reason="npm is not installed")
+@pytest.mark.parametrize("fields, npmignore", [
+    ({"files": ["dist/"], "bin": {"tool": "./bin/tool.js"}}, None),
+    ({}, "src/\ntest/\n.github/\n*.test.js\n!keep.test.js\n"),
+])
+def test_list_pack_files_matches_npm(checkout, fields, npmignore):
+    """Test the Python rules select the same files as npm pack"""
+    _package_json(checkout, **fields)
+    if npmignore:
+        (checkout / ".npmignore").write_text(npmignore)
+
+    files = npm_pack_files(shutil.which("npm"), str(checkout))
+    assert files is not None
+    assert list_pack_files(str(checkout)) == files
+
+
+def test_get_pack_files_without_npm(checkout):
+    """Test the Python rules are used when npm cannot run"""
+    _package_json(checkout, files=["dist/index.js"])
+    assert get_pack_files(str(checkout / "missing-npm"), str(checkout)) == [
+        "LICENSE", "README.md", "dist/index.js", "package.json",
+    ]
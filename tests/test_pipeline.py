@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Test pipelined builds for npm2rez package
+"""
+
+import threading
+import time
+from unittest import mock
+
+from npm2rez.batch import run_batch
+from npm2rez.pipeline import run_stages
+from npm2rez.stamp import STAMP_FILE
+
+
+def test_run_stages_overlaps_and_bounds_queues():
+    """Test stages run concurrently, skip failed items and keep queues bounded"""
+    events = []
+    lock = threading.Lock()
+    fetched = []
+
+    def fetch(item):
+        if item["id"] == 2:
+            raise RuntimeError("no such package")
+        time.sleep(0.02)
+        with lock:
+            fetched.append(item["id"])
+            events.append(("fetch", item["id"]))
+
+    def copy(item):
+        with lock:
+            # Fetching never runs more than the queue size plus workers ahead
+            assert len(fetched) - item["id"] <= 4
+            events.append(("copy", item["id"]))
+        time.sleep(0.02)
+
+    closed = []
+    items = [{"id": index, "on_error": lambda i=index: closed.append(i)} for index in range(8)]
+    done = []
+    finished = run_stages(items, [("fetch", fetch, 2), ("copy", copy, 1)], queue_size=1,
+                          on_done=lambda item: done.append(item["id"]))
+
+    assert sorted(item["id"] for item in finished) == list(range(8))
+    assert done == [item["id"] for item in finished]
+    assert finished[[item["id"] for item in finished].index(2)]["error"] == "no such package"
+    assert closed == [2]
+    assert ("copy", 2) not in events
+    # Copies of early items happen before fetches of later items finish
+    assert events.index(("copy", 0)) < events.index(("fetch", 7))
+
+
+def test_run_batch_pipeline(tmp_path):
+    """Test run_batch with the pipeline executor"""
+    def fake_stage(npm, args, install_path):
+        if args.name == "broken":
+            raise RuntimeError("install failed")
+        staging = tmp_path / f"staging-{args.name}"
+        (staging / "node_modules" / args.name).mkdir(parents=True)
+        (staging / "node_modules" / args.name / "index.js").write_text("")
+        (staging / "node_modules" / ".bin").mkdir()
+        (staging / "node_modules" / ".bin" / args.name).write_text("")
+        return str(staging)
+
+    entries = [
+        {"name": "typescript", "version": "4.9.5"},
+        {"name": "broken", "version": "1.0.0"},
+        {"name": "eslint", "version": "8.0.0"},
+    ]
+    with mock.patch("npm2rez.batch.get_npm_executable", return_value="/usr/bin/npm"):
+        with mock.patch("npm2rez.pipeline.stage_npm_install", side_effect=fake_stage):
+            with mock.patch("builtins.print"):
+                summary = run_batch(entries, str(tmp_path / "out"), jobs=2,
+                                    executor="pipeline")
+
+    assert [r["name"] for r in summary["results"]] == ["typescript", "broken", "eslint"]
+    assert [r["success"] for r in summary["results"]] == [True, False, True]
+    assert summary["results"][1]["error"] == "install failed"
+
+    package_dir = tmp_path / "out" / "typescript" / "4.9.5"
+    assert (package_dir / "node_modules" / "typescript" / "index.js").exists()
+    assert (package_dir / "bin" / "typescript").exists()
+    assert (package_dir / STAMP_FILE).exists()
+    # Staging projects are removed, failed builds leave no stamp
+    assert not (tmp_path / "staging-typescript").exists()
+    assert not (tmp_path / "out" / "broken" / "1.0.0" / STAMP_FILE).exists()
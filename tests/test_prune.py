@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Test payload pruning for npm2rez package
+"""
+
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from npm2rez.prune import (
+    DEFAULT_PRUNE_RULES,
+    get_prune_rules,
+    is_pruned,
+    print_size_report,
+    prune_node_modules,
+)
+
+
+def _write(path, content=""):
+    """Write a file, creating its parent directories"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_is_pruned_rules():
+    """Test directory, name and negation rules"""
+    rules = list(DEFAULT_PRUNE_RULES)
+    assert is_pruned("test/index.js", rules)
+    assert is_pruned("lib/__tests__/a.js", rules)
+    assert is_pruned("dist/index.js.map", rules)
+    assert is_pruned("Changelog.md", rules)
+    assert not is_pruned("LICENSE.md", rules)
+    assert not is_pruned("lib/test.js", rules)
+    assert not is_pruned("lib/index.ts", rules)
+
+    # Directory rules are anchored at the package root
+    assert is_pruned("docs/guide.html", rules)
+    assert not is_pruned("lib/test/index.js", rules)
+    assert not is_pruned("src/docs/guide.html", rules)
+    # Matching is case-sensitive
+    assert is_pruned("HISTORY", rules)
+    assert not is_pruned("hIsToRy", rules)
+    # Documentation rules never remove code
+    assert not is_pruned("dist/doc/index.js", rules)
+    assert not is_pruned("docs/config.json", rules)
+    assert not is_pruned("lib/history.js", rules)
+    assert not is_pruned("History.mjs", rules)
+    assert is_pruned("History.txt", rules)
+
+    assert get_prune_rules(SimpleNamespace()) is None
+    rules = get_prune_rules(SimpleNamespace(prune=True, prune_ts=True))
+    assert is_pruned("lib/index.ts", rules)
+    assert not is_pruned("lib/index.d.ts", rules)
+
+
+def test_prune_node_modules(tmp_path):
+    """Test pruning keeps entry points and reports sizes per dependency"""
+    node_modules = tmp_path / "node_modules"
+    _write(node_modules / "app" / "package.json", json.dumps({
+        "main": "docs/entry",
+        "bin": {"app": "./bin/app.js"},
+        "exports": {".": "./index.js", "./examples/*": "./examples/*.js"},
+    }))
+    _write(node_modules / "app" / "index.js", "x" * 100)
+    _write(node_modules / "app" / "docs" / "entry.js")
+    _write(node_modules / "app" / "docs" / "guide.md")
+    _write(node_modules / "app" / "examples" / "basic.js")
+    _write(node_modules / "app" / "bin" / "app.js")
+    _write(node_modules / "app" / "README.md", "y" * 50)
+    _write(node_modules / "app" / "test" / "deep" / "spec.js", "z" * 10)
+    _write(node_modules / "app" / "node_modules" / "dep" / "package.json", "{}")
+    _write(node_modules / "app" / "node_modules" / "dep" / "index.js.map", "m" * 20)
+    _write(node_modules / "@scope" / "lib" / "package.json", "{}")
+    _write(node_modules / "@scope" / "lib" / "LICENSE", "MIT")
+
+    report = prune_node_modules(str(node_modules), get_prune_rules(SimpleNamespace(prune=True)))
+
+    app = node_modules / "app"
+    assert (app / "docs" / "entry.js").exists()
+    assert (app / "examples" / "basic.js").exists()
+    assert (app / "bin" / "app.js").exists()
+    assert not (app / "docs" / "guide.md").exists()
+    assert not (app / "README.md").exists()
+    assert not (app / "test").exists()
+    assert not (app / "node_modules" / "dep" / "index.js.map").exists()
+    assert (node_modules / "@scope" / "lib" / "LICENSE").exists()
+
+    assert sorted(report) == [
+        "node_modules/@scope/lib", "node_modules/app", "node_modules/app/node_modules/dep"
+    ]
+    assert report["node_modules/app"]["removed_files"] == 3
+    assert report["node_modules/app"]["removed_bytes"] == 60
+    assert report["node_modules/app/node_modules/dep"]["files"] == 1
+
+    with mock.patch("builtins.print") as mock_print:
+        print_size_report(report, limit=1)
+    lines = [call.args[0] for call in mock_print.call_args_list]
+    assert lines[0].startswith("Pruned 4 files (80 bytes)")
+    assert lines[2].split()[0] == "app"
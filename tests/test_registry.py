@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+"""
+Test native registry installer for npm2rez package
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from npm2rez import registry
+from npm2rez.core import install_from_lockfile, install_from_registry, install_node_package
+
+
+def make_tarball(files):
+    """Build a gzipped package tarball from a mapping of path to content"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in sorted(files.items()):
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(f"package/{path}")
+            info.size = len(data)
+            info.mode = 0o755 if path.startswith("bin/") else 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def integrity_of(data):
+    """Build the SRI sha512 integrity of data"""
+    return "sha512-" + base64.b64encode(hashlib.sha512(data).digest()).decode("ascii")
+
+
+@pytest.fixture
+def fake_registry():
+    """Serve packuments and tarballs over HTTP
+
+    app@1.0.0 -> lib ^1, dep ^1, optional fsevents (darwin only)
+    lib@1.1.0 -> dep ^2
+    """
+    routes = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def publish(name, version, dependencies=None, **fields):
+        package_json = {"name": name, "version": version, "dependencies": dependencies or {}}
+        package_json.update(fields)
+        files = {"package.json": json.dumps(package_json), "index.js": f"// {name}\n"}
+        if "bin" in fields:
+            files["bin/" + name] = "#!/usr/bin/env node\n"
+        data = make_tarball(files)
+        tarball_path = f"/{name}/-/{name}-{version}.tgz"
+        routes[tarball_path] = data
+
+        packument_path = "/" + name.replace("/", "%2f")
+        packument = json.loads(routes.get(packument_path, b'{"versions": {}}'))
+        packument["name"] = name
+        packument.setdefault("dist-tags", {})["latest"] = version
+        manifest = dict(package_json)
+        manifest["dist"] = {"tarball": base_url + tarball_path, "integrity": integrity_of(data)}
+        packument["versions"][version] = manifest
+        routes[packument_path] = json.dumps(packument).encode("utf-8")
+
+    publish("app", "1.0.0", {"lib": "^1", "dep": "^1"}, bin={"app": "bin/app"},
+            optionalDependencies={"fsevents": "*"})
+    publish("lib", "1.0.0", {"dep": "^2"})
+    publish("lib", "1.1.0", {"dep": "^2"})
+    publish("dep", "1.4.0")
+    publish("dep", "2.0.1")
+    publish("fsevents", "2.3.2", os=["darwin"])
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            data = routes.get(self.path)
+            if data is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server.RequestHandlerClass = Handler
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield SimpleNamespace(url=base_url, routes=routes)
+    server.shutdown()
+    server.server_close()
+
+
+def test_resolve_manifest():
+    """Test dist-tags, exact versions and ranges"""
+    packument = {
+        "name": "dep",
+        "dist-tags": {"latest": "1.4.0", "next": "2.0.0"},
+        "versions": {v: {"version": v} for v in ["1.0.0", "1.4.0", "1.5.0", "2.0.0"]},
+    }
+    assert registry.resolve_manifest(packument, "next")["version"] == "2.0.0"
+    assert registry.resolve_manifest(packument, "1.0.0")["version"] == "1.0.0"
+    # latest wins when it satisfies the range
+    assert registry.resolve_manifest(packument, "^1")["version"] == "1.4.0"
+    assert registry.resolve_manifest(packument, ">1.4.0")["version"] == "2.0.0"
+    with pytest.raises(ValueError):
+        registry.resolve_manifest(packument, "^3")
+
+
+def test_resolve_tree_layout(fake_registry):
+    """Test hoisting and nesting of conflicting versions"""
+    args = SimpleNamespace(name="app", version="1.0.0", registry=fake_registry.url)
+    with mock.patch.object(registry, "platform_matches",
+                           side_effect=lambda m: not m.get("os")):
+        tree = registry.resolve_tree(args)
+
+    assert {location: manifest["version"] for location, manifest in tree.items()} == {
+        "node_modules/app": "1.0.0",
+        "node_modules/lib": "1.1.0",
+        "node_modules/dep": "1.4.0",
+        "node_modules/lib/node_modules/dep": "2.0.1",
+    }
+
+
+def test_install_from_registry(fake_registry, tmp_path):
+    """Test the native installer streams every tarball into place"""
+    args = SimpleNamespace(
+        name="app", version="1.0.0", source="npm", installer="native",
+        registry=fake_registry.url, cache_dir=str(tmp_path / "cache"), _is_test=False
+    )
+    install_path = tmp_path / "app" / "1.0.0"
+
+    with mock.patch("npm2rez.core.get_npm_executable") as mock_get_npm:
+        with mock.patch("builtins.print"):
+            assert install_node_package(args, str(install_path)) is True
+
+    # npm is not needed at all
+    mock_get_npm.assert_not_called()
+    modules = install_path / "node_modules"
+    assert (modules / "app" / "index.js").read_text() == "// app\n"
+    assert json.loads((modules / "dep" / "package.json").read_text())["version"] == "1.4.0"
+    nested = modules / "lib" / "node_modules" / "dep" / "package.json"
+    assert json.loads(nested.read_text())["version"] == "2.0.1"
+    assert os.access(modules / "app" / "bin" / "app", os.X_OK)
+    assert (install_path / "bin" / "app").exists()
+
+
+def test_install_from_registry_integrity_failure(fake_registry, tmp_path):
+    """Test a corrupted tarball is rejected and removed"""
+    tarball_path = "/dep/-/dep-1.4.0.tgz"
+    fake_registry.routes[tarball_path] = make_tarball({"package.json": "{}", "evil.js": ""})
+
+    args = SimpleNamespace(name="dep", version="1.4.0", registry=fake_registry.url,
+                           cache_dir=str(tmp_path / "cache"))
+    with mock.patch("builtins.print"):
+        assert install_from_registry(args, str(tmp_path)) is False
+    assert not (tmp_path / "node_modules" / "dep").exists()
+
+
+def test_install_from_registry_offline(fake_registry, tmp_path):
+    """Test tarballs are cached by integrity and reused offline"""
+    args = SimpleNamespace(name="app", version="1.0.0", registry=fake_registry.url,
+                           cache_dir=str(tmp_path / "cache"))
+    with mock.patch("builtins.print"):
+        assert install_from_registry(args, str(tmp_path / "online")) is True
+
+    # The registry is gone, everything comes from the cache
+    fake_registry.routes.clear()
+    args.offline = True
+    with mock.patch("builtins.print"):
+        assert install_from_registry(args, str(tmp_path / "offline")) is True
+    index = tmp_path / "offline" / "node_modules" / "app" / "index.js"
+    assert index.read_text() == "// app\n"
+
+    # A missing tarball fails with the same message as the npm installer
+    for path in (tmp_path / "cache" / "npm" / "_cacache" / "content-v2").rglob("*"):
+        if path.is_file():
+            path.unlink()
+    with mock.patch("builtins.print") as mock_print:
+        assert install_from_registry(args, str(tmp_path / "missing")) is False
+    messages = " ".join(str(call.args[0]) for call in mock_print.call_args_list)
+    assert "is missing from the cache" in messages
+
+
+def test_extract_stream_rejects_unsafe_paths(tmp_path):
+    """Test tarball members cannot escape the package directory"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        info = tarfile.TarInfo("package/../../evil.js")
+        tar.addfile(info, io.BytesIO(b""))
+    buffer.seek(0)
+
+    with pytest.raises(ValueError):
+        registry.extract_stream(buffer, str(tmp_path / "pkg"))
+
+
+def _lockfile_entry(fake_registry, name, version, **fields):
+    """Build a lockfile entry pointing at a tarball of the fake registry"""
+    tarball_path = f"/{name}/-/{name}-{version}.tgz"
+    entry = {
+        "version": version,
+        "resolved": fake_registry.url + tarball_path,
+        "integrity": integrity_of(fake_registry.routes[tarball_path]),
+    }
+    entry.update(fields)
+    return entry
+
+
+def test_install_from_lockfile(fake_registry, tmp_path):
+    """Test a lockfile is materialized exactly, without resolving anything"""
+    lockfile = tmp_path / "package-lock.json"
+    lockfile.write_text(json.dumps({
+        "lockfileVersion": 3,
+        "packages": {
+            "": {"dependencies": {"app": "1.0.0"}},
+            # Not the versions the registry would resolve to
+            "node_modules/app": _lockfile_entry(fake_registry, "app", "1.0.0",
+                                                bin={"app": "bin/app"}),
+            "node_modules/lib": _lockfile_entry(fake_registry, "lib", "1.0.0"),
+            "node_modules/dep": _lockfile_entry(fake_registry, "dep", "2.0.1"),
+            "node_modules/app/node_modules/dep": _lockfile_entry(fake_registry, "dep", "1.4.0"),
+            "node_modules/lib/node_modules/dev-only": {"version": "1.0.0", "dev": True},
+        },
+    }))
+    args = SimpleNamespace(name="app", version="1.0.0", source="npm", lockfile=str(lockfile),
+                           cache_dir=str(tmp_path / "cache"), _is_test=False)
+    install_path = tmp_path / "out"
+
+    with mock.patch.object(registry, "fetch_packument") as mock_fetch:
+        with mock.patch("builtins.print"):
+            assert install_node_package(args, str(install_path)) is True
+
+    mock_fetch.assert_not_called()
+    modules = install_path / "node_modules"
+    assert json.loads((modules / "lib" / "package.json").read_text())["version"] == "1.0.0"
+    assert json.loads((modules / "dep" / "package.json").read_text())["version"] == "2.0.1"
+    nested = modules / "app" / "node_modules" / "dep" / "package.json"
+    assert json.loads(nested.read_text())["version"] == "1.4.0"
+    assert not (modules / "lib" / "node_modules").exists()
+    assert (install_path / "bin" / "app").exists()
+
+    # The lockfile has to pin the requested version
+    args.version = "2.0.0"
+    with mock.patch("builtins.print"):
+        assert install_from_lockfile(args, str(tmp_path / "other")) is False
+
+
+def test_install_from_lockfile_offline(fake_registry, tmp_path):
+    """Test lockfile installs reuse cached tarballs and never fetch them offline"""
+    lockfile = tmp_path / "package-lock.json"
+    lockfile.write_text(json.dumps({"packages": {
+        "": {"dependencies": {"dep": "1.4.0"}},
+        "node_modules/dep": _lockfile_entry(fake_registry, "dep", "1.4.0"),
+    }}))
+    args = SimpleNamespace(name="dep", version="1.4.0", lockfile=str(lockfile),
+                           cache_dir=str(tmp_path / "cache"), offline=True)
+
+    # Nothing is cached yet
+    with mock.patch("builtins.print") as mock_print:
+        assert install_from_lockfile(args, str(tmp_path / "missing")) is False
+    messages = " ".join(str(call.args[0]) for call in mock_print.call_args_list)
+    assert "is missing from the cache" in messages
+
+    args.offline = False
+    with mock.patch("builtins.print"):
+        assert install_from_lockfile(args, str(tmp_path / "online")) is True
+
+    fake_registry.routes.clear()
+    args.offline = True
+    with mock.patch("builtins.print"):
+        assert install_from_lockfile(args, str(tmp_path / "offline")) is True
+    assert (tmp_path / "offline" / "node_modules" / "dep" / "index.js").exists()
+
+
+def test_lockfile_tree_registry_override():
+    """Test resolved URLs are redirected to a mirror registry"""
+    lockfile = {"packages": {
+        "": {},
+        "node_modules/@scope/pkg": {
+            "version": "1.0.0",
+            "resolved": "https://registry.npmjs.org/@scope/pkg/-/pkg-1.0.0.tgz",
+        },
+    }}
+    tree = registry.lockfile_tree(lockfile, registry_url="http://mirror.local/npm/")
+    manifest = tree["node_modules/@scope/pkg"]
+    assert manifest["name"] == "@scope/pkg"
+    assert manifest["dist"]["tarball"] == "http://mirror.local/npm/@scope/pkg/-/pkg-1.0.0.tgz"
+
+    lockfile["packages"]["node_modules/git-dep"] = {"resolved": "git+ssh://host/repo.git"}
+    with pytest.raises(ValueError):
+        registry.lockfile_tree(lockfile)
+
+
+def test_lockfile_tree_skips_other_platforms():
+    """Test optional packages for other platforms and dev packages are skipped"""
+    def entry(name, **fields):
+        return dict(fields, version="1.0.0",
+                    resolved=f"https://registry.npmjs.org/{name}/-/{name}-1.0.0.tgz")
+
+    lockfile = {"packages": {
+        "": {},
+        "node_modules/app": entry("app"),
+        "node_modules/native-other": entry("native-other", optional=True, os=["aix"]),
+        "node_modules/native-any": entry("native-any", optional=True),
+        "node_modules/linter": entry("linter", dev=True),
+    }}
+    tree = registry.lockfile_tree(lockfile, target="node_modules/app")
+    assert sorted(tree) == ["node_modules/app", "node_modules/native-any"]
+
+    with pytest.raises(ValueError, match="dev-only"):
+        registry.lockfile_tree(lockfile, target="node_modules/linter")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+Test the repository index of npm2rez package
+"""
+
+import json
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+from click.testing import CliRunner
+
+from npm2rez.cli import cli
+from npm2rez.core import create_package
+from npm2rez.repoindex import find_packages, get_index_path, has_package, record_package, rescan
+from npm2rez.stamp import write_stamp
+
+
+def _make_package(output, name, rez_name, version, stamped=True):
+    """Write a published package version directory"""
+    package_dir = output / rez_name / version
+    (package_dir / "node_modules" / name).mkdir(parents=True)
+    (package_dir / "package.py").write_text(f'name = "{rez_name}"\n')
+    (package_dir / "node_modules" / name / "index.js").write_text("module.exports = 1;\n")
+    if stamped:
+        write_stamp(str(package_dir), SimpleNamespace(name=name, version=version))
+    return str(package_dir)
+
+
+def test_record_and_find_packages(tmp_path):
+    """Test recorded packages are found by npm name, rez name and version"""
+    for version in ["4.10.0", "4.9.5", "5.0.2"]:
+        record_package(_make_package(tmp_path, "type-script", "type_script", version))
+    record_package(_make_package(tmp_path, "eslint", "eslint", "8.0.0"))
+
+    versions = [package["version"] for package in find_packages(str(tmp_path), "type-script")]
+    # Versions are sorted semantically, not as text
+    assert versions == ["4.9.5", "4.10.0", "5.0.2"]
+    assert [package["version"] for package in find_packages(str(tmp_path), "type_script")] \
+        == versions
+
+    package = find_packages(str(tmp_path), "eslint", "8.0.0")[0]
+    assert package["rez_name"] == "eslint"
+    assert package["source"] == "npm"
+    assert package["files"] == 3
+    assert package["payload_bytes"] > 0
+    assert has_package(str(tmp_path), "eslint", "8.0.0")
+    assert not has_package(str(tmp_path), "eslint", "9.0.0")
+
+
+def test_rescan_rebuilds_index_from_disk(tmp_path):
+    """Test rescan indexes stamped versions only and forgets removed ones"""
+    _make_package(tmp_path, "typescript", "typescript", "4.9.5")
+    _make_package(tmp_path, "typescript", "typescript", "5.0.2", stamped=False)
+    _make_package(tmp_path, "eslint", "eslint", "8.0.0")
+    (tmp_path / "typescript" / ".build-5.1.0-abc").mkdir()
+    record_package(_make_package(tmp_path, "gone", "gone", "1.0.0"))
+    os.rename(tmp_path / "gone", tmp_path / ".trash-gone")
+
+    assert rescan(str(tmp_path), jobs=2) == 2
+    assert [(package["rez_name"], package["version"]) for package in find_packages(
+        str(tmp_path))] == [("eslint", "8.0.0"), ("typescript", "4.9.5")]
+
+
+def test_create_package_records_index(tmp_path):
+    """Test create_package indexes the package it publishes"""
+    args = SimpleNamespace(name="typescript", version="4.9.5", output=str(tmp_path),
+                           source="npm", repo=None, node_version="16", _is_test=True)
+
+    def install(args, install_path):
+        os.makedirs(os.path.join(install_path, "node_modules", "typescript"))
+        return True
+
+    with mock.patch("npm2rez.core.install_node_package", side_effect=install), \
+            mock.patch("builtins.print"):
+        create_package(args)
+
+    assert os.path.exists(get_index_path(str(tmp_path)))
+    assert has_package(str(tmp_path), "typescript", "4.9.5")
+
+
+def test_index_command(tmp_path):
+    """Test the index command rescans, lists and reports missing packages"""
+    _make_package(tmp_path, "typescript", "typescript", "4.9.5")
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["index", "--output", str(tmp_path), "--rescan", "--json",
+                                 "--name", "typescript"], standalone_mode=False)
+    assert result.return_value == 0
+    packages = json.loads(result.stdout)
+    assert [package["version"] for package in packages] == ["4.9.5"]
+
+    result = runner.invoke(cli, ["index", "--output", str(tmp_path), "--name", "typescript",
+                                 "--version", "5.0.2"])
+    assert result.exit_code == 1
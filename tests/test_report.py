@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+Test timing reports for npm2rez package
+"""
+
+import json
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from click.testing import CliRunner
+
+from npm2rez.cli import cli
+from npm2rez.report import collect, phase, run_in_context
+
+
+def test_collect_nested_phases():
+    """Test phases nest, carry counters and are summed up by name"""
+    def copy(files):
+        with phase("copy") as record:
+            record["files"] = files
+
+    with collect(command="test") as report:
+        with phase("install", source="npm"):
+            copy(3)
+            # Worker threads only report when bound to the current report
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                executor.submit(run_in_context(copy, 4)).result()
+                executor.submit(copy, 100).result()
+        try:
+            with phase("build"):
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+    assert report["command"] == "test"
+    install, build = report["phases"]
+    assert install["source"] == "npm"
+    assert [child["files"] for child in install["phases"]] == [3, 4]
+    assert build["error"] == "boom"
+    assert report["totals"]["copy"]["count"] == 2
+    assert report["totals"]["copy"]["files"] == 7
+    assert report["duration"] >= install["duration"]
+
+    # Outside of collect phases record nothing
+    with phase("copy") as record:
+        pass
+    assert "duration" not in record
+
+
+def test_create_report_and_profile(tmp_path):
+    """Test create --report and --profile"""
+    report_path = tmp_path / "report.json"
+    profile_path = tmp_path / "create.prof"
+
+    with mock.patch("shutil.which", return_value="/usr/bin/npm"):
+        with mock.patch("subprocess.check_call"):
+            result = CliRunner().invoke(cli, [
+                "create", "--name", "typescript", "--version", "4.9.5",
+                "--output", str(tmp_path / "out"),
+                "--report", str(report_path), "--profile", str(profile_path),
+            ])
+
+    assert result.exit_code == 0, result.output
+    report = json.loads(report_path.read_text())
+    assert report["command"] == "create"
+    assert report["package"] == "typescript@4.9.5"
+    assert report["success"] is True
+    (create,) = report["phases"]
+    assert [child["name"] for child in create["phases"]] == ["package_py", "install", "publish"]
+    assert {"toolchain_probe", "npm_install", "cleanup"} <= set(report["totals"])
+    assert pstats.Stats(str(profile_path)).total_calls > 0
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""
+Test npm version ranges for npm2rez package
+"""
+
+import pytest
+
+from npm2rez.semver import max_satisfying, parse_range, parse_version, satisfies, version_key
+
+
+def test_parse_version():
+    """Test parsing exact versions"""
+    assert parse_version("1.2.3") == (1, 2, 3, ())
+    assert parse_version("v2.0.0-beta.1+build.5") == (2, 0, 0, ("beta", 1))
+    assert parse_version("1.2") is None
+
+
+def test_version_key_orders_prereleases():
+    """Test prereleases sort before their release"""
+    versions = ["1.0.0", "1.0.0-rc.10", "1.0.0-rc.2", "1.0.0-alpha", "0.9.9"]
+    assert sorted(versions, key=version_key) == [
+        "0.9.9", "1.0.0-alpha", "1.0.0-rc.2", "1.0.0-rc.10", "1.0.0"
+    ]
+
+
+@pytest.mark.parametrize("version, range_text, expected", [
+    ("4.9.5", "^4.9", True),
+    ("5.0.0", "^4.9", False),
+    ("0.2.5", "^0.2.3", True),
+    ("0.3.0", "^0.2.3", False),
+    ("0.0.4", "^0.0.3", False),
+    ("5.0.3", "~5.0.2", True),
+    ("5.1.0", "~5.0.2", False),
+    ("3.5.0", ">=3 <4", True),
+    ("4.0.0", ">=3 <4", False),
+    ("1.0.0", ">= 1.0.0", True),
+    ("1.5.0", "1.x", True),
+    ("2.0.0", "1.x", False),
+    ("1.2.9", "<=1.2", True),
+    ("1.2.9", ">1.2", False),
+    ("2.3.4", "1.2 - 2.3.4", True),
+    ("2.3.5", "1.2 - 2.3.4", False),
+    ("5.0.0", "^4 || ^5", True),
+    ("1.2.3", "*", True),
+    ("1.2.3", "", True),
+    ("2.0.0-beta.1", "^2.0.0-beta.0", True),
+    ("2.0.0-beta.1", "^1.0.0", False),
+    ("2.1.0-beta.1", ">=2.0.0", False),
+])
+def test_satisfies(version, range_text, expected):
+    """Test range matching"""
+    assert satisfies(version, range_text) is expected
+
+
+def test_parse_range_invalid():
+    """Test invalid ranges"""
+    with pytest.raises(ValueError):
+        parse_range("not-a-range")
+    assert satisfies("1.0.0", "not-a-range") is False
+
+
+def test_max_satisfying():
+    """Test picking the highest matching version"""
+    versions = ["1.0.0", "1.2.0", "1.3.0-rc.1", "2.0.0"]
+    assert max_satisfying(versions, "^1") == "1.2.0"
+    assert max_satisfying(versions, "^3") is None
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Test the daemon mode of npm2rez package
+"""
+
+import json
+import os
+import socketserver
+import threading
+from http.client import HTTPConnection
+from unittest import mock
+
+import pytest
+
+from npm2rez.server import UnixHTTPServer, make_server, submit
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start a daemon in a thread and return a function to talk to it"""
+    servers = []
+
+    def start(**kwargs):
+        with mock.patch("npm2rez.server.get_npm_executable", return_value="/usr/bin/npm"):
+            server = make_server(defaults={"output": str(tmp_path / "out"),
+                                           "cache_dir": str(tmp_path / "cache")},
+                                 quiet=True, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_unix_socket_created_private(tmp_path):
+    """Test the socket is never accessible to other users, even right after bind"""
+    bind = socketserver.UnixStreamServer.server_bind
+    modes = []
+
+    def checked_bind(server):
+        bind(server)
+        modes.append(os.stat(server.server_address).st_mode & 0o777)
+
+    umask = os.umask(0o022)
+    try:
+        with mock.patch.object(socketserver.UnixStreamServer, "server_bind", checked_bind):
+            server = UnixHTTPServer(str(tmp_path / "npm2rez.sock"), None)
+        server.server_close()
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    assert modes and modes[0] & 0o077 == 0
+
+
+def _install(args, install_path):
+    os.makedirs(os.path.join(install_path, "node_modules", args.name))
+    return True
+
+
+def test_serve_create_jobs(tmp_path, serve):
+    """Test create jobs over a Unix socket, reusing packages already built"""
+    socket_path = str(tmp_path / "npm2rez.sock")
+    serve(socket_path=socket_path)
+    assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+
+    with mock.patch("npm2rez.core.install_node_package", side_effect=_install) as install, \
+            mock.patch("builtins.print"):
+        status, result = submit(socket_path, "create", {"name": "typescript",
+                                                        "version": "4.9.5"})
+        assert status == 200, result
+        assert result["package_dir"] == str(tmp_path / "out" / "typescript" / "4.9.5")
+        assert os.path.isdir(result["package_dir"])
+        assert result["report"]["package"] == "typescript@4.9.5"
+
+        # The second job finds the package up to date
+        status, result = submit(socket_path, "create", {"name": "typescript",
+                                                        "version": "4.9.5"})
+        assert status == 200
+        assert install.call_count == 1
+
+    # Jobs share the npm probed at startup
+    assert install.call_args[0][0].npm == "/usr/bin/npm"
+
+    status, packages = submit(socket_path, "packages", {"name": "typescript"})
+    assert status == 200
+    assert [package["version"] for package in packages] == ["4.9.5"]
+
+    status, server_status = submit(socket_path, "status")
+    assert server_status["jobs"] == 2
+    assert server_status["failed"] == 0
+
+
+def test_serve_rejects_invalid_jobs(serve):
+    """Test invalid jobs fail without stopping the daemon, over TCP"""
+    server = serve(port=0)
+    address = f"127.0.0.1:{server.server_address[1]}"
+
+    status, result = submit(address, "create", {"name": "typescript", "_is_test": True})
+    assert status == 422
+    assert "Unknown job options: _is_test" in result["error"]
+
+    status, result = submit(address, "create", {"name": "tool", "version": "1.0.0",
+                                                "source": "github"})
+    assert status == 422
+    assert "repo is required" in result["error"]
+
+    status, server_status = submit(address, "status")
+    assert status == 200
+    assert server_status["failed"] == 2
+
+
+def test_serve_rejects_cross_site_requests(serve):
+    """Test requests a browser page could send are refused"""
+    server = serve(port=0)
+    port = server.server_address[1]
+
+    def request(method, path, body=None, headers=None):
+        connection = HTTPConnection("127.0.0.1", port, timeout=10)
+        try:
+            connection.request(method, path, body, headers or {})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    job = json.dumps({"name": "typescript", "version": "4.9.5"})
+    # A simple form post needs no preflight, so only JSON is accepted
+    status, result = request("POST", "/create", job,
+                             {"Content-Type": "application/x-www-form-urlencoded"})
+    assert status == 415
+    status, _ = request("POST", "/create", job, {"Content-Type": "text/plain"})
+    assert status == 415
+
+    # A rebound DNS name still shows up in the Host header
+    status, result = request("POST", "/create", job, {
+        "Content-Type": "application/json", "Host": f"evil.example:{port}"
+    })
+    assert status == 403
+    assert "Host not allowed" in result["error"]
+    status, _ = request("GET", "/status", headers={"Host": "evil.example"})
+    assert status == 403
+    for host in (f"localhost:{port}", f"[::1]:{port}", "127.0.0.1"):
+        status, _ = request("GET", "/status", headers={"Host": host})
+        assert status == 200, host
+
+    # Nothing ran
+    assert server.state.jobs == 0
+
+
+def test_serve_extract_requires_output(tmp_path, serve):
+    """Test extract jobs never fall back to the rez repository"""
+    socket_path = str(tmp_path / "npm2rez.sock")
+    serve(socket_path=socket_path)
+
+    status, result = submit(socket_path, "extract", {"name": "typescript", "version": "4.9.5"})
+    assert status == 422
+    assert "Missing job option: output" in result["error"]
+
+    output = str(tmp_path / "extracted")
+    with mock.patch("npm2rez.core.install_node_package", return_value=True), \
+            mock.patch("builtins.print"):
+        status, result = submit(socket_path, "extract", {"name": "typescript",
+                                                         "version": "4.9.5", "output": output})
+    assert status == 200, result
+    assert result["output"] == output
+    assert not (tmp_path / "out").exists()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Test content-addressed store for npm2rez package
+"""
+
+import errno
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+from npm2rez import store
+from npm2rez.fastcopy import transfer_node_modules
+
+
+def _make_tree(root, version):
+    """Create a node_modules tree whose dependency is shared between versions"""
+    (root / "typescript" / "bin").mkdir(parents=True)
+    (root / "typescript" / "bin" / "tsc").write_text("#!/usr/bin/env node\n")
+    (root / "typescript" / "bin" / "tsc").chmod(0o755)
+    (root / "typescript" / "package.json").write_text(f'{{"version": "{version}"}}')
+    (root / "dep").mkdir()
+    (root / "dep" / "index.js").write_text("module.exports = 1;\n")
+    # Same content as the binary, but not executable
+    (root / "dep" / "cli.js").write_text("#!/usr/bin/env node\n")
+    (root / "dep" / "cli.js").chmod(0o644)
+
+
+def test_get_copy_function():
+    """Test the store is only used when configured"""
+    assert store.get_copy_function(SimpleNamespace()) is None
+    assert store.get_copy_function(SimpleNamespace(store=None)) is None
+    assert store.get_copy_function(SimpleNamespace(store="~/store")) is not None
+
+
+def test_node_modules_are_hardlinked(tmp_path):
+    """Test identical files of two packages share one store entry"""
+    store_dir = str(tmp_path / "store")
+    copy_function = store.get_copy_function(SimpleNamespace(store=store_dir))
+
+    packages = []
+    for version in ("4.9.5", "5.0.2"):
+        src = tmp_path / "src" / version
+        _make_tree(src, version)
+        dst = tmp_path / "typescript" / version / "node_modules"
+        stats = transfer_node_modules(str(src), str(dst), move=True, copy_function=copy_function)
+        assert stats.files == 4
+        packages.append(dst)
+
+    first, second = packages
+    shared = os.stat(first / "dep" / "index.js")
+    assert shared.st_ino == os.stat(second / "dep" / "index.js").st_ino
+    assert shared.st_nlink == 3
+    assert os.stat(first / "typescript" / "package.json").st_ino != os.stat(
+        second / "typescript" / "package.json").st_ino
+
+    # The executable bit is part of the key
+    tsc = os.stat(first / "typescript" / "bin" / "tsc")
+    assert tsc.st_ino != os.stat(first / "dep" / "cli.js").st_ino
+    assert os.access(first / "typescript" / "bin" / "tsc", os.X_OK)
+    assert not os.access(first / "dep" / "cli.js", os.X_OK)
+
+    # 2 shared files, 2 package.json versions and the executable
+    entries = [name for _, _, names in os.walk(store_dir) for name in names]
+    assert len(entries) == 5
+
+
+def test_link_file_falls_back_to_copy(tmp_path):
+    """Test files are copied when the store is on another filesystem"""
+    src = tmp_path / "index.js"
+    src.write_text("module.exports = 1;\n")
+    dst = tmp_path / "out.js"
+
+    with mock.patch("os.link", side_effect=OSError(errno.EXDEV, "cross-device link")):
+        assert store.link_file(str(tmp_path / "store"), str(src), str(dst)) == src.stat().st_size
+
+    assert dst.read_text() == "module.exports = 1;\n"
+    assert os.stat(dst).st_nlink == 1